@@ -0,0 +1,140 @@
+# Запись журнала действий (AuditLog) без вставки на каждое событие.
+#
+# record() кладёт запись в буфер процесса, а фоновый поток пишет буфер
+# одним bulk_create: раз в ANALYTICS_AUDIT_FLUSH_INTERVAL секунд или
+# сразу, когда в буфере набралось ANALYTICS_AUDIT_BATCH_SIZE записей.
+# Остаток дописывается при завершении процесса (atexit). Время события
+# берётся в момент record(), а не записи в БД.
+#
+# ANALYTICS_AUDIT_SYNC = True — запись сразу в текущем запросе (тесты,
+# отладка, окружения без долгоживущих процессов).
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, close_old_connections
+from django.utils import timezone
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._buffer = []
+        self._thread = None
+        self._pid = None
+
+    @property
+    def batch_size(self):
+        return getattr(settings, "ANALYTICS_AUDIT_BATCH_SIZE", 500)
+
+    @property
+    def interval(self):
+        return getattr(settings, "ANALYTICS_AUDIT_FLUSH_INTERVAL", 2.0)
+
+    @property
+    def max_buffered(self):
+        return getattr(settings, "ANALYTICS_AUDIT_MAX_BUFFERED", 50000)
+
+    def record(self, entry):
+        if getattr(settings, "ANALYTICS_AUDIT_SYNC", False):
+            entry.save()
+            return
+        with self._lock:
+            self._start()
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _start(self):
+        # после fork (gunicorn --preload) поток родителя в процессе не существует
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._buffer = []
+            self._thread = None
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # поток не должен умирать: иначе буфер растёт без записи
+                logger.exception("Сбой фоновой записи журнала действий")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        if not entries:
+            return 0
+        try:
+            AuditLog.objects.bulk_create(entries, batch_size=self.batch_size)
+            return len(entries)
+        except Exception:
+            logger.warning("Пачка журнала действий не записалась, пишем построчно", exc_info=True)
+
+        # построчно, чтобы одна плохая запись не держала остальные
+        written = 0
+        for i, entry in enumerate(entries):
+            try:
+                self._write_one(entry)
+            except OperationalError:
+                # например, SQLite занят импортом: вернуть записи и повторить позже
+                logger.exception("Не удалось записать журнал действий (%s записей)", len(entries) - i)
+                self._requeue(entries[i:])
+                return written
+            except Exception:
+                logger.exception("Запись журнала действий отброшена: %s %s", entry.action, entry.details)
+                continue
+            written += 1
+        return written
+
+    def _write_one(self, entry):
+        try:
+            AuditLog.objects.bulk_create([entry])
+        except (IntegrityError, ValueError):
+            if entry.user is None:
+                raise
+            # пользователя удалили, пока запись ждала в буфере: как SET_NULL
+            entry.user = None
+            AuditLog.objects.bulk_create([entry])
+
+    def _requeue(self, entries):
+        # вернуть записи в начало буфера, но не копить без предела
+        with self._lock:
+            self._buffer[:0] = entries
+            dropped = len(self._buffer) - self.max_buffered
+            if dropped > 0:
+                del self._buffer[:dropped]
+                logger.error("Журнал действий: отброшено %s самых старых записей", dropped)
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+
+writer = AuditWriter()
+atexit.register(writer.flush)
+
+
+def record(user, action, details=""):
+    if user is not None and not user.is_authenticated:
+        user = None
+    writer.record(AuditLog(user=user, action=action, details=details, created_at=timezone.now()))
+
+
+def flush():
+    return writer.flush()
@@ -0,0 +1,97 @@
+# Полнотекстовый поиск по журналу действий на SQLite FTS5.
+#
+# Таблица analytics_auditlog_fts (токенизатор trigram — поиск подстроки
+# без учёта регистра, как icontains) хранит details каждой записи AuditLog
+# под тем же rowid. Синхронизацию ведут триггеры на analytics_auditlog,
+# поэтому она работает и для bulk_create из analytics/audit.py. Имя
+# пользователя ищется при запросе, по таблице пользователей.
+#
+# Таблицу и триггеры создаёт миграция 0014_auditlog_search_index.
+# SQLite, пересоздавая таблицу (AlterField, AddField и т.п.), удаляет её
+# триггеры, поэтому миграция, меняющая AuditLog, оборачивает свои операции:
+#     migrations.RunPython(migrations.RunPython.noop, audit_search.restore_triggers),
+#     ...операции над AuditLog...
+#     migrations.RunPython(audit_search.restore_triggers, migrations.RunPython.noop),
+# На других СУБД, на SQLite без FTS5 и для запросов короче трёх символов
+# поиск идёт через icontains.
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+AUDIT_TABLE = "analytics_auditlog"
+FTS_TABLE = "analytics_auditlog_fts"
+# короче триграммы FTS5 ничего не находит
+MIN_QUERY_LENGTH = 3
+
+TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {AUDIT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, details) VALUES (new.id, new.details);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {AUDIT_TABLE} BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF details ON {AUDIT_TABLE} BEGIN
+        UPDATE {FTS_TABLE} SET details = new.details WHERE rowid = new.id;
+    END""",
+]
+TRIGGER_NAMES = [f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"]
+
+_available = {}
+
+
+def _has_index(connection):
+    with connection.cursor() as cursor:
+        return FTS_TABLE in connection.introspection.table_names(cursor)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    _available.pop(connection.alias, None)
+    if connection.vendor != "sqlite" or _has_index(connection):
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute(f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(details, tokenize="trigram")')
+    except OperationalError:
+        # SQLite без FTS5 или без токенизатора trigram (старше 3.34)
+        return
+    restore_triggers(apps, schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    _available.pop(connection.alias, None)
+    if connection.vendor != "sqlite":
+        return
+    for name in TRIGGER_NAMES:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def restore_triggers(apps, schema_editor):
+    # заполняет индекс из таблицы целиком и создаёт триггеры
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite" or not _has_index(connection):
+        return
+    schema_editor.execute(f"DELETE FROM {FTS_TABLE}")
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}(rowid, details) SELECT id, details FROM {AUDIT_TABLE}")
+    for statement in TRIGGERS:
+        schema_editor.execute(statement)
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    if using not in _available:
+        connection = connections[using]
+        _available[using] = connection.vendor == "sqlite" and _has_index(connection)
+    return _available[using]
+
+
+def search(qs, q):
+    # записи AuditLog, у которых q входит в details или в имя пользователя
+    users = get_user_model().objects.filter(username__icontains=q).values("id")
+    if len(q) >= MIN_QUERY_LENGTH and is_available(qs.db):
+        phrase = '"' + q.replace('"', '""') + '"'
+        matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [phrase])
+        return qs.filter(Q(id__in=matches) | Q(user_id__in=users))
+    return qs.filter(Q(details__icontains=q) | Q(user_id__in=users))
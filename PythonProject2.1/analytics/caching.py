@@ -0,0 +1,62 @@
+# Кэш посчитанных агрегатов (dashboard, api_summary, export_pdf).
+# Ключ = вид агрегата + фильтры + область видимости преподавателя +
+# поколение данных DataVersion: после импорта или правки Result старые
+# ключи просто перестают запрашиваться и вытесняются бэкендом кэша
+# (по умолчанию LocMemCache с ограничением MAX_ENTRIES, см. settings.CACHES).
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import DataVersion
+
+# счётчики попаданий/промахов текущего процесса: вид агрегата -> число
+hits = Counter()
+misses = Counter()
+
+_MISSING = object()
+
+
+def get_cache():
+    return caches[getattr(settings, "ANALYTICS_CACHE_ALIAS", "analytics")]
+
+
+def data_version(request):
+    # одна выборка DataVersion на запрос
+    if not hasattr(request, "_data_version"):
+        request._data_version = DataVersion.current()
+    return request._data_version
+
+
+def cache_key(kind, version, scope):
+    # время изменения в ключе защищает от повтора номера поколения,
+    # например после восстановления базы из резервной копии
+    digest = hashlib.md5(repr(scope).encode("utf-8")).hexdigest()
+    return f"analytics:{kind}:{version.generation}:{version.updated_at.timestamp()}:{digest}"
+
+
+def cached(kind, request, scope, compute):
+    key = cache_key(kind, data_version(request), scope)
+    cache = get_cache()
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        misses[kind] += 1
+        value = compute()
+        cache.set(key, value)
+    else:
+        hits[kind] += 1
+    return value
+
+
+def cache_stats():
+    kinds = sorted(hits.keys() | misses.keys())
+    total_hits = sum(hits.values())
+    total_misses = sum(misses.values())
+    total = total_hits + total_misses
+    return {
+        "hits": total_hits,
+        "misses": total_misses,
+        "hit_ratio": round(total_hits / total, 4) if total else None,
+        "by_kind": {kind: {"hits": hits[kind], "misses": misses[kind]} for kind in kinds},
+    }
@@ -0,0 +1,284 @@
+# Необязательный колоночный движок агрегатов на NumPy.
+#
+# Снимок Result хранится в ANALYTICS_COLUMNAR_DIR как набор .npy-файлов
+# (по одному на колонку: int32 id, float32 оценка/посещаемость), которые
+# открываются через mmap. Снимок привязан к поколению DataVersion и
+# пересобирается обработчиком очереди импорта (run_import_worker), когда
+# очередь пуста, или командой build_columnar_snapshot; устаревший снимок
+# не используется — тогда агрегаты считаются через ORM.
+import json
+import os
+import shutil
+from array import array
+
+from django.conf import settings
+
+from .models import DataVersion, Discipline, Group, Result, Teacher
+
+try:
+    import numpy as np
+except ImportError:  # numpy — необязательная зависимость
+    np = None
+
+COLUMNS = {
+    "student": "i",
+    "group": "i",
+    "discipline": "i",
+    "teacher": "i",
+    "semester": "i",
+    "year": "i",
+    "grade": "f",
+    "attendance": "f",
+}
+# у результата без преподавателя в колонке teacher
+NO_TEACHER = -1
+META_FILE = "current.json"
+
+_loaded = None
+
+
+def is_available():
+    return np is not None
+
+
+def is_enabled():
+    return getattr(settings, "ANALYTICS_ENGINE", "orm") == "columnar" and is_available()
+
+
+def snapshot_dir():
+    return str(getattr(settings, "ANALYTICS_COLUMNAR_DIR", os.path.join(settings.BASE_DIR, "var", "columnar")))
+
+
+def build_snapshot(generation, chunk_size=20000):
+    if np is None:
+        raise RuntimeError("Для колоночного движка нужен numpy")
+
+    columns = {name: array(code) for name, code in COLUMNS.items()}
+    qs = Result.objects.values_list(
+        "student_id", "student__group_id", "discipline_id", "teacher_id", "semester_id", "semester__year",
+        "grade", "attendance_percent",
+    ).order_by()
+    for student, group, discipline, teacher, semester, year, grade, attendance in qs.iterator(chunk_size=chunk_size):
+        columns["student"].append(student)
+        columns["group"].append(group)
+        columns["discipline"].append(discipline)
+        columns["teacher"].append(NO_TEACHER if teacher is None else teacher)
+        columns["semester"].append(semester)
+        columns["year"].append(year)
+        columns["grade"].append(grade)
+        columns["attendance"].append(attendance)
+
+    base = snapshot_dir()
+    target = os.path.join(base, f"gen-{generation}")
+    os.makedirs(target, exist_ok=True)
+    for name, values in columns.items():
+        dtype = np.int32 if COLUMNS[name] == "i" else np.float32
+        np.save(os.path.join(target, f"{name}.npy"), np.frombuffer(values, dtype=dtype))
+
+    meta = {
+        "generation": generation,
+        "path": os.path.basename(target),
+        "rows": len(columns["grade"]),
+        "groups": dict(Group.objects.values_list("id", "name")),
+        "disciplines": dict(Discipline.objects.values_list("id", "name")),
+        "discipline_departments": dict(Discipline.objects.values_list("id", "department")),
+        "teachers": {
+            pk: [full_name, department]
+            for pk, full_name, department in Teacher.objects.values_list("id", "full_name", "department")
+        },
+    }
+    # указатель на текущий снимок меняем атомарно, затем удаляем старые
+    tmp = os.path.join(base, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(base, META_FILE))
+    for entry in os.listdir(base):
+        if entry.startswith("gen-") and entry != meta["path"]:
+            shutil.rmtree(os.path.join(base, entry), ignore_errors=True)
+    return meta["rows"]
+
+
+def current_generation():
+    # поколение снимка на диске или None, если снимка нет
+    try:
+        with open(os.path.join(snapshot_dir(), META_FILE), encoding="utf-8") as f:
+            return json.load(f)["generation"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def refresh_snapshot():
+    # пересобирает снимок, если он отстал от DataVersion; True — если пересобран
+    generation = DataVersion.current().generation
+    if current_generation() == generation:
+        return False
+    build_snapshot(generation)
+    return True
+
+
+def load_snapshot(generation):
+    # снимок для указанного поколения или None, если его нет или он устарел
+    global _loaded
+    if np is None:
+        return None
+    if _loaded is not None and _loaded.generation == generation:
+        return _loaded
+
+    base = snapshot_dir()
+    try:
+        with open(os.path.join(base, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta["generation"] != generation:
+        return None
+    try:
+        _loaded = Snapshot(os.path.join(base, meta["path"]), meta)
+    except (OSError, KeyError):
+        # в снимке прежнего формата нет части справочников
+        return None
+    return _loaded
+
+
+class Snapshot:
+    def __init__(self, path, meta):
+        self.generation = meta["generation"]
+        self.rows = meta["rows"]
+        # ключи JSON — строки
+        self.group_names = {int(k): v for k, v in meta["groups"].items()}
+        self.discipline_names = {int(k): v for k, v in meta["disciplines"].items()}
+        self.discipline_departments = {int(k): v for k, v in meta["discipline_departments"].items()}
+        # id -> [ФИО, кафедра]
+        self.teachers = {int(k): v for k, v in meta["teachers"].items()}
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def mask(self, scope, department=None):
+        # scope — кортеж из views.request_scope; department — кафедра дисциплины
+        semester_id, discipline_id, teacher_id, own_teacher_id = scope
+        mask = np.ones(self.rows, dtype=bool)
+        if own_teacher_id:
+            mask &= self.teacher == own_teacher_id
+        if semester_id:
+            mask &= self.semester == semester_id
+        if discipline_id:
+            mask &= self.discipline == discipline_id
+        if teacher_id:
+            mask &= self.teacher == teacher_id
+        if department is not None:
+            ids = [i for i, name in self.discipline_departments.items() if name == department]
+            mask &= np.isin(self.discipline, ids)
+        return mask
+
+    def _by(self, keys, grades):
+        # id -> (число оценок, средний балл) для ключей, встречающихся в выборке
+        if not keys.size:
+            return []
+        counts = np.bincount(keys)
+        sums = np.bincount(keys, weights=grades)
+        ids = np.flatnonzero(counts)
+        return [(int(i), int(counts[i]), float(sums[i] / counts[i])) for i in ids]
+
+    def _totals(self, keys, mask):
+        # id -> (число оценок, средний балл, средняя посещаемость) по выборке,
+        # в формате stats._rollup_averages
+        keys = keys[mask]
+        if not keys.size:
+            return []
+        counts = np.bincount(keys)
+        grades = np.bincount(keys, weights=self.grade[mask].astype(np.float64))
+        attendance = np.bincount(keys, weights=self.attendance[mask].astype(np.float64))
+        return [
+            (int(i), {
+                "count": int(counts[i]),
+                "avg_grade": float(grades[i] / counts[i]),
+                "avg_attendance": float(attendance[i] / counts[i]),
+            })
+            for i in np.flatnonzero(counts)
+        ]
+
+    def teacher_stats(self, scope, department=None):
+        # тот же формат, что у stats.teacher_stats: по ФИО, без результатов без преподавателя
+        mask = self.mask(scope, department) & (self.teacher != NO_TEACHER)
+        rows = []
+        for i, totals in self._totals(self.teacher, mask):
+            full_name, teacher_department = self.teachers.get(i, (str(i), ""))
+            rows.append({
+                "teacher_id": i, "teacher__full_name": full_name, "teacher__department": teacher_department, **totals,
+            })
+        return sorted(rows, key=lambda r: r["teacher__full_name"])
+
+    def teacher_ranking(self, scope, limit=None):
+        # тот же формат, что у stats.teacher_ranking
+        rows = sorted(self.teacher_stats(scope), key=lambda r: -r["avg_grade"])
+        for row in rows:
+            del row["teacher__department"]
+        return rows[:limit] if limit else rows
+
+    def discipline_stats(self, scope, department=None):
+        # тот же формат, что у stats.discipline_stats
+        rows = [
+            {
+                "discipline_id": i,
+                "discipline__name": self.discipline_names.get(i, str(i)),
+                "discipline__department": self.discipline_departments.get(i, ""),
+                **totals,
+            }
+            for i, totals in self._totals(self.discipline, self.mask(scope, department))
+        ]
+        return sorted(rows, key=lambda r: r["discipline__name"])
+
+    def department_stats(self, scope):
+        # тот же формат, что у stats.department_stats: кафедра — по дисциплине
+        names = sorted(set(self.discipline_departments.values()))
+        index = {name: i for i, name in enumerate(names)}
+        lookup = np.zeros(max(self.discipline_departments, default=0) + 1, dtype=np.int32)
+        for discipline_id, name in self.discipline_departments.items():
+            lookup[discipline_id] = index[name]
+        return [
+            {"discipline__department": names[i], **totals}
+            for i, totals in self._totals(lookup[self.discipline], self.mask(scope))
+        ]
+
+    def breakdowns(self, scope):
+        # тот же формат, что у stats.compute_breakdowns
+        mask = self.mask(scope)
+        grades = self.grade[mask].astype(np.float64)
+
+        def entries(keys, names):
+            out = [
+                {"id": i, "name": names.get(i, str(i)), "results_count": count, "avg_grade": avg}
+                for i, count, avg in self._by(keys, grades)
+            ]
+            return sorted(out, key=lambda e: e["name"])
+
+        return {
+            "groups": entries(self.group[mask], self.group_names),
+            "disciplines": entries(self.discipline[mask], self.discipline_names),
+            "years": [
+                {"year": year, "avg_grade": avg, "count": count}
+                for year, count, avg in self._by(self.year[mask], grades)
+            ],
+        }
+
+    def summary(self, scope):
+        # тот же формат, что у агрегата в views.api_summary
+        mask = self.mask(scope)
+        count = int(np.count_nonzero(mask))
+        if not count:
+            return {
+                "avg_grade": None, "avg_attendance": None, "results_count": 0,
+                "students": 0, "groups": 0, "disciplines": 0,
+            }
+
+        def distinct(column):
+            return int(np.count_nonzero(np.bincount(column[mask])))
+
+        return {
+            "avg_grade": float(self.grade[mask].sum(dtype=np.float64) / count),
+            "avg_attendance": float(self.attendance[mask].sum(dtype=np.float64) / count),
+            "results_count": count,
+            "students": distinct(self.student),
+            "groups": distinct(self.group),
+            "disciplines": distinct(self.discipline),
+        }
@@ -1,50 +1,33 @@
-from .roles import is_manager, is_teacher
+from .roles import get_roles
 
 def role_flags(request):
-    user = getattr(request, "user", None)
-    if user and user.is_authenticated:
-        return {
-            "is_manager": is_manager(user),
-            "is_teacher": is_teacher(user),
-        }
-    return {"is_manager": False, "is_teacher": False}
-from .models import Notification
-
-def notifications_badge(request):
-    if not request.user.is_authenticated:
-        return {"notif_unread": 0}
-
-    from .models import Notification
-
+    # роли читаются из общего для запроса UserRoles, как и в представлениях
+    roles = get_roles(getattr(request, "user", None))
     return {
-        "notif_unread": Notification.objects.filter(user=request.user, is_read=False).count()
+        "is_manager": roles.is_manager,
+        "is_teacher": roles.is_teacher,
+        # вместо perms.analytics.*: права загружены вместе с группами
+        "can_view_department": roles.has_perm("analytics.can_view_department"),
+        "can_view_teacher": roles.has_perm("analytics.can_view_teacher"),
     }
-from django.contrib.auth.models import Group
-
-def role_context(request):
-
-    user = getattr(request, "user", None)
-    if not user or not user.is_authenticated:
-        return {"is_manager": False, "is_teacher": False}
+from django.db.utils import OperationalError, ProgrammingError
+from django.utils.functional import SimpleLazyObject
 
-    is_manager = user.is_staff or user.is_superuser
-    is_teacher = user.groups.filter(name="Преподаватели").exists()
+from .notifications import unread_count
 
-    return {"is_manager": is_manager, "is_teacher": is_teacher}
-def unread_notifications(request):
-    user = getattr(request, "user", None)
-    if user and user.is_authenticated:
-        return {"unread_notifications": user.notifications.filter(is_read=False).count()}
-    return {"unread_notifications": 0}
-from django.db.utils import OperationalError, ProgrammingError
 
 def unread_notifications(request):
+    # значение ленивое: счётчик читается (из кэша или NotificationCounter),
+    # только если шаблон действительно выводит unread_notifications
     user = getattr(request, "user", None)
     if not user or not user.is_authenticated:
         return {"unread_notifications": 0}
 
-    try:
-        return {"unread_notifications": user.notifications.filter(is_read=False).count()}
-    except (OperationalError, ProgrammingError):
-        # Таблица ещё не создана / миграции не применены
-        return {"unread_notifications": 0}
+    def count():
+        try:
+            return unread_count(user.pk)
+        except (OperationalError, ProgrammingError):
+            # Таблица ещё не создана / миграции не применены
+            return 0
+
+    return {"unread_notifications": SimpleLazyObject(count)}
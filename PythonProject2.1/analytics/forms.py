@@ -3,6 +3,8 @@ from django import forms
 class ResultsUploadForm(forms.Form):
     file = forms.FileField()
     preview = forms.BooleanField(required=False, initial=True)
+    background = forms.BooleanField(required=False, initial=False)
+    force = forms.BooleanField(required=False, initial=False)
 
 class TeacherUserLinkForm(forms.Form):
     user_id = forms.IntegerField()
@@ -0,0 +1,127 @@
+# Разбор и проверка строк CSV без обращения к БД и моделям:
+# модуль импортируется в процессах пула, где Django не настроен.
+import csv
+import io
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ParsedRow = namedtuple(
+    "ParsedRow",
+    "group student discipline teacher year term grade attendance",
+)
+
+DEFAULT_BLOCK_ROWS = 5000
+
+
+def parse_row(row, limits):
+    group_name = row["group"]
+    student_name = row["student"]
+    discipline_name = row["discipline"]
+    teacher_name = row.get("teacher", "") or ""
+    semester_year = int(row["year"])
+    semester_term = row["term"]
+    grade = float(row["grade"])
+    attendance = float(row.get("attendance", 0) or 0)
+
+    values = {
+        "group": group_name,
+        "student": student_name,
+        "discipline": discipline_name,
+        "teacher": teacher_name,
+        "term": semester_term,
+    }
+    for field, value in values.items():
+        if value is None:
+            raise ValueError(f"Пустое поле: {field}")
+        if len(value) > limits[field]:
+            raise ValueError(f"Поле {field} длиннее {limits[field]} символов")
+
+    return ParsedRow(
+        group_name,
+        student_name,
+        discipline_name,
+        teacher_name,
+        semester_year,
+        semester_term,
+        grade,
+        attendance,
+    )
+
+
+def parse_rows(rows, limits):
+    # элементы: (номер строки, исходная строка, ParsedRow или None, ошибка или None)
+    for idx, row in enumerate(rows, start=1):
+        try:
+            yield idx, row, parse_row(row, limits), None
+        except Exception as e:
+            yield idx, row, None, str(e)
+
+
+def parse_block(text, fieldnames, delimiter, limits):
+    out = []
+    for row in csv.DictReader(io.StringIO(text), fieldnames=fieldnames, delimiter=delimiter):
+        try:
+            out.append((None, parse_row(row, limits), None))
+        except Exception as e:
+            out.append((str(row), None, str(e)))
+    return out
+
+
+def split_records(lines, block_rows=DEFAULT_BLOCK_ROWS):
+    # Режем поток строк на блоки по границам записей. Перевод строки внутри
+    # кавычек не завершает запись: граница там, где число кавычек чётное.
+    block = []
+    records = 0
+    quotes = 0
+    for line in lines:
+        block.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        quotes = 0
+        records += 1
+        if records >= block_rows:
+            yield "".join(block)
+            block = []
+            records = 0
+    if block:
+        yield "".join(block)
+
+
+def parse_parallel(lines, limits, workers, delimiter=";", block_rows=DEFAULT_BLOCK_ROWS):
+    lines = iter(lines)
+    header_lines = []
+    quotes = 0
+    for line in lines:
+        if not header_lines and not line.strip():
+            continue
+        header_lines.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            break
+    if not header_lines:
+        return
+    fieldnames = next(csv.reader(header_lines, delimiter=delimiter), None)
+    if not fieldnames:
+        return
+
+    idx = 0
+    # spawn, а не fork: пул запускается и из веб-процесса, где уже есть
+    # потоки (журнал действий), а fork копирует их блокировки
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        # держим в работе ограниченное число блоков, чтобы не читать
+        # весь файл наперёд; результаты забираем строго по порядку
+        in_flight = deque()
+        blocks = split_records(lines, block_rows)
+        for text in blocks:
+            in_flight.append(pool.submit(parse_block, text, fieldnames, delimiter, limits))
+            if len(in_flight) < workers * 2:
+                continue
+            for raw, parsed, error in in_flight.popleft().result():
+                idx += 1
+                yield idx, raw, parsed, error
+        while in_flight:
+            for raw, parsed, error in in_flight.popleft().result():
+                idx += 1
+                yield idx, raw, parsed, error
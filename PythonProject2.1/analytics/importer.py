@@ -0,0 +1,435 @@
+import codecs
+import csv
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .import_parsing import parse_parallel, parse_rows
+from .models import Discipline, Group, ImportBatch, ImportRowError, Result, Semester, Student, Teacher
+from .roles import forget_linked_teachers
+from .rollups import add_result, apply_deltas, apply_student_deltas, new_deltas
+
+DEFAULT_BATCH_SIZE = 2000
+READ_CHUNK_SIZE = 64 * 1024
+
+# ограничение на число параметров в одном IN (...) для SQLite
+LOOKUP_CHUNK = 500
+
+# сколько ошибок показывать в предпросмотре
+ERROR_SAMPLE_SIZE = 20
+
+DEFAULT_MAX_STORED_ERRORS = 1000
+RAW_ROW_LIMIT = 1000
+# сколько разных текстов ошибок держать в сводке, остальное — в "прочих"
+ERROR_SUMMARY_LIMIT = 100
+OTHER_ERRORS = "Прочие ошибки"
+
+TEXT_LIMITS = {
+    "group": Group._meta.get_field("name").max_length,
+    "student": Student._meta.get_field("full_name").max_length,
+    "discipline": Discipline._meta.get_field("name").max_length,
+    "teacher": Teacher._meta.get_field("full_name").max_length,
+    "term": Semester._meta.get_field("term").max_length,
+}
+
+
+def _chunks(items, size=LOOKUP_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def iter_lines(chunks, encoding="utf-8-sig"):
+    # декодируем поток байтов по кускам и отдаём строки по одной,
+    # не собирая файл целиком в памяти
+    decoder = codecs.getincrementaldecoder(encoding)()
+    tail = ""
+    for chunk in chunks:
+        parts = (tail + decoder.decode(chunk)).split("\n")
+        tail = parts.pop()
+        for line in parts:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def file_sha256(file):
+    digest = hashlib.sha256()
+    for chunk in _file_chunks(file):
+        digest.update(chunk)
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def _file_chunks(file):
+    if hasattr(file, "chunks"):
+        return file.chunks(READ_CHUNK_SIZE)
+    return iter(lambda: file.read(READ_CHUNK_SIZE), b"")
+
+
+def read_csv_rows(file, delimiter=";"):
+    return csv.DictReader(iter_lines(_file_chunks(file)), delimiter=delimiter)
+
+
+def parse_stream(file, workers=None, delimiter=";"):
+    # workers > 1 — разбор и проверка строк в пуле процессов,
+    # результаты всё равно приходят по порядку номеров строк
+    workers = workers or getattr(settings, "ANALYTICS_IMPORT_WORKERS", 1)
+    if workers > 1:
+        return parse_parallel(iter_lines(_file_chunks(file)), TEXT_LIMITS, workers, delimiter)
+    return parse_rows(read_csv_rows(file, delimiter), TEXT_LIMITS)
+
+
+def preview_file(file, workers=None, sample_rows=20, batch_size=None, on_progress=None):
+    importer = ResultImporter(dry_run=True, batch_size=batch_size, on_progress=on_progress)
+    sample = []
+
+    def items():
+        for item in parse_stream(file, workers):
+            parsed = item[2]
+            if parsed is not None and len(sample) < sample_rows:
+                sample.append(parsed)
+            yield item
+
+    importer.run_parsed(items())
+    return importer, sample
+
+
+class ResultImporter:
+    """
+    Пакетный импорт результатов: справочники (группы, студенты, дисциплины,
+    преподаватели, семестры) разрешаются один раз в словари по натуральному
+    ключу, недостающие создаются через bulk_create, а Result пишется
+    пачками bulk_create/bulk_update.
+
+    С dry_run=True в БД ничего не пишется: новым объектам выдаются
+    временные отрицательные id, а результат только подсчитывается.
+    """
+
+    def __init__(self, batch=None, batch_size=None, dry_run=False, on_progress=None):
+        self.batch = batch
+        self.on_progress = on_progress
+        self.batch_size = batch_size or getattr(settings, "ANALYTICS_IMPORT_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+        self.dry_run = dry_run
+
+        self.groups = {}       # name -> id
+        self.disciplines = {}  # name -> id
+        self.teachers = {}     # full_name -> id
+        self.semesters = {}    # (year, term) -> id
+        self.students = {}     # (full_name, group_id) -> id
+        self._loaded_groups = set()
+        self._added = []
+
+        self.total = self.created = self.updated = self.errors = 0
+        self.unchanged = 0
+        self.new_objects = dict.fromkeys(("groups", "students", "disciplines", "teachers", "semesters"), 0)
+        self.error_samples = []
+        self.error_summary = Counter()
+        self.max_stored_errors = getattr(settings, "ANALYTICS_IMPORT_MAX_STORED_ERRORS", DEFAULT_MAX_STORED_ERRORS)
+        self._stored_errors = 0
+        self._error_buffer = []
+        self._pending = []
+        self._planned = {}
+        self._fake_id = 0
+
+    def run(self, rows):
+        return self.run_parsed(parse_rows(rows, TEXT_LIMITS))
+
+    def run_parsed(self, items):
+        self._load(self.groups, Group, ("name",))
+        self._load(self.disciplines, Discipline, ("name",))
+        self._load(self.teachers, Teacher, ("full_name",))
+        self._load(self.semesters, Semester, ("year", "term"))
+
+        try:
+            for idx, row, parsed, error in items:
+                self.total += 1
+                if error is not None:
+                    self.row_error(idx, row, error)
+                else:
+                    self._pending.append((idx, row, parsed))
+
+                # сбрасываем и по числу прочитанных строк: файл из одних
+                # ошибок тоже должен писаться пачками и показывать прогресс
+                if len(self._pending) >= self.batch_size or self.total % self.batch_size == 0:
+                    self.flush()
+
+            self.flush()
+        finally:
+            self.flush_errors()
+            # даже если файл оборвался посередине, в партии остаются
+            # счётчики по уже записанным пачкам
+            self.save_counters()
+        return self
+
+    def save_counters(self):
+        if self.batch is None:
+            return
+        self.batch.total_rows = self.total
+        self.batch.processed_rows = self.total
+        self.batch.created_results = self.created
+        self.batch.updated_results = self.updated
+        self.batch.unchanged_results = self.unchanged
+        self.batch.error_rows = self.errors
+        self.batch.error_summary = dict(self.error_summary)
+        self.batch.save(update_fields=[
+            "total_rows", "processed_rows", "created_results", "updated_results", "unchanged_results",
+            "error_rows", "error_summary",
+        ])
+
+    def report_progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self)
+        if self.batch is None:
+            return
+        # update() вместо save(), чтобы не затирать поля, которые меняет воркер
+        ImportBatch.objects.filter(pk=self.batch.pk).update(
+            processed_rows=self.total,
+            created_results=self.created,
+            updated_results=self.updated,
+            unchanged_results=self.unchanged,
+            error_rows=self.errors,
+            error_summary=dict(self.error_summary),
+            heartbeat_at=timezone.now(),
+        )
+
+    def row_error(self, row_number, row, exc):
+        self.errors += 1
+        message = str(exc)
+        if message in self.error_summary or len(self.error_summary) < ERROR_SUMMARY_LIMIT:
+            self.error_summary[message] += 1
+        else:
+            self.error_summary[OTHER_ERRORS] += 1
+
+        if self.dry_run:
+            if len(self.error_samples) < ERROR_SAMPLE_SIZE:
+                self.error_samples.append((row_number, message))
+            return
+
+        # сверх лимита строки только считаются в сводке
+        if self._stored_errors >= self.max_stored_errors:
+            return
+        self._stored_errors += 1
+        self._error_buffer.append(ImportRowError(
+            batch=self.batch,
+            row_number=row_number,
+            raw_row=str(row)[:RAW_ROW_LIMIT],
+            error=message,
+        ))
+
+    def flush_errors(self):
+        if not self._error_buffer:
+            return
+        buffer, self._error_buffer = self._error_buffer, []
+        ImportRowError.objects.bulk_create(buffer, batch_size=self.batch_size)
+
+    def _failed_rows(self, pending, exc):
+        for idx, row, parsed in pending:
+            # из пула процессов успешно разобранные строки приходят без исходника
+            self.row_error(idx, row if row is not None else dict(parsed._asdict()), exc)
+
+    def flush(self):
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self._flush(pending)
+        self.flush_errors()
+        self.report_progress()
+
+    def _flush(self, pending):
+        try:
+            self._write(pending)
+            return
+        except Exception as e:
+            if len(pending) == 1:
+                self._failed_rows(pending, e)
+                return
+
+        # пачка не записалась целиком — повторяем построчно,
+        # чтобы одна плохая строка не потянула за собой остальные
+        for item in pending:
+            try:
+                self._write([item])
+            except Exception as e:
+                self._failed_rows([item], e)
+
+    def _write(self, pending):
+        self._added = []
+        try:
+            with transaction.atomic():
+                rows = [parsed for _, _, parsed in pending]
+                keys = self._resolve_keys(rows)
+                if self.dry_run:
+                    created, updated, unchanged = self._plan_results(rows, keys)
+                else:
+                    created, updated, unchanged = self._write_results(rows, keys)
+        except Exception:
+            # откатываем ключи, закэшированные в отменённой транзакции
+            for cache, key in self._added:
+                if isinstance(cache, set):
+                    cache.discard(key)
+                else:
+                    cache.pop(key, None)
+            raise
+        self.created += created
+        self.updated += updated
+        self.unchanged += unchanged
+
+    def _resolve_keys(self, rows):
+        self._ensure("groups", Group, ("name",), {(r.group,) for r in rows})
+        self._ensure("disciplines", Discipline, ("name",), {(r.discipline,) for r in rows})
+        self._ensure("teachers", Teacher, ("full_name",), {(r.teacher,) for r in rows if r.teacher})
+        self._ensure("semesters", Semester, ("year", "term"), {(r.year, r.term) for r in rows})
+
+        group_ids = {self.groups[r.group] for r in rows}
+        new_groups = group_ids - self._loaded_groups
+        if new_groups:
+            # у групп, которых ещё нет в БД (dry_run), студентов искать незачем
+            for ids in _chunks(gid for gid in new_groups if gid > 0):
+                self._load(self.students, Student, ("full_name", "group_id"), filters={"group_id__in": ids})
+            self._loaded_groups |= new_groups
+            self._added.extend((self._loaded_groups, gid) for gid in new_groups)
+        self._ensure(
+            "students", Student, ("full_name", "group_id"),
+            {(r.student, self.groups[r.group]) for r in rows},
+        )
+
+        return [
+            (
+                self.students[(r.student, self.groups[r.group])],
+                self.disciplines[r.discipline],
+                self.teachers[r.teacher] if r.teacher else None,
+                self.semesters[(r.year, r.term)],
+            )
+            for r in rows
+        ]
+
+    def _existing_results(self, keys):
+        # key -> (id, grade, attendance_percent) для уже сохранённых результатов
+        existing = {}
+        wanted = set(keys)
+        student_ids = {k[0] for k in keys if k[0] > 0}
+        for ids in _chunks(student_ids):
+            qs = (
+                Result.objects
+                .filter(student_id__in=ids)
+                .values_list(
+                    "id", "student_id", "discipline_id", "teacher_id", "semester_id",
+                    "grade", "attendance_percent",
+                )
+                .order_by("id")
+            )
+            for result_id, student_id, discipline_id, teacher_id, semester_id, grade, attendance in qs:
+                key = (student_id, discipline_id, teacher_id, semester_id)
+                if key in wanted:
+                    existing.setdefault(key, (result_id, grade, attendance))
+        return existing
+
+    def _classify(self, rows, keys, existing, current):
+        # current: key -> (grade, attendance) после уже учтённых строк;
+        # строка без реальных изменений считается unchanged и не пишется
+        created = updated = unchanged = 0
+        for r, key in zip(rows, keys):
+            values = (r.grade, r.attendance)
+            if key in current:
+                previous = current[key]
+            elif key in existing:
+                previous = existing[key][1:]
+            else:
+                previous = None
+
+            if previous is None:
+                created += 1
+            elif previous == values:
+                unchanged += 1
+            else:
+                updated += 1
+            current[key] = values
+        return created, updated, unchanged
+
+    def _plan_results(self, rows, keys):
+        existing = self._existing_results(keys)
+        return self._classify(rows, keys, existing, self._planned)
+
+    def _write_results(self, rows, keys):
+        existing = self._existing_results(keys)
+        current = {}
+        counts = self._classify(rows, keys, existing, current)
+
+        # сводки ResultRollup и средние студентов обновляются в той же транзакции, что и Result
+        group_of = {key[0]: self.groups[r.group] for r, key in zip(rows, keys)}
+        deltas = new_deltas()
+        student_deltas = new_deltas()
+
+        to_create = []
+        to_update = []
+        for key, (grade, attendance) in current.items():
+            rollup_key = (group_of[key[0]],) + key[1:]
+            if key not in existing:
+                add_result(deltas, rollup_key, grade, attendance)
+                add_result(student_deltas, key[0], grade, attendance)
+                to_create.append(Result(
+                    student_id=key[0],
+                    discipline_id=key[1],
+                    teacher_id=key[2],
+                    semester_id=key[3],
+                    grade=grade,
+                    attendance_percent=attendance,
+                ))
+            elif existing[key][1:] != (grade, attendance):
+                to_update.append(Result(id=existing[key][0], grade=grade, attendance_percent=attendance))
+                add_result(deltas, rollup_key, *existing[key][1:], sign=-1)
+                add_result(deltas, rollup_key, grade, attendance)
+                add_result(student_deltas, key[0], *existing[key][1:], sign=-1)
+                add_result(student_deltas, key[0], grade, attendance)
+
+        Result.objects.bulk_create(to_create, batch_size=self.batch_size)
+        Result.objects.bulk_update(to_update, ["grade", "attendance_percent"], batch_size=self.batch_size)
+        apply_deltas(deltas)
+        apply_student_deltas(student_deltas)
+        return counts
+
+    def _ensure(self, kind, model, fields, keys):
+        cache = getattr(self, kind)
+        missing = [k for k in keys if (k[0] if len(fields) == 1 else k) not in cache]
+        if not missing:
+            return
+        if self.dry_run:
+            for k in missing:
+                self._fake_id -= 1
+                cache[k[0] if len(fields) == 1 else k] = self._fake_id
+            self.new_objects[kind] += len(missing)
+            return
+        # ignore_conflicts: ключ мог успеть создать параллельный импорт,
+        # id в любом случае перечитываются ниже
+        model.objects.bulk_create(
+            [model(**dict(zip(fields, k))) for k in missing],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        if model is Teacher:
+            # новый преподаватель может совпасть по ФИО с пользователем без привязки
+            forget_linked_teachers()
+        for part in _chunks(missing):
+            self._load(
+                cache, model, fields,
+                filters={f"{fields[0]}__in": {k[0] for k in part}},
+                only=set(part),
+            )
+
+    def _load(self, cache, model, fields, filters=None, only=None):
+        qs = model.objects.all()
+        if filters:
+            qs = qs.filter(**filters)
+        for pk, *values in qs.order_by("id").values_list("id", *fields):
+            values = tuple(values)
+            if only is not None and values not in only:
+                continue
+            key = values[0] if len(fields) == 1 else values
+            if key not in cache:
+                cache[key] = pk
+                self._added.append((cache, key))
@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .importer import ResultImporter, file_sha256, parse_stream
+from .models import DataVersion, ImportBatch, ImportRowError
+
+DEFAULT_STALE_AFTER = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def create_batch(user, file, force=False):
+    # Файл, уже успешно импортированный ранее, повторно не разбирается:
+    # партия сразу получает статус "пропущен" со ссылкой на исходный импорт.
+    batch = ImportBatch.objects.create(
+        user=user if user and user.is_authenticated else None,
+        file_name=getattr(file, "name", "upload.csv"),
+        content_hash=file_sha256(file),
+    )
+    original = None if force else find_duplicate(batch)
+    if original:
+        batch.status = ImportBatch.STATUS_SKIPPED
+        batch.duplicate_of = original
+        batch.finished_at = timezone.now()
+        batch.save(update_fields=["status", "duplicate_of", "finished_at"])
+    return batch
+
+
+def find_duplicate(batch):
+    return (
+        ImportBatch.objects
+        .filter(content_hash=batch.content_hash, status=ImportBatch.STATUS_DONE)
+        .exclude(id=batch.id)
+        .order_by("-id")
+        .first()
+    )
+
+
+def enqueue_import(batch, file):
+    # файл сохраняется в ANALYTICS_IMPORT_DIR (вне MEDIA_ROOT), очередь — сами записи ImportBatch
+    batch.source_file.save(batch.file_name, file, save=False)
+    batch.save(update_fields=["source_file"])
+    return batch
+
+
+def release_stale_batches():
+    # Партии, воркер которых упал или был убит: «выполняется», но без отметки
+    # о прогрессе дольше ANALYTICS_IMPORT_STALE_AFTER секунд. Если файл цел
+    # и попытки не исчерпаны, партия возвращается в очередь (повторный импорт
+    # тех же строк ничего не удваивает), иначе помечается как упавшая.
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, "ANALYTICS_IMPORT_STALE_AFTER", DEFAULT_STALE_AFTER))
+    max_attempts = getattr(settings, "ANALYTICS_IMPORT_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)
+    stale = (
+        ImportBatch.objects
+        .filter(status=ImportBatch.STATUS_RUNNING)
+        .alias(last_seen=Coalesce("heartbeat_at", "started_at", "created_at"))
+        .filter(last_seen__lt=cutoff)
+    )
+    released = 0
+    for batch in stale:
+        current = ImportBatch.objects.filter(id=batch.id, status=ImportBatch.STATUS_RUNNING)
+        if batch.source_file and batch.attempts < max_attempts:
+            if current.update(status=ImportBatch.STATUS_PENDING, processed_rows=0):
+                # ошибки строк запишутся заново при следующей попытке
+                ImportRowError.objects.filter(batch=batch).delete()
+                released += 1
+            continue
+        failed = current.update(
+            status=ImportBatch.STATUS_FAILED,
+            failure="Воркер импорта остановился, не завершив обработку",
+            finished_at=now,
+        )
+        if failed:
+            if batch.source_file:
+                batch.source_file.delete(save=False)
+                ImportBatch.objects.filter(id=batch.id).update(source_file="")
+            # часть пачек могла успеть записаться
+            DataVersion.bump()
+            released += 1
+    return released
+
+
+def claim_next_batch():
+    release_stale_batches()
+    pending = (
+        ImportBatch.objects
+        .filter(status=ImportBatch.STATUS_PENDING)
+        .exclude(source_file="")
+        .order_by("created_at", "id")
+        .values_list("id", flat=True)
+    )
+    for batch_id in pending[:10]:
+        now = timezone.now()
+        # условный UPDATE: если партию уже забрал другой воркер, ничего не обновится
+        claimed = (
+            ImportBatch.objects
+            .filter(id=batch_id, status=ImportBatch.STATUS_PENDING)
+            .update(
+                status=ImportBatch.STATUS_RUNNING,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=F("attempts") + 1,
+            )
+        )
+        if claimed:
+            return ImportBatch.objects.get(id=batch_id)
+    return None
+
+
+def run_batch(batch, file=None, batch_size=None, workers=None, on_progress=None):
+    if batch.status != ImportBatch.STATUS_RUNNING:
+        batch.status = ImportBatch.STATUS_RUNNING
+        batch.started_at = batch.heartbeat_at = timezone.now()
+        batch.save(update_fields=["status", "started_at", "heartbeat_at"])
+
+    try:
+        importer = ResultImporter(batch, batch_size=batch_size, on_progress=on_progress)
+        if file is not None:
+            importer.run_parsed(parse_stream(file, workers))
+        else:
+            with batch.source_file.open("rb") as f:
+                importer.run_parsed(parse_stream(f, workers))
+    except Exception as e:
+        batch.status = ImportBatch.STATUS_FAILED
+        batch.failure = str(e)
+        batch.finished_at = timezone.now()
+        batch.save(update_fields=["status", "failure", "finished_at"])
+        # повторить импорт можно только новой загрузкой, файл больше не нужен
+        if batch.source_file:
+            batch.source_file.delete(save=True)
+        # часть пачек могла успеть записаться
+        DataVersion.bump()
+        raise
+
+    batch.status = ImportBatch.STATUS_DONE
+    batch.finished_at = timezone.now()
+    batch.save(update_fields=["status", "finished_at"])
+    DataVersion.bump()
+    if batch.source_file:
+        batch.source_file.delete(save=True)
+    return batch
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from analytics.jobs import create_batch, run_batch
+from analytics.synthetic import write_synthetic_csv
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _peak_rss_mb():
+    # ru_maxrss: КБ в Linux, байты в macOS; это пик процесса с его запуска
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == "Darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the CSV import engine on synthetic files: rows/sec, SQL queries, "
+        "peak memory and wall time; results are appended to a JSON file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                            help="rows per synthetic file")
+        parser.add_argument("--batch-size", type=int, default=None, help="rows per database batch")
+        parser.add_argument("--workers", type=int, default=None, help="processes for parsing/validation")
+        parser.add_argument("--output", default="bench_import.json", help="JSON file to append the run to")
+        parser.add_argument("--trace-memory", action="store_true",
+                            help="also measure peak Python allocations with tracemalloc (slower)")
+        parser.add_argument("--label", default="", help="free-form note stored with the run")
+        parser.add_argument("--in-process", action="store_true",
+                            help="run all sizes in this process (peak RSS is then cumulative across sizes)")
+        # служебный режим: один размер в отдельном процессе, результат — JSON в stdout
+        parser.add_argument("--child", nargs=3, metavar=("CSV", "ROWS", "DB"), help=argparse.SUPPRESS)
+
+    def handle(self, *args, **opts):
+        if opts["child"]:
+            csv_path, rows, db_path = opts["child"]
+            self.stdout.write(json.dumps(self._run_one(csv_path, int(rows), db_path, opts)))
+            return
+
+        results = []
+        with tempfile.TemporaryDirectory(prefix="bench_import_") as tmp:
+            for rows in sorted(opts["sizes"]):
+                csv_path = os.path.join(tmp, f"results_{rows}.csv")
+                with open(csv_path, "w", encoding="utf-8", newline="") as f:
+                    write_synthetic_csv(f, rows)
+
+                db_path = os.path.join(tmp, f"db_{rows}.sqlite3")
+                if opts["in_process"]:
+                    result = self._run_one(csv_path, rows, db_path, opts)
+                else:
+                    result = self._run_child(csv_path, rows, db_path, opts)
+                results.append(result)
+                self.stdout.write(
+                    f"{rows:>9} rows: {result['seconds']:>8.2f}s {result['rows_per_sec']:>10.0f} rows/sec "
+                    f"{result['queries']:>7} queries  peak RSS {result['peak_rss_mb']} MB"
+                    + (f", traced {result['peak_traced_mb']} MB" if "peak_traced_mb" in result else "")
+                )
+
+        run = {
+            "timestamp": timezone.now().isoformat(),
+            "label": opts["label"],
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "database": connection.vendor,
+            "batch_size": opts["batch_size"],
+            "workers": opts["workers"],
+            # ru_maxrss не сбрасывается: в одном процессе это пик за все размеры до текущего
+            "peak_rss_scope": "cumulative" if opts["in_process"] else "per size",
+            "results": results,
+        }
+
+        history = []
+        if os.path.exists(opts["output"]):
+            with open(opts["output"], encoding="utf-8") as f:
+                history = json.load(f)
+        history.append(run)
+        with open(opts["output"], "w", encoding="utf-8") as f:
+            json.dump(history, f, ensure_ascii=False, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f"Saved to {opts['output']}"))
+
+    def _run_child(self, csv_path, rows, db_path, opts):
+        # отдельный процесс на размер, чтобы пик RSS относился только к нему
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), "benchmark_import",
+            "--child", csv_path, str(rows), db_path,
+        ]
+        if opts["batch_size"]:
+            command += ["--batch-size", str(opts["batch_size"])]
+        if opts["workers"]:
+            command += ["--workers", str(opts["workers"])]
+        if opts["trace_memory"]:
+            command.append("--trace-memory")
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def _run_one(self, csv_path, rows, db_path, opts):
+        # каждый размер — в чистой тестовой БД, рабочая база не трогается
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite":
+            test_settings["NAME"] = db_path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            counter = QueryCounter()
+            if opts["trace_memory"]:
+                tracemalloc.start()
+            started = time.perf_counter()
+            with connection.execute_wrapper(counter), open(csv_path, "rb") as f:
+                file = File(f, name=os.path.basename(csv_path))
+                batch = create_batch(None, file)
+                run_batch(batch, file, batch_size=opts["batch_size"], workers=opts["workers"])
+            elapsed = time.perf_counter() - started
+
+            result = {
+                "rows": rows,
+                "seconds": round(elapsed, 3),
+                "rows_per_sec": round(rows / elapsed, 1) if elapsed else None,
+                "queries": counter.count,
+                "peak_rss_mb": _peak_rss_mb(),
+                "created": batch.created_results,
+                "errors": batch.error_rows,
+            }
+            if opts["trace_memory"]:
+                result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+                tracemalloc.stop()
+            return result
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,41 @@
+import io
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics.importer import parse_stream
+from analytics.synthetic import write_synthetic_csv
+
+
+def _synthetic_csv(rows):
+    buf = io.StringIO()
+    write_synthetic_csv(buf, rows)
+    return buf.getvalue().encode("utf-8")
+
+
+class Command(BaseCommand):
+    help = "Measure CSV parse/validation throughput (rows/sec) for 1..N worker processes, without database writes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200000, help="synthetic rows to parse")
+        parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="largest pool size to try")
+
+    def handle(self, *args, **opts):
+        rows = int(opts["rows"])
+        max_workers = max(1, int(opts["max_workers"]))
+        data = _synthetic_csv(rows)
+
+        self.stdout.write(f"rows={rows} size={len(data) / 1024 / 1024:.1f} MB")
+        self.stdout.write(f"{'workers':>8} {'seconds':>9} {'rows/sec':>12} {'speedup':>8}")
+
+        base = None
+        for workers in range(1, max_workers + 1):
+            started = time.perf_counter()
+            parsed = sum(1 for _ in parse_stream(io.BytesIO(data), workers=workers))
+            elapsed = time.perf_counter() - started
+            if parsed != rows:
+                self.stderr.write(f"workers={workers}: parsed {parsed} rows instead of {rows}")
+            rate = parsed / elapsed if elapsed else 0
+            base = base or rate
+            self.stdout.write(f"{workers:>8} {elapsed:>9.2f} {rate:>12.0f} {rate / base:>7.2f}x")
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import columnar
+from analytics.models import DataVersion
+
+
+class Command(BaseCommand):
+    help = "Build the NumPy columnar snapshot of Result used when ANALYTICS_ENGINE = 'columnar'"
+
+    def handle(self, *args, **opts):
+        if not columnar.is_available():
+            raise CommandError("numpy is not installed")
+
+        started = time.perf_counter()
+        generation = DataVersion.current().generation
+        rows = columnar.build_snapshot(generation)
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot of {rows} results for generation {generation} written to {columnar.snapshot_dir()} "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
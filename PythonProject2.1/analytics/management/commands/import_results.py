@@ -0,0 +1,89 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.importer import preview_file
+from analytics.jobs import create_batch, run_batch
+from analytics.models import ImportBatch
+
+
+class Command(BaseCommand):
+    help = "Import results from CSV files (same format and engine as the web upload)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="CSV files to import")
+        parser.add_argument("--batch-size", type=int, default=None, help="rows per database batch")
+        parser.add_argument("--workers", type=int, default=None, help="processes for parsing/validation")
+        parser.add_argument("--dry-run", action="store_true", help="validate and count without writing")
+        parser.add_argument("--force", action="store_true", help="import even if the same file was imported before")
+        parser.add_argument("--user", default=None, help="username to record on ImportBatch")
+
+    def handle(self, *args, **opts):
+        user = None
+        if opts["user"]:
+            user = User.objects.filter(username=opts["user"]).first()
+            if user is None:
+                raise CommandError(f"User not found: {opts['user']}")
+
+        for path in opts["paths"]:
+            if not os.path.isfile(path):
+                raise CommandError(f"File not found: {path}")
+
+        for path in opts["paths"]:
+            with open(path, "rb") as f:
+                file = File(f, name=os.path.basename(path))
+                if opts["dry_run"]:
+                    self._dry_run(path, file, opts)
+                else:
+                    self._import(path, file, user, opts)
+
+    def _progress(self, path):
+        started = time.perf_counter()
+        last = {"total": None}
+
+        def report(importer):
+            if importer.total == last["total"]:
+                return
+            last["total"] = importer.total
+            elapsed = time.perf_counter() - started
+            rate = importer.total / elapsed if elapsed else 0
+            self.stdout.write(f"  {path}: {importer.total} rows, {rate:.0f} rows/sec")
+
+        return started, report
+
+    def _dry_run(self, path, file, opts):
+        started, report = self._progress(path)
+        importer, _ = preview_file(file, opts["workers"], batch_size=opts["batch_size"], on_progress=report)
+        elapsed = time.perf_counter() - started
+        new = ", ".join(f"{k}={v}" for k, v in importer.new_objects.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{path} (dry run): rows={importer.total} create={importer.created} update={importer.updated} "
+            f"unchanged={importer.unchanged} errors={importer.errors} new: {new} "
+            f"[{elapsed:.1f}s, {importer.total / elapsed if elapsed else 0:.0f} rows/sec]"
+        ))
+        for row_number, error in importer.error_samples:
+            self.stdout.write(f"  row {row_number}: {error}")
+
+    def _import(self, path, file, user, opts):
+        batch = create_batch(user, file, force=opts["force"])
+        if batch.status == ImportBatch.STATUS_SKIPPED:
+            self.stdout.write(self.style.WARNING(
+                f"{path}: already imported as batch #{batch.duplicate_of_id}, skipped (batch #{batch.id})"
+            ))
+            return
+
+        started, report = self._progress(path)
+        try:
+            run_batch(batch, file, batch_size=opts["batch_size"], workers=opts["workers"], on_progress=report)
+        except Exception as e:
+            raise CommandError(f"{path}: import failed (batch #{batch.id}): {e}")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: batch #{batch.id} rows={batch.total_rows} created={batch.created_results} "
+            f"updated={batch.updated_results} unchanged={batch.unchanged_results} errors={batch.error_rows} "
+            f"[{elapsed:.1f}s, {batch.total_rows / elapsed if elapsed else 0:.0f} rows/sec]"
+        ))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import columnar
+from analytics.models import DataVersion
+from analytics.rollups import check_rollups, check_student_averages, rebuild_rollups, rebuild_student_averages
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild ResultRollup summary tables and per-student averages from Result "
+        "and check them against the live data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check-only", action="store_true",
+                            help="only compare rollups with Result, do not rebuild")
+        parser.add_argument("--show", type=int, default=20, help="how many mismatching keys to print")
+
+    def handle(self, *args, **opts):
+        if not opts["check_only"]:
+            count = rebuild_rollups()
+            self.stdout.write(f"Rebuilt {count} rollup rows")
+            count = rebuild_student_averages()
+            self.stdout.write(f"Rebuilt averages of {count} students")
+            # пересборка сменила поколение данных: снимок старого поколения не читается
+            if columnar.is_enabled():
+                columnar.build_snapshot(DataVersion.current().generation)
+
+        mismatches = check_rollups()
+        for key, stored, live in mismatches[:opts["show"]]:
+            group_id, discipline_id, teacher_id, semester_id = key
+            self.stdout.write(
+                f"group={group_id} discipline={discipline_id} teacher={teacher_id} semester={semester_id}: "
+                f"rollup={stored} result={live}"
+            )
+
+        student_mismatches = check_student_averages()
+        for student_id, stored, live in student_mismatches[:opts["show"]]:
+            self.stdout.write(f"student={student_id}: stored={stored} result={live}")
+
+        if mismatches or student_mismatches:
+            raise CommandError(
+                f"{len(mismatches)} rollup keys and {len(student_mismatches)} students do not match Result"
+            )
+        self.stdout.write(self.style.SUCCESS("Rollups and student averages match Result"))
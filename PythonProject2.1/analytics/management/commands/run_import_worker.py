@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics import columnar
+from analytics.jobs import claim_next_batch, run_batch
+
+
+class Command(BaseCommand):
+    help = "Process queued CSV imports (ImportBatch records with status 'pending')"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="process the queue once and exit")
+        parser.add_argument("--sleep", type=float, default=2.0, help="seconds to wait when the queue is empty")
+        parser.add_argument("--batch-size", type=int, default=None, help="rows per database batch")
+        parser.add_argument("--workers", type=int, default=None, help="processes for parsing/validation")
+
+    def handle(self, *args, **opts):
+        once = opts["once"]
+        sleep = float(opts["sleep"])
+        batch_size = opts["batch_size"]
+        workers = opts["workers"]
+
+        self.stdout.write("Import worker started.")
+        while True:
+            batch = claim_next_batch()
+            if batch is None:
+                # снимок пересобирается здесь, а не в run_batch: загрузка из
+                # веб-формы не читает всю таблицу Result, а серия импортов
+                # даёт одну пересборку
+                if columnar.is_enabled() and columnar.refresh_snapshot():
+                    self.stdout.write("Columnar snapshot rebuilt.")
+                if once:
+                    break
+                time.sleep(sleep)
+                continue
+
+            self.stdout.write(f"Batch #{batch.id}: {batch.file_name}")
+            try:
+                run_batch(batch, batch_size=batch_size, workers=workers)
+            except Exception as e:
+                self.stderr.write(f"Batch #{batch.id} failed: {e}")
+                continue
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Batch #{batch.id} done. rows={batch.total_rows} created={batch.created_results} "
+                f"updated={batch.updated_results} errors={batch.error_rows}"
+            ))
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:26
+
+import analytics.models
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_batches_done(apps, schema_editor):
+    # до появления фонового режима все импорты выполнялись сразу в запросе
+    ImportBatch = apps.get_model("analytics", "ImportBatch")
+    ImportBatch.objects.update(status="done", processed_rows=F("total_rows"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_create_notification_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importbatch',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток обработки'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='failure',
+            field=models.TextField(blank=True, verbose_name='Причина сбоя'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Окончание обработки'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний прогресс'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='processed_rows',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обработано строк'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='source_file',
+            field=models.FileField(blank=True, storage=analytics.models.ImportFileStorage(), upload_to='', verbose_name='Исходный файл'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начало обработки'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершён'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.RunPython(mark_existing_batches_done, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_importbatch_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importbatch',
+            name='error_summary',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Сводка ошибок'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_importbatch_error_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importbatch',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='SHA-256 файла'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='analytics.importbatch', verbose_name='Повтор импорта'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='unchanged_results',
+            field=models.PositiveIntegerField(default=0, verbose_name='Без изменений'),
+        ),
+        migrations.AlterField(
+            model_name='importbatch',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершён'), ('failed', 'Ошибка'), ('skipped', 'Пропущен (файл уже загружен)')], db_index=True, default='pending', max_length=20, verbose_name='Статус'),
+        ),
+    ]
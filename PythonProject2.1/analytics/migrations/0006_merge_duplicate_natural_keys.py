@@ -0,0 +1,100 @@
+# Слияние дублей перед тем, как натуральные ключи станут уникальными
+# (см. 0007_natural_keys_and_indexes). Из дублей остаётся запись с
+# меньшим id, ссылки на остальные переводятся на неё.
+
+from collections import defaultdict
+
+from django.db import migrations
+
+RESULT_KEY = ("student_id", "discipline_id", "teacher_id", "semester_id")
+
+
+def _duplicates(model, fields):
+    # {id дубля: id оставляемой записи}
+    seen = {}
+    mapping = {}
+    for pk, *values in model.objects.order_by("id").values_list("id", *fields):
+        key = tuple(values)
+        if key in seen:
+            mapping[pk] = seen[key]
+        else:
+            seen[key] = pk
+    return mapping
+
+
+def _repoint_results(Result, attname, mapping):
+    if not mapping:
+        return
+    for result in Result.objects.filter(**{f"{attname}__in": list(mapping)}).order_by("id"):
+        setattr(result, attname, mapping[getattr(result, attname)])
+        key = {name: getattr(result, name) for name in RESULT_KEY}
+        clash = Result.objects.filter(**key).exclude(id=result.id).first()
+        if clash:
+            # из двух результатов с одинаковым ключом оставляем более поздний
+            if clash.id > result.id:
+                result.delete()
+                continue
+            clash.delete()
+        result.save(update_fields=[attname])
+
+
+def merge_duplicates(apps, schema_editor):
+    Group = apps.get_model("analytics", "Group")
+    Student = apps.get_model("analytics", "Student")
+    Discipline = apps.get_model("analytics", "Discipline")
+    Teacher = apps.get_model("analytics", "Teacher")
+    Semester = apps.get_model("analytics", "Semester")
+    Result = apps.get_model("analytics", "Result")
+    TeacherUserLink = apps.get_model("analytics", "TeacherUserLink")
+
+    teachers = _duplicates(Teacher, ("full_name",))
+    _repoint_results(Result, "teacher_id", teachers)
+    for dup_id, keep_id in teachers.items():
+        TeacherUserLink.objects.filter(teacher_id=dup_id).update(teacher_id=keep_id)
+    Teacher.objects.filter(id__in=list(teachers)).delete()
+
+    disciplines = _duplicates(Discipline, ("name",))
+    _repoint_results(Result, "discipline_id", disciplines)
+    Discipline.objects.filter(id__in=list(disciplines)).delete()
+
+    semesters = _duplicates(Semester, ("year", "term"))
+    _repoint_results(Result, "semester_id", semesters)
+    Semester.objects.filter(id__in=list(semesters)).delete()
+
+    groups = _duplicates(Group, ("name",))
+    by_keep = defaultdict(list)
+    for dup_id, keep_id in groups.items():
+        by_keep[keep_id].append(dup_id)
+    for keep_id, dup_ids in by_keep.items():
+        Student.objects.filter(group_id__in=dup_ids).update(group_id=keep_id)
+    Group.objects.filter(id__in=list(groups)).delete()
+
+    students = _duplicates(Student, ("full_name", "group_id"))
+    _repoint_results(Result, "student_id", students)
+    Student.objects.filter(id__in=list(students)).delete()
+
+    # ограничение на Result не ловит дубли с пустым преподавателем (NULL)
+    _delete_null_teacher_duplicates(Result)
+
+
+def _delete_null_teacher_duplicates(Result):
+    latest = {}
+    stale = []
+    qs = Result.objects.filter(teacher_id__isnull=True).order_by("id").values_list("id", *RESULT_KEY)
+    for pk, *key in qs:
+        key = tuple(key)
+        if key in latest:
+            stale.append(latest[key])
+        latest[key] = pk
+    Result.objects.filter(id__in=stale).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_importbatch_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
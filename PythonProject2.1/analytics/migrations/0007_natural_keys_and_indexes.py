@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_merge_duplicate_natural_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='discipline',
+            name='name',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='name',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='teacher',
+            name='full_name',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['semester', 'discipline', 'teacher'], name='result_sem_disc_teacher_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['discipline', 'teacher'], name='result_disc_teacher_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['teacher', 'semester'], name='result_teacher_sem_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='semester',
+            constraint=models.UniqueConstraint(fields=('year', 'term'), name='uniq_semester_year_term'),
+        ),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('group', 'full_name'), name='uniq_student_group_full_name'),
+        ),
+    ]
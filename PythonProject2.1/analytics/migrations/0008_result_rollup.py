@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:36
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+import django.db.models.deletion
+
+
+def fill_rollups(apps, schema_editor):
+    Result = apps.get_model("analytics", "Result")
+    ResultRollup = apps.get_model("analytics", "ResultRollup")
+    totals = (
+        Result.objects
+        .values("discipline_id", "teacher_id", "semester_id", group_id=F("student__group_id"))
+        .annotate(results_count=Count("id"), grade_sum=Sum("grade"), attendance_sum=Sum("attendance_percent"))
+        .order_by()
+    )
+    ResultRollup.objects.bulk_create(
+        (ResultRollup(**row) for row in totals.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_natural_keys_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('results_count', models.PositiveIntegerField(default=0, verbose_name='Оценок')),
+                ('grade_sum', models.FloatField(default=0, verbose_name='Сумма оценок')),
+                ('attendance_sum', models.FloatField(default=0, verbose_name='Сумма посещаемости')),
+                ('discipline', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='analytics.discipline', verbose_name='Дисциплина')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='analytics.group', verbose_name='Группа')),
+                ('semester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='analytics.semester', verbose_name='Семестр')),
+                ('teacher', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rollups', to='analytics.teacher', verbose_name='Преподаватель')),
+            ],
+            options={
+                'verbose_name': 'Сводка результатов',
+                'verbose_name_plural': 'Сводки результатов',
+                'indexes': [models.Index(fields=['semester', 'discipline', 'teacher'], name='rollup_sem_disc_teacher_idx'), models.Index(fields=['discipline', 'teacher'], name='rollup_disc_teacher_idx'), models.Index(fields=['teacher', 'semester'], name='rollup_teacher_sem_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resultrollup',
+            constraint=models.UniqueConstraint(fields=('group', 'discipline', 'teacher', 'semester'), name='uniq_rollup_group_discipline_teacher_semester'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:44
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_student_averages(apps, schema_editor):
+    Result = apps.get_model("analytics", "Result")
+    Student = apps.get_model("analytics", "Student")
+    totals = (
+        Result.objects
+        .values("student_id")
+        .annotate(count=Count("id"), grade_sum=Sum("grade"), attendance_sum=Sum("attendance_percent"))
+        .order_by()
+    )
+    students = [
+        Student(
+            id=row["student_id"],
+            results_count=row["count"],
+            grade_sum=row["grade_sum"],
+            attendance_sum=row["attendance_sum"],
+            avg_grade=row["grade_sum"] / row["count"],
+            avg_attendance=row["attendance_sum"] / row["count"],
+        )
+        for row in totals.iterator()
+    ]
+    Student.objects.bulk_update(
+        students,
+        ["results_count", "grade_sum", "attendance_sum", "avg_grade", "avg_attendance"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='attendance_sum',
+            field=models.FloatField(default=0, verbose_name='Сумма посещаемости'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='avg_attendance',
+            field=models.FloatField(blank=True, null=True, verbose_name='Средняя посещаемость'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='avg_grade',
+            field=models.FloatField(blank=True, null=True, verbose_name='Средний балл'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='grade_sum',
+            field=models.FloatField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='results_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['group', 'avg_grade', 'full_name', 'id'], name='student_group_avg_idx'),
+        ),
+        migrations.RunPython(fill_student_averages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_notification_counters(apps, schema_editor):
+    Notification = apps.get_model("analytics", "Notification")
+    NotificationCounter = apps.get_model("analytics", "NotificationCounter")
+    counts = (
+        Notification.objects
+        .filter(is_read=False)
+        .values("user_id")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=row["user_id"], unread=row["n"]) for row in counts.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('analytics', '0010_student_averages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_notification_counters, migrations.RunPython.noop),
+    ]
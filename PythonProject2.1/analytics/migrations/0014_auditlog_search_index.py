@@ -0,0 +1,16 @@
+# Полнотекстовый индекс журнала действий (SQLite FTS5), см. analytics/audit_search.py.
+
+from django.db import migrations
+
+from analytics import audit_search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0013_auditlog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(audit_search.create_search_index, audit_search.drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0014_auditlog_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeacherLinkVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveBigIntegerField(default=0, verbose_name='Поколение')),
+            ],
+            options={
+                'verbose_name': 'Версия привязок преподавателей',
+                'verbose_name_plural': 'Версия привязок преподавателей',
+            },
+        ),
+    ]
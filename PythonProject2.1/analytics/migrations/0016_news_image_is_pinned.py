@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0015_teacher_link_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='news/', verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='is_pinned',
+            field=models.BooleanField(default=False, verbose_name='Закрепить (важная)'),
+        ),
+    ]
@@ -1,6 +1,13 @@
+import os
+import time
+
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils import timezone
+from django.utils.deconstruct import deconstructible
 
 class Feedback(models.Model):
     name = models.CharField("Имя", max_length=120)
@@ -16,6 +23,45 @@ class Feedback(models.Model):
     def __str__(self):
         return f"{self.created_at:%Y-%m-%d %H:%M} — {self.name}"
 
+class NotificationQuerySet(models.QuerySet):
+    # массовые операции обходят сигналы, поэтому счётчики непрочитанных
+    # для затронутых пользователей обновляются здесь (см. analytics/notifications.py)
+    def bulk_create(self, objs, *args, **kwargs):
+        from .notifications import change_unread
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        deltas = {}
+        for n in objs:
+            if not n.is_read:
+                deltas[n.user_id] = deltas.get(n.user_id, 0) + 1
+        change_unread(deltas)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .notifications import recount_unread
+
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if "is_read" in fields:
+            recount_unread({n.user_id for n in objs})
+        return rows
+
+    def update(self, **kwargs):
+        from .notifications import recount_unread
+
+        if not {"is_read", "user", "user_id"} & set(kwargs):
+            return super().update(**kwargs)
+        user_ids = set(self.order_by().values_list("user_id", flat=True).distinct())
+        rows = super().update(**kwargs)
+        new_user = kwargs.get("user_id", kwargs.get("user"))
+        if new_user is not None:
+            user_ids.add(getattr(new_user, "pk", new_user))
+        recount_unread(user_ids)
+        return rows
+
+    def mark_read(self):
+        return self.filter(is_read=False).update(is_read=True)
+
+
 class Notification(models.Model):
     TYPE_GRADE = "grade"
     TYPE_REPORT = "report"
@@ -31,6 +77,8 @@ class Notification(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
 
+    objects = NotificationQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
 
@@ -38,6 +86,18 @@ class Notification(models.Model):
         return f"{self.user} - {self.title}"
 
 
+class NotificationCounter(models.Model):
+    # число непрочитанных уведомлений пользователя, чтобы не считать их
+    # COUNT-ом при каждом рендере шаблона
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="notification_counter",
+    )
+    unread = models.IntegerField(default=0)
+
+
 class News(models.Model):
     title = models.CharField(max_length=200)
     body = models.TextField()
@@ -74,7 +134,7 @@ class RolePermissions(models.Model):
 
 
 class Group(models.Model):
-    name = models.CharField(max_length=50)
+    name = models.CharField(max_length=50, unique=True)
     program = models.CharField(max_length=100, blank=True)
     year = models.IntegerField(blank=True, null=True)
 
@@ -83,7 +143,7 @@ class Group(models.Model):
 
 
 class Discipline(models.Model):
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, unique=True)
     department = models.CharField(max_length=200, blank=True)
 
     def __str__(self):
@@ -91,7 +151,7 @@ class Discipline(models.Model):
 
 
 class Teacher(models.Model):
-    full_name = models.CharField(max_length=200)
+    full_name = models.CharField(max_length=200, unique=True)
     department = models.CharField(max_length=200, blank=True)
 
     def __str__(self):
@@ -102,6 +162,11 @@ class Semester(models.Model):
     year = models.IntegerField()
     term = models.CharField(max_length=20)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'term'], name='uniq_semester_year_term'),
+        ]
+
     def __str__(self):
         return f'{self.term} {self.year}'
 
@@ -110,6 +175,23 @@ class Student(models.Model):
     full_name = models.CharField(max_length=200)
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='students')
 
+    # суммы по результатам студента; поддерживаются вместе с ResultRollup
+    # (analytics/rollups.py), средние хранятся для сортировки по индексу
+    results_count = models.PositiveIntegerField('Оценок', default=0)
+    grade_sum = models.FloatField('Сумма оценок', default=0)
+    attendance_sum = models.FloatField('Сумма посещаемости', default=0)
+    avg_grade = models.FloatField('Средний балл', null=True, blank=True)
+    avg_attendance = models.FloatField('Средняя посещаемость', null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'full_name'], name='uniq_student_group_full_name'),
+        ]
+        # постраничный вывод group_detail: ORDER BY avg_grade DESC, full_name, id
+        indexes = [
+            models.Index(fields=['group', 'avg_grade', 'full_name', 'id'], name='student_group_avg_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
 
@@ -133,12 +215,79 @@ class Result(models.Model):
                 name='uniq_result_student_discipline_teacher_semester'
             )
         ]
+        # под фильтры semester/discipline/teacher в dashboard, api_summary и экспортах;
+        # выборки по студенту покрывает индекс уникального ограничения
+        indexes = [
+            models.Index(fields=['semester', 'discipline', 'teacher'], name='result_sem_disc_teacher_idx'),
+            models.Index(fields=['discipline', 'teacher'], name='result_disc_teacher_idx'),
+            models.Index(fields=['teacher', 'semester'], name='result_teacher_sem_idx'),
+        ]
 
     def __str__(self):
         return f'{self.student} – {self.discipline} – {self.grade}'
 
 
+class ResultRollup(models.Model):
+    # Суммы по Result в разрезе (группа, дисциплина, преподаватель, семестр).
+    # Поддерживаются импортом и сигналами Result (см. analytics/rollups.py),
+    # пересчитываются командой rebuild_rollups.
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='rollups', verbose_name='Группа')
+    discipline = models.ForeignKey(Discipline, on_delete=models.CASCADE, related_name='rollups',
+                                   verbose_name='Дисциплина')
+    teacher = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True, blank=True, related_name='rollups',
+                                verbose_name='Преподаватель')
+    semester = models.ForeignKey(Semester, on_delete=models.CASCADE, related_name='rollups', verbose_name='Семестр')
+    results_count = models.PositiveIntegerField('Оценок', default=0)
+    grade_sum = models.FloatField('Сумма оценок', default=0)
+    attendance_sum = models.FloatField('Сумма посещаемости', default=0)
+
+    class Meta:
+        verbose_name = 'Сводка результатов'
+        verbose_name_plural = 'Сводки результатов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['group', 'discipline', 'teacher', 'semester'],
+                name='uniq_rollup_group_discipline_teacher_semester'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['semester', 'discipline', 'teacher'], name='rollup_sem_disc_teacher_idx'),
+            models.Index(fields=['discipline', 'teacher'], name='rollup_disc_teacher_idx'),
+            models.Index(fields=['teacher', 'semester'], name='rollup_teacher_sem_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.group} – {self.discipline} – {self.semester}: {self.results_count}'
+
+
+class DataVersion(models.Model):
+    # Одна строка (id=1): поколение данных о результатах. Растёт после каждого
+    # импорта и каждой правки Result; по нему строятся ETag/Last-Modified.
+    generation = models.PositiveBigIntegerField("Поколение", default=0)
+    updated_at = models.DateTimeField("Изменено", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версия данных"
+
+    def __str__(self):
+        return f"{self.generation} ({self.updated_at:%Y-%m-%d %H:%M:%S})"
+
+    @classmethod
+    def current(cls):
+        version, _ = cls.objects.get_or_create(id=1)
+        return version
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(id=1).update(generation=F("generation") + 1, updated_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(id=1, defaults={"generation": 1})
+
+
 class AuditLog(models.Model):
+    # на SQLite миграции, пересоздающие эту таблицу, должны восстанавливать
+    # триггеры полнотекстового поиска (см. analytics/audit_search.py)
     ACTION_CHOICES = [
         ('upload', 'Загрузка данных'),
         ('export_csv', 'Экспорт CSV'),
@@ -155,12 +304,18 @@ class AuditLog(models.Model):
         verbose_name='Пользователь',
     )
     action = models.CharField('Действие', max_length=20, choices=ACTION_CHOICES)
-    created_at = models.DateTimeField('Время', auto_now_add=True)
+    # не auto_now_add: записи пишутся пачками (analytics/audit.py), время — момент события
+    created_at = models.DateTimeField('Время', default=timezone.now, editable=False)
     details = models.TextField('Подробности', blank=True)
 
     class Meta:
         verbose_name = 'Журнал действий'
         verbose_name_plural = 'Журнал действий'
+        # постраничный вывод по ключу (created_at, id), в т.ч. с фильтром действия
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='auditlog_created_idx'),
+            models.Index(fields=['action', 'created_at', 'id'], name='auditlog_action_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_action_display()} ({self.created_at:%Y-%m-%d %H:%M})"
@@ -188,7 +343,67 @@ class TeacherUserLink(models.Model):
 
     def __str__(self):
         return f'{self.user} → {self.teacher}'
+
+
+class TeacherLinkVersion(models.Model):
+    # Одна строка (id=1): версия привязок пользователей к преподавателям.
+    # Входит в ключи кэша roles.linked_teacher_id. Хранится в БД, а не в кэше,
+    # чтобы смену привязки увидели все процессы (LocMemCache у каждого свой);
+    # процессы перечитывают её раз в ANALYTICS_TEACHER_LINK_VERSION_TTL секунд.
+    generation = models.PositiveBigIntegerField("Поколение", default=0)
+
+    class Meta:
+        verbose_name = "Версия привязок преподавателей"
+        verbose_name_plural = "Версия привязок преподавателей"
+
+    def __str__(self):
+        return str(self.generation)
+
+    @classmethod
+    def current_generation(cls):
+        return cls.objects.filter(id=1).values_list("generation", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        # время в наносекундах, а не +1: после отката транзакции с bump()
+        # следующая версия не совпадёт с той, под которой уже писался кэш
+        generation = time.time_ns()
+        updated = cls.objects.filter(id=1).update(generation=Greatest(F("generation") + 1, Value(generation)))
+        if not updated:
+            cls.objects.get_or_create(id=1, defaults={"generation": generation})
+
+
+@deconstructible
+class ImportFileStorage(FileSystemStorage):
+    # Файлы партий импорта (оценки студентов) лежат вне MEDIA_ROOT:
+    # MEDIA_URL раздаётся без проверки прав. Ссылки на них не выдаются.
+    @property
+    def base_location(self):
+        return getattr(settings, "ANALYTICS_IMPORT_DIR", settings.BASE_DIR / "var" / "imports")
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
 class ImportBatch(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_SKIPPED = "skipped"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_RUNNING, "Выполняется"),
+        (STATUS_DONE, "Завершён"),
+        (STATUS_FAILED, "Ошибка"),
+        (STATUS_SKIPPED, "Пропущен (файл уже загружен)"),
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         null=True,
@@ -203,8 +418,32 @@ class ImportBatch(models.Model):
     total_rows = models.PositiveIntegerField("Строк всего", default=0)
     created_results = models.PositiveIntegerField("Создано записей", default=0)
     updated_results = models.PositiveIntegerField("Обновлено записей", default=0)
+    unchanged_results = models.PositiveIntegerField("Без изменений", default=0)
     error_rows = models.PositiveIntegerField("Ошибок", default=0)
 
+    status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    processed_rows = models.PositiveIntegerField("Обработано строк", default=0)
+    source_file = models.FileField("Исходный файл", storage=ImportFileStorage(), blank=True)
+    started_at = models.DateTimeField("Начало обработки", null=True, blank=True)
+    finished_at = models.DateTimeField("Окончание обработки", null=True, blank=True)
+    # отметка воркера о прогрессе: по ней находятся партии упавших воркеров
+    heartbeat_at = models.DateTimeField("Последний прогресс", null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField("Попыток обработки", default=0)
+    failure = models.TextField("Причина сбоя", blank=True)
+    # текст ошибки -> сколько строк с ней; хранится для всех ошибок,
+    # в том числе сверх лимита сохранённых ImportRowError
+    error_summary = models.JSONField("Сводка ошибок", default=dict, blank=True)
+
+    content_hash = models.CharField("SHA-256 файла", max_length=64, blank=True, db_index=True)
+    duplicate_of = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name="Повтор импорта",
+    )
+
     class Meta:
         ordering = ["-created_at"]
         verbose_name = "Импорт CSV"
@@ -213,6 +452,10 @@ class ImportBatch(models.Model):
     def __str__(self):
         return f"{self.created_at:%Y-%m-%d %H:%M} — {self.file_name}"
 
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED, self.STATUS_SKIPPED)
+
 
 class ImportRowError(models.Model):
     batch = models.ForeignKey(
@@ -0,0 +1,74 @@
+# Счётчик непрочитанных уведомлений: строка NotificationCounter на
+# пользователя, которую поддерживают сигналы Notification (одиночные
+# save/delete) и NotificationQuerySet (bulk_create, update, mark_read),
+# плюс кэш значения с явной инвалидацией при каждом изменении.
+# В LocMemCache инвалидация видна только своему процессу, поэтому у
+# значения есть срок жизни ANALYTICS_UNREAD_CACHE_TIMEOUT.
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .caching import get_cache
+from .models import Notification, NotificationCounter
+
+
+def _key(user_id):
+    return f"analytics:unread:{user_id}"
+
+
+def _invalidate(user_ids):
+    keys = [_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache = get_cache()
+    cache.delete_many(keys)
+    # между удалением и фиксацией транзакции другой запрос мог
+    # прочитать и закэшировать старое значение
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def unread_count(user_id):
+    cache = get_cache()
+    key = _key(user_id)
+    value = cache.get(key)
+    if value is None:
+        value = NotificationCounter.objects.filter(user_id=user_id).values_list("unread", flat=True).first() or 0
+        cache.set(key, value, getattr(settings, "ANALYTICS_UNREAD_CACHE_TIMEOUT", 300))
+    return value
+
+
+def change_unread(deltas):
+    # deltas — {user_id: изменение числа непрочитанных}; строка счётчика
+    # создаётся только при росте: уменьшать отсутствующий (нулевой) нечего,
+    # а при каскадном удалении пользователя её нельзя создавать заново
+    changed = [user_id for user_id, delta in deltas.items() if delta]
+    for user_id in changed:
+        delta = deltas[user_id]
+        if delta > 0:
+            NotificationCounter.objects.get_or_create(user_id=user_id)
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=F("unread") + delta)
+    _invalidate(changed)
+
+
+def recount_unread(user_ids=None):
+    # точный пересчёт по Notification для указанных пользователей (None — для всех)
+    qs = Notification.objects.filter(is_read=False)
+    counters = NotificationCounter.objects.all()
+    if user_ids is not None:
+        user_ids = set(user_ids)
+        if not user_ids:
+            return 0
+        qs = qs.filter(user_id__in=user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+
+    counts = dict(qs.order_by().values("user_id").annotate(n=Count("id")).values_list("user_id", "n"))
+    stale = list(counters.exclude(user_id__in=list(counts)).values_list("user_id", flat=True))
+    counters.filter(user_id__in=stale).update(unread=0)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id, unread=n) for user_id, n in counts.items()],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["unread"],
+    )
+    _invalidate(set(counts) | set(stale))
+    return len(counts)
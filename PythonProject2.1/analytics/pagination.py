@@ -0,0 +1,135 @@
+# Постраничный вывод по ключу (keyset): следующая страница выбирается
+# условием «после последней строки» по индексируемым полям сортировки,
+# без OFFSET и без COUNT по всей выборке. Курсор — значения полей
+# сортировки последней (или первой) строки страницы.
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+DEFAULT_PER_PAGE = 25
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+def _json_default(value):
+    # даты — в ISO с микросекундами: по курсору строки сравниваются на равенство
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} нельзя записать в курсор")
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=_json_default)
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    # испорченный или чужой курсор — просто первая страница
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def _beyond(field, value, descending, nullable, reverse):
+    # строки, идущие после value в порядке сортировки поля;
+    # NULL стоят в конце, а при обратном обходе (reverse) — в начале
+    if value is None:
+        return Q(**{f"{field}__isnull": False}) if reverse else Q(pk__in=[])
+    cond = Q(**{f"{field}__lt" if descending else f"{field}__gt": value})
+    if nullable and not reverse:
+        cond |= Q(**{f"{field}__isnull": True})
+    return cond
+
+
+def _equal(field, value):
+    if value is None:
+        return Q(**{f"{field}__isnull": True})
+    return Q(**{field: value})
+
+
+def _after(keys, values, reverse):
+    # (k1, k2, ...) > (v1, v2, ...) в порядке сортировки; при reverse — «до»
+    condition = Q(pk__in=[])
+    prefix = Q()
+    for (field, descending, nullable), value in zip(keys, values):
+        condition |= prefix & _beyond(field, value, descending != reverse, nullable, reverse)
+        prefix &= _equal(field, value)
+    return condition
+
+
+def _ordering(keys, reverse):
+    out = []
+    for field, descending, nullable in keys:
+        nulls = {}
+        if nullable:
+            nulls = {"nulls_first": True} if reverse else {"nulls_last": True}
+        expr = F(field)
+        out.append(expr.desc(**nulls) if descending != reverse else expr.asc(**nulls))
+    return out
+
+
+def keyset_page(qs, keys, after=None, before=None, per_page=DEFAULT_PER_PAGE):
+    """
+    keys — [(поле, по убыванию)], последним должно идти уникальное поле
+    (обычно id). NULL считаются большими значений и идут в конце.
+    after/before — курсоры из предыдущей страницы (next_cursor/prev_cursor).
+    """
+    fields = [field for field, _ in keys]
+    keys = [(field, descending, qs.model._meta.get_field(field).null) for field, descending in keys]
+    before_values = decode_cursor(before, len(keys))
+    after_values = None if before_values else decode_cursor(after, len(keys))
+    reverse = before_values is not None
+    values = before_values or after_values
+
+    page_qs = qs
+    if values is not None:
+        try:
+            page_qs = page_qs.filter(_after(keys, values, reverse))
+        except (ValidationError, ValueError, TypeError):
+            # значения курсора не подходят к типам полей
+            page_qs, values, reverse = qs, None, False
+    rows = list(page_qs.order_by(*_ordering(keys, reverse))[:per_page + 1])
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+
+    def cursor(row):
+        return encode_cursor([getattr(row, field) for field in fields])
+
+    has_next = more if not reverse else True
+    has_prev = more if reverse else values is not None
+    return KeysetPage(
+        rows,
+        next_cursor=cursor(rows[-1]) if rows and has_next else None,
+        prev_cursor=cursor(rows[0]) if rows and has_prev else None,
+    )
@@ -1,12 +1,158 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group as AuthGroup, Permission
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+from django.utils.functional import cached_property
+
+from .caching import get_cache
+from .models import Teacher, TeacherLinkVersion, TeacherUserLink
+
+TEACHER_GROUP = 'Преподаватель'
+MANAGER_GROUPS = frozenset({'Руководитель', 'Руководитель кафедры', 'Администратор'})
+
+
+class UserRoles:
+    # роли пользователя: имена групп и права читаются одним запросом,
+    # привязанный преподаватель — только при первом обращении
+    def __init__(self, user):
+        self.user = user
+
+    @property
+    def is_authenticated(self):
+        return bool(self.user and self.user.is_authenticated)
+
+    @cached_property
+    def _groups_and_permissions(self):
+        # права — свои и через группы, как у ModelBackend: "app_label.codename"
+        if not self.is_authenticated:
+            return frozenset(), frozenset()
+        groups = (
+            AuthGroup.objects
+            .filter(user=self.user)
+            .annotate(kind=Value('group'), value=F('name'))
+            .order_by()
+            .values_list('kind', 'value')
+        )
+        permissions = (
+            Permission.objects
+            .filter(Q(user=self.user) | Q(group__user=self.user))
+            .annotate(kind=Value('perm'), value=Concat('content_type__app_label', Value('.'), 'codename'))
+            .order_by()
+            .values_list('kind', 'value')
+        )
+        rows = list(groups.union(permissions)) if self.user.is_active else list(groups)
+        return (
+            frozenset(value for kind, value in rows if kind == 'group'),
+            frozenset(value for kind, value in rows if kind == 'perm'),
+        )
+
+    @property
+    def group_names(self):
+        return self._groups_and_permissions[0]
+
+    @property
+    def permissions(self):
+        return self._groups_and_permissions[1]
+
+    def has_perm(self, perm):
+        if not self.is_authenticated or not self.user.is_active:
+            return False
+        return self.user.is_superuser or perm in self.permissions
+
+    @property
+    def is_manager(self):
+        if not self.is_authenticated:
+            return False
+        return self.user.is_superuser or bool(self.group_names & MANAGER_GROUPS)
+
+    @property
+    def is_teacher(self):
+        return TEACHER_GROUP in self.group_names
+
+    @cached_property
+    def teacher_id(self):
+        return linked_teacher_id(self.user) if self.is_authenticated else None
+
+    @cached_property
+    def teacher(self):
+        return Teacher.objects.filter(pk=self.teacher_id).first() if self.teacher_id else None
+
+
+def get_roles(user):
+    # request.user создаётся заново на каждый запрос, поэтому роли,
+    # запомненные на нём, живут ровно один запрос
+    if user is None:
+        return UserRoles(None)
+    roles = getattr(user, '_analytics_roles', None)
+    if roles is None:
+        roles = UserRoles(user)
+        user._analytics_roles = roles
+    return roles
+
+
+def find_linked_teacher_id(user):
+    teacher_id = TeacherUserLink.objects.filter(user=user).values_list('teacher_id', flat=True).first()
+    if teacher_id:
+        return teacher_id
+
+    full_name = (user.get_full_name() or '').strip()
+    if not full_name:
+        return None
+    return Teacher.objects.filter(full_name=full_name).values_list('id', flat=True).first()
+
+
+# Пользователь -> id преподавателя кэшируется между запросами. В ключе —
+# версия привязок из БД (TeacherLinkVersion): изменение TeacherUserLink,
+# Teacher или ФИО пользователя сдвигает её (см. forget_linked_teachers
+# в signals). Чтобы кэш экономил запрос, версия читается из БД не чаще раза
+# в ANALYTICS_TEACHER_LINK_VERSION_TTL секунд на процесс: свой процесс видит
+# смену привязки сразу, остальные — не позже чем через этот интервал.
+NO_TEACHER = 0
+
+_link_version = {'generation': None, 'read_at': 0.0}
+
+
+def teacher_link_generation():
+    now = time.monotonic()
+    ttl = getattr(settings, 'ANALYTICS_TEACHER_LINK_VERSION_TTL', 10)
+    if _link_version['generation'] is None or now - _link_version['read_at'] >= ttl:
+        _link_version['generation'] = TeacherLinkVersion.current_generation()
+        _link_version['read_at'] = now
+    return _link_version['generation']
+
+
+def linked_teacher_id(user):
+    cache = get_cache()
+    key = f'analytics:teacher-of:{teacher_link_generation()}:{user.pk}'
+    teacher_id = cache.get(key)
+    if teacher_id is None:
+        teacher_id = find_linked_teacher_id(user) or NO_TEACHER
+        cache.set(key, teacher_id, getattr(settings, 'ANALYTICS_TEACHER_LINK_CACHE_TIMEOUT', 300))
+    return teacher_id or None
+
+
+def forget_linked_teachers():
+    TeacherLinkVersion.bump()
+    _link_version['generation'] = None
+
+
+def get_linked_teacher(user):
+    return get_roles(user).teacher
+
+
+def get_linked_teacher_id(user):
+    return get_roles(user).teacher_id
+
+
 def is_teacher(user):
-    return bool(user and user.is_authenticated and user.groups.filter(name='Преподаватель').exists())
+    return get_roles(user).is_teacher
 
 
 def is_manager(user):
-    if not user or not user.is_authenticated:
-        return False
+    return get_roles(user).is_manager
 
-    return user.is_superuser or user.groups.filter(
-        name__in=['Руководитель', 'Руководитель кафедры', 'Администратор']
-    ).exists()
 
+def has_perm(user, perm):
+    return get_roles(user).has_perm(perm)
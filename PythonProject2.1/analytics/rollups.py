@@ -0,0 +1,233 @@
+# Сводные суммы по результатам (ResultRollup) для дашборда, api_summary
+# и PDF-отчёта, а также суммы и средние на самом Student. Меняются
+# приращениями: импорт и сигналы Result передают сюда разницу «было/стало»,
+# средние считаются как сумма / количество.
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import DataVersion, Result, ResultRollup, Student
+
+LOOKUP_CHUNK = 500
+STUDENT_FIELDS = ["results_count", "grade_sum", "attendance_sum", "avg_grade", "avg_attendance"]
+# суммы float накапливают погрешность округления, сверяем с допуском
+SUM_TOLERANCE = 1e-6
+
+
+def new_deltas():
+    # ключ (group_id, discipline_id, teacher_id, semester_id) -> [оценок, сумма оценок, сумма посещаемости]
+    return defaultdict(lambda: [0, 0.0, 0.0])
+
+
+def add_result(deltas, key, grade, attendance, sign=1):
+    delta = deltas[key]
+    delta[0] += sign
+    delta[1] += sign * grade
+    delta[2] += sign * attendance
+
+
+def apply_deltas(deltas):
+    deltas = {key: d for key, d in deltas.items() if any(d)}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        existing = {}
+        keys = list(deltas)
+        for i in range(0, len(keys), LOOKUP_CHUNK):
+            part = keys[i:i + LOOKUP_CHUNK]
+            qs = (
+                ResultRollup.objects
+                .select_for_update()
+                .filter(group_id__in={k[0] for k in part}, discipline_id__in={k[1] for k in part})
+                .order_by("id")
+            )
+            for rollup in qs:
+                key = (rollup.group_id, rollup.discipline_id, rollup.teacher_id, rollup.semester_id)
+                if key in deltas:
+                    existing.setdefault(key, rollup)
+
+        to_create = []
+        to_update = []
+        to_delete = []
+        for key, (count, grade_sum, attendance_sum) in deltas.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                if count > 0:
+                    to_create.append(ResultRollup(
+                        group_id=key[0],
+                        discipline_id=key[1],
+                        teacher_id=key[2],
+                        semester_id=key[3],
+                        results_count=count,
+                        grade_sum=grade_sum,
+                        attendance_sum=attendance_sum,
+                    ))
+                continue
+            rollup.results_count += count
+            rollup.grade_sum += grade_sum
+            rollup.attendance_sum += attendance_sum
+            if rollup.results_count <= 0:
+                to_delete.append(rollup.id)
+            else:
+                to_update.append(rollup)
+
+        ResultRollup.objects.bulk_create(to_create, batch_size=LOOKUP_CHUNK)
+        ResultRollup.objects.bulk_update(
+            to_update, ["results_count", "grade_sum", "attendance_sum"], batch_size=LOOKUP_CHUNK
+        )
+        if to_delete:
+            ResultRollup.objects.filter(id__in=to_delete).delete()
+
+
+def _set_student_averages(student):
+    if student.results_count > 0:
+        student.avg_grade = student.grade_sum / student.results_count
+        student.avg_attendance = student.attendance_sum / student.results_count
+    else:
+        # без оценок суммы обнуляем, чтобы не копить погрешность
+        student.results_count = 0
+        student.grade_sum = student.attendance_sum = 0.0
+        student.avg_grade = student.avg_attendance = None
+
+
+def apply_student_deltas(deltas):
+    # ключ — student_id, значения как у new_deltas()
+    deltas = {key: d for key, d in deltas.items() if any(d)}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        keys = list(deltas)
+        students = []
+        for i in range(0, len(keys), LOOKUP_CHUNK):
+            students.extend(
+                Student.objects
+                .select_for_update()
+                .filter(id__in=keys[i:i + LOOKUP_CHUNK])
+                .only("id", "results_count", "grade_sum", "attendance_sum")
+            )
+        for student in students:
+            count, grade_sum, attendance_sum = deltas[student.id]
+            student.results_count += count
+            student.grade_sum += grade_sum
+            student.attendance_sum += attendance_sum
+            _set_student_averages(student)
+        Student.objects.bulk_update(students, STUDENT_FIELDS, batch_size=LOOKUP_CHUNK)
+
+
+def live_rollups():
+    # те же суммы, посчитанные напрямую по Result
+    qs = (
+        Result.objects
+        .values("discipline_id", "teacher_id", "semester_id", group_id=F("student__group_id"))
+        .annotate(
+            results_count=Count("id"),
+            grade_sum=Sum("grade"),
+            attendance_sum=Sum("attendance_percent"),
+        )
+        .values_list(
+            "group_id", "discipline_id", "teacher_id", "semester_id",
+            "results_count", "grade_sum", "attendance_sum",
+        )
+        .order_by()
+    )
+    return {
+        (group_id, discipline_id, teacher_id, semester_id): (count, grade_sum or 0.0, attendance_sum or 0.0)
+        for group_id, discipline_id, teacher_id, semester_id, count, grade_sum, attendance_sum in qs.iterator()
+    }
+
+
+def stored_rollups():
+    totals = new_deltas()
+    qs = ResultRollup.objects.values_list(
+        "group_id", "discipline_id", "teacher_id", "semester_id",
+        "results_count", "grade_sum", "attendance_sum",
+    )
+    for group_id, discipline_id, teacher_id, semester_id, count, grade_sum, attendance_sum in qs.iterator():
+        # ключи без преподавателя могли задвоиться при удалении в обход сигналов — складываем
+        total = totals[(group_id, discipline_id, teacher_id, semester_id)]
+        total[0] += count
+        total[1] += grade_sum
+        total[2] += attendance_sum
+    return {key: tuple(total) for key, total in totals.items()}
+
+
+def _close(a, b):
+    return abs(a - b) <= SUM_TOLERANCE * max(1.0, abs(a), abs(b))
+
+
+def check_rollups():
+    # список (ключ, в таблице, по Result) для расходящихся ключей
+    live = live_rollups()
+    stored = stored_rollups()
+    mismatches = []
+    for key in sorted(live.keys() | stored.keys(), key=lambda k: tuple(-1 if v is None else v for v in k)):
+        expected = live.get(key)
+        actual = stored.get(key)
+        if expected is None or actual is None:
+            mismatches.append((key, actual, expected))
+        elif expected[0] != actual[0] or not (_close(expected[1], actual[1]) and _close(expected[2], actual[2])):
+            mismatches.append((key, actual, expected))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild_rollups(batch_size=LOOKUP_CHUNK):
+    ResultRollup.objects.all().delete()
+    rollups = [
+        ResultRollup(
+            group_id=key[0],
+            discipline_id=key[1],
+            teacher_id=key[2],
+            semester_id=key[3],
+            results_count=count,
+            grade_sum=grade_sum,
+            attendance_sum=attendance_sum,
+        )
+        for key, (count, grade_sum, attendance_sum) in live_rollups().items()
+    ]
+    ResultRollup.objects.bulk_create(rollups, batch_size=batch_size)
+    # агрегаты в кэше, посчитанные по старым сводкам, больше не читаются
+    DataVersion.bump()
+    return len(rollups)
+
+
+def live_student_totals():
+    qs = (
+        Result.objects
+        .values("student_id")
+        .annotate(count=Count("id"), grade_sum=Sum("grade"), attendance_sum=Sum("attendance_percent"))
+        .values_list("student_id", "count", "grade_sum", "attendance_sum")
+        .order_by()
+    )
+    return {student_id: (count, grade_sum, attendance_sum) for student_id, count, grade_sum, attendance_sum in qs.iterator()}
+
+
+def check_student_averages():
+    # список (student_id, на Student, по Result) для расходящихся студентов
+    live = live_student_totals()
+    mismatches = []
+    qs = Student.objects.values_list("id", "results_count", "grade_sum", "attendance_sum").order_by("id")
+    for student_id, count, grade_sum, attendance_sum in qs.iterator():
+        stored = (count, grade_sum, attendance_sum)
+        expected = live.get(student_id, (0, 0.0, 0.0))
+        if stored[0] != expected[0] or not (_close(stored[1], expected[1]) and _close(stored[2], expected[2])):
+            mismatches.append((student_id, stored, expected))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild_student_averages(batch_size=LOOKUP_CHUNK):
+    Student.objects.update(
+        results_count=0, grade_sum=0, attendance_sum=0, avg_grade=None, avg_attendance=None,
+    )
+    students = []
+    for student_id, (count, grade_sum, attendance_sum) in live_student_totals().items():
+        student = Student(id=student_id, results_count=count, grade_sum=grade_sum, attendance_sum=attendance_sum)
+        _set_student_averages(student)
+        students.append(student)
+    Student.objects.bulk_update(students, STUDENT_FIELDS, batch_size=batch_size)
+    DataVersion.bump()
+    return len(students)
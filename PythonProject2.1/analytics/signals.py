@@ -1,11 +1,200 @@
+from django.conf import settings
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import AuditLog
+from . import audit
+from .models import (
+    DataVersion, Discipline, Group, Notification, Result, ResultRollup, Student, Teacher, TeacherUserLink,
+)
+from .notifications import change_unread
+from .roles import forget_linked_teachers
+from .rollups import add_result, apply_deltas, apply_student_deltas, new_deltas
 
 @receiver(user_logged_in)
 def log_login(sender, request, user, **kwargs):
-    AuditLog.objects.create(user=user, action="login", details="Вход в систему")
+    audit.record(user, "login", "Вход в систему")
 
 @receiver(user_logged_out)
 def log_logout(sender, request, user, **kwargs):
-    AuditLog.objects.create(user=user, action="logout", details="Выход из системы")
+    audit.record(user, "logout", "Выход из системы")
+
+
+# Сводки ResultRollup и средние Student для одиночных save()/delete() (админка, shell).
+# Импорт пишет Result через bulk_create/bulk_update и обновляет сводки сам.
+def _rollup_key(result, group_id):
+    return group_id, result.discipline_id, result.teacher_id, result.semester_id
+
+
+@receiver(pre_save, sender=Result)
+def remember_result_before_save(sender, instance, **kwargs):
+    instance._rollup_old = None
+    if instance.pk:
+        instance._rollup_old = (
+            Result.objects
+            .filter(pk=instance.pk)
+            .values_list("student__group_id", "discipline_id", "teacher_id", "semester_id",
+                         "grade", "attendance_percent", "student_id")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Result)
+def update_rollup_on_save(sender, instance, **kwargs):
+    deltas = new_deltas()
+    student_deltas = new_deltas()
+    old = getattr(instance, "_rollup_old", None)
+    if old:
+        add_result(deltas, old[:4], old[4], old[5], sign=-1)
+        add_result(student_deltas, old[6], old[4], old[5], sign=-1)
+    add_result(deltas, _rollup_key(instance, instance.student.group_id),
+               instance.grade, instance.attendance_percent)
+    add_result(student_deltas, instance.student_id, instance.grade, instance.attendance_percent)
+    apply_deltas(deltas)
+    apply_student_deltas(student_deltas)
+    DataVersion.bump()
+
+
+@receiver(post_delete, sender=Result)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    # при каскадном удалении группы студента уже может не быть —
+    # тогда и сводки группы удаляются каскадом
+    DataVersion.bump()
+    group_id = Student.objects.filter(pk=instance.student_id).values_list("group_id", flat=True).first()
+    if group_id is None:
+        return
+    deltas = new_deltas()
+    add_result(deltas, _rollup_key(instance, group_id), instance.grade, instance.attendance_percent, sign=-1)
+    apply_deltas(deltas)
+    student_deltas = new_deltas()
+    add_result(student_deltas, instance.student_id, instance.grade, instance.attendance_percent, sign=-1)
+    apply_student_deltas(student_deltas)
+
+
+# Перевод студента в другую группу: его результаты переходят в сводки новой группы.
+@receiver(pre_save, sender=Student)
+def remember_student_group(sender, instance, update_fields=None, **kwargs):
+    instance._rollup_group_id = None
+    if instance.pk and (update_fields is None or {"group", "group_id"} & set(update_fields)):
+        instance._rollup_group_id = (
+            Student.objects.filter(pk=instance.pk).values_list("group_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Student)
+def move_rollups_with_student(sender, instance, **kwargs):
+    old_group_id = getattr(instance, "_rollup_group_id", None)
+    if old_group_id is None or old_group_id == instance.group_id:
+        return
+    deltas = new_deltas()
+    results = Result.objects.filter(student_id=instance.pk).values_list(
+        "discipline_id", "teacher_id", "semester_id", "grade", "attendance_percent",
+    )
+    for discipline_id, teacher_id, semester_id, grade, attendance in results.iterator():
+        add_result(deltas, (old_group_id, discipline_id, teacher_id, semester_id), grade, attendance, sign=-1)
+        add_result(deltas, (instance.group_id, discipline_id, teacher_id, semester_id), grade, attendance)
+    apply_deltas(deltas)
+    DataVersion.bump()
+
+
+# Удаление преподавателя: его результаты остаются с teacher = NULL (SET_NULL),
+# поэтому сводки заранее переносятся в ключи без преподавателя, а не обнуляют
+# teacher_id у своих строк, давая дубли рядом с уже существующими.
+@receiver(pre_delete, sender=Teacher)
+def merge_rollups_of_teacher(sender, instance, **kwargs):
+    deltas = new_deltas()
+    rollups = ResultRollup.objects.filter(teacher_id=instance.pk).values_list(
+        "group_id", "discipline_id", "semester_id", "results_count", "grade_sum", "attendance_sum",
+    )
+    for group_id, discipline_id, semester_id, count, grade_sum, attendance_sum in rollups.iterator():
+        for teacher_id, sign in ((instance.pk, -1), (None, 1)):
+            delta = deltas[(group_id, discipline_id, teacher_id, semester_id)]
+            delta[0] += sign * count
+            delta[1] += sign * grade_sum
+            delta[2] += sign * attendance_sum
+    apply_deltas(deltas)
+
+
+# Агрегаты в кэше хранят названия групп, дисциплин, ФИО и кафедры, поэтому
+# их переименование тоже меняет поколение данных.
+CACHED_NAME_FIELDS = {
+    Group: ("name",),
+    Discipline: ("name", "department"),
+    Teacher: ("full_name", "department"),
+}
+
+
+@receiver(pre_save, sender=Group)
+@receiver(pre_save, sender=Discipline)
+@receiver(pre_save, sender=Teacher)
+def remember_cached_names(sender, instance, **kwargs):
+    instance._cached_names = None
+    if instance.pk:
+        instance._cached_names = (
+            sender.objects.filter(pk=instance.pk).values_list(*CACHED_NAME_FIELDS[sender]).first()
+        )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Discipline)
+@receiver(post_save, sender=Teacher)
+def bump_on_rename(sender, instance, **kwargs):
+    old = getattr(instance, "_cached_names", None)
+    if old is None:
+        return
+    if old != tuple(getattr(instance, field) for field in CACHED_NAME_FIELDS[sender]):
+        DataVersion.bump()
+
+
+@receiver(post_delete, sender=Teacher)
+def bump_on_teacher_delete(sender, **kwargs):
+    # результаты остаются без преподавателя (SET_NULL) без сигналов Result
+    DataVersion.bump()
+
+
+# Счётчик непрочитанных для одиночных save()/delete() уведомлений;
+# массовые операции обновляет NotificationQuerySet.
+@receiver(pre_save, sender=Notification)
+def remember_notification_before_save(sender, instance, **kwargs):
+    instance._unread_old = None
+    if instance.pk:
+        instance._unread_old = (
+            Notification.objects.filter(pk=instance.pk).values_list("user_id", "is_read").first()
+        )
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_on_save(sender, instance, **kwargs):
+    deltas = {}
+    old = getattr(instance, "_unread_old", None)
+    if old and not old[1]:
+        deltas[old[0]] = -1
+    if not instance.is_read:
+        deltas[instance.user_id] = deltas.get(instance.user_id, 0) + 1
+    change_unread(deltas)
+
+
+@receiver(post_delete, sender=Notification)
+def update_unread_on_delete(sender, instance, **kwargs):
+    if not instance.is_read:
+        change_unread({instance.user_id: -1})
+
+
+# Кэш «пользователь -> преподаватель» (roles.linked_teacher_id): привязки
+# и ФИО преподавателей меняются редко, поэтому сбрасывается целиком.
+@receiver(post_save, sender=TeacherUserLink)
+@receiver(post_delete, sender=TeacherUserLink)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def forget_teacher_links(sender, **kwargs):
+    forget_linked_teachers()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_user_teacher(sender, instance, created=False, update_fields=None, **kwargs):
+    # запасное сопоставление идёт по ФИО; вход (last_login) его не меняет,
+    # а у нового пользователя записей в кэше ещё нет
+    if created:
+        return
+    if update_fields is None or {"first_name", "last_name"} & set(update_fields):
+        forget_linked_teachers()
+
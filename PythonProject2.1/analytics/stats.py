@@ -0,0 +1,124 @@
+# Разбивки для дашборда и PDF-отчёта: средний балл по группам, дисциплинам
+# и годам. Считаются одним сгруппированным запросом по сводкам ResultRollup,
+# дальше — сложение в Python; возвращаются обычные списки словарей.
+from django.db.models import Count, Q, Sum
+
+
+def _entry(totals, key, name):
+    entry = totals.get(key)
+    if entry is None:
+        entry = totals[key] = {"id": key, "name": name, "grade_sum": 0.0, "results_count": 0}
+    return entry
+
+
+def _finish(entries):
+    out = []
+    for entry in entries:
+        grade_sum = entry.pop("grade_sum")
+        entry["avg_grade"] = grade_sum / entry["results_count"] if entry["results_count"] else None
+        out.append(entry)
+    return out
+
+
+def compute_breakdowns(rollups_qs):
+    """
+    rollups_qs — уже отфильтрованные ResultRollup (семестр, дисциплина,
+    преподаватель, область видимости преподавателя). Возвращает словарь:
+    groups / disciplines — [{"id", "name", "avg_grade", "results_count"}] по имени,
+    years — [{"year", "avg_grade", "count"}] по возрастанию года.
+    """
+    rows = (
+        rollups_qs
+        .values("group_id", "group__name", "discipline_id", "discipline__name", "semester__year")
+        .annotate(grade_sum=Sum("grade_sum"), results_count=Sum("results_count"))
+        .order_by()
+    )
+
+    groups = {}
+    disciplines = {}
+    years = {}
+    for row in rows:
+        grade_sum = row["grade_sum"] or 0.0
+        count = row["results_count"] or 0
+        targets = (
+            _entry(groups, row["group_id"], row["group__name"]),
+            _entry(disciplines, row["discipline_id"], row["discipline__name"]),
+            _entry(years, row["semester__year"], row["semester__year"]),
+        )
+        for entry in targets:
+            entry["grade_sum"] += grade_sum
+            entry["results_count"] += count
+
+    return {
+        "groups": _finish(sorted(groups.values(), key=lambda e: e["name"])),
+        "disciplines": _finish(sorted(disciplines.values(), key=lambda e: e["name"])),
+        "years": [
+            {"year": e["id"], "avg_grade": e["avg_grade"], "count": e["results_count"]}
+            for e in _finish(sorted(years.values(), key=lambda e: e["id"]))
+        ],
+    }
+
+
+def grade_distribution(results_qs):
+    # гистограмма оценок: [{"grade", "cnt"}] по возрастанию оценки
+    return list(
+        results_qs
+        .values("grade")
+        .annotate(cnt=Count("id"))
+        .order_by("grade")
+    )
+
+
+def _rollup_averages(qs):
+    # results_count — поле сводки, поэтому итог называется count
+    return qs.annotate(
+        count=Sum("results_count"),
+        avg_grade=Sum("grade_sum") / Sum("results_count"),
+        avg_attendance=Sum("attendance_sum") / Sum("results_count"),
+    )
+
+
+def at_risk_groups(rollups_qs, grade_below, attendance_below, limit=10):
+    # группы со средним баллом или посещаемостью ниже порога, худшие сначала
+    qs = _rollup_averages(rollups_qs.values("group_id", "group__name"))
+    return list(
+        qs
+        .filter(Q(avg_grade__lt=grade_below) | Q(avg_attendance__lt=attendance_below))
+        .order_by("avg_grade", "avg_attendance", "group__name")[:limit]
+    )
+
+
+def teacher_ranking(rollups_qs, limit=None):
+    # преподаватели по убыванию среднего балла; результаты без преподавателя не учитываются
+    qs = _rollup_averages(
+        rollups_qs
+        .filter(teacher__isnull=False)
+        .values("teacher_id", "teacher__full_name")
+    ).order_by("-avg_grade", "teacher__full_name")
+    return list(qs[:limit] if limit else qs)
+
+
+def department_stats(rollups_qs):
+    # кафедра результата — кафедра дисциплины; дисциплины без кафедры дают строку ""
+    return list(
+        _rollup_averages(rollups_qs.values("discipline__department"))
+        .order_by("discipline__department")
+    )
+
+
+def discipline_stats(rollups_qs):
+    return list(
+        _rollup_averages(rollups_qs.values("discipline_id", "discipline__name", "discipline__department"))
+        .order_by("discipline__name")
+    )
+
+
+def teacher_stats(rollups_qs):
+    # все преподаватели по ФИО; результаты без преподавателя не учитываются
+    return list(
+        _rollup_averages(
+            rollups_qs
+            .filter(teacher__isnull=False)
+            .values("teacher_id", "teacher__full_name", "teacher__department")
+        ).order_by("teacher__full_name")
+    )
@@ -0,0 +1,78 @@
+# Генератор синтетических CSV в формате выгрузки результатов
+# (group;student;discipline;teacher;year;term;grade;attendance)
+# для бенчмарков импорта.
+import random
+
+HEADER = ["group", "student", "discipline", "teacher", "year", "term", "grade", "attendance"]
+
+LAST_NAMES = [
+    "Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов",
+    "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров",
+]
+FIRST_NAMES = ["Александр", "Мария", "Дмитрий", "Анна", "Сергей", "Елена", "Иван", "Ольга"]
+MIDDLE_NAMES = ["Александрович", "Сергеевна", "Иванович", "Дмитриевна", "Петрович", "Николаевна"]
+PROGRAMS = ["ИС", "ПИ", "ИЗДтс", "ЭК", "ЮР", "МН"]
+
+# сколько результатов в среднем на одного студента: 8 дисциплин x 5 семестров
+DISCIPLINES_PER_TERM = 8
+TERMS_PER_STUDENT = 5
+STUDENTS_PER_GROUP = 25
+DISCIPLINES = 120
+TEACHERS = 150
+
+
+def _student_name(i):
+    return (
+        f"{LAST_NAMES[i % len(LAST_NAMES)]} "
+        f"{FIRST_NAMES[i // len(LAST_NAMES) % len(FIRST_NAMES)]} "
+        f"{MIDDLE_NAMES[i % len(MIDDLE_NAMES)]} {i}"
+    )
+
+
+def _group_name(g):
+    return f"{PROGRAMS[g % len(PROGRAMS)]}-{20 + g % 5}.{g}"
+
+
+def iter_synthetic_rows(rows, seed=1):
+    # У каждой группы свой учебный план: в каждом семестре 8 дисциплин,
+    # у дисциплины в группе закреплён один преподаватель. Ключи
+    # (студент, дисциплина, преподаватель, семестр) не повторяются.
+    rnd = random.Random(seed)
+    produced = 0
+    student = 0
+    while produced < rows:
+        group = student // STUDENTS_PER_GROUP
+        start_year = 2019 + group % 5
+        group_name = _group_name(group)
+        student_name = _student_name(student)
+        ability = rnd.gauss(0, 0.6)
+
+        for term_no in range(TERMS_PER_STUDENT):
+            year = start_year + term_no // 2
+            term = str(term_no % 2 + 1)
+            for k in range(DISCIPLINES_PER_TERM):
+                discipline = (group * 7 + term_no * DISCIPLINES_PER_TERM + k) % DISCIPLINES
+                teacher = (discipline * 3 + group) % TEACHERS
+                grade = min(5, max(2, round(4 + ability + rnd.gauss(0, 0.7))))
+                attendance = min(100, max(0, round(rnd.gauss(85 + ability * 10, 12))))
+                yield [
+                    group_name,
+                    student_name,
+                    f"Дисциплина {discipline}",
+                    f"Преподаватель {teacher} П.П.",
+                    str(year),
+                    term,
+                    f"{grade}.0",
+                    f"{attendance}.0",
+                ]
+                produced += 1
+                if produced >= rows:
+                    return
+        student += 1
+
+
+def write_synthetic_csv(f, rows, seed=1):
+    # f — текстовый файл; пишем построчно, без сборки в памяти
+    f.write(";".join(HEADER) + "\n")
+    for row in iter_synthetic_rows(rows, seed):
+        f.write(";".join(row) + "\n")
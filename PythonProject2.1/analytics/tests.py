@@ -1,3 +1,1559 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import addModuleCleanup, mock, skipUnless
+
+from django.apps import apps
+from django.conf import settings as django_settings
+from django.contrib.auth.models import Permission, User
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Avg, Count, F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import columnar
+from .audit import AuditWriter
+from .audit_search import search as search_audit
+from .caching import get_cache
+from .context_processors import unread_notifications
+from .models import (
+    AuditLog,
+    DataVersion,
+    Discipline,
+    Group,
+    ImportBatch,
+    ImportRowError,
+    Notification,
+    NotificationCounter,
+    Result,
+    ResultRollup,
+    Semester,
+    Student,
+    Teacher,
+    TeacherLinkVersion,
+    TeacherUserLink,
+)
+from .import_parsing import parse_parallel, parse_rows
+from .importer import ERROR_SUMMARY_LIMIT, OTHER_ERRORS, TEXT_LIMITS, ResultImporter, iter_lines, parse_stream, preview_file, read_csv_rows
+from .jobs import claim_next_batch, create_batch, enqueue_import, release_stale_batches, run_batch
+from .notifications import recount_unread
+from .pagination import keyset_page
+from .rollups import check_rollups, check_student_averages
+from .stats import compute_breakdowns, department_stats, discipline_stats, teacher_ranking, teacher_stats
+from .trends import compute_trends
+
+
+def setUpModule():
+    # журнал действий (вход, экспорт) пишется синхронно, в транзакции теста
+    audit_sync = override_settings(ANALYTICS_AUDIT_SYNC=True)
+    audit_sync.enable()
+    addModuleCleanup(audit_sync.disable)
+
+
+CSV_HEADER = "group;student;discipline;teacher;year;term;grade;attendance"
+
+
+def csv_file(*lines):
+    return io.BytesIO("\n".join((CSV_HEADER,) + lines).encode("utf-8"))
+
+
+def run_import(file, workers=1, **kwargs):
+    batch = ImportBatch.objects.create(file_name="results.csv")
+    importer = ResultImporter(batch, **kwargs).run_parsed(parse_stream(file, workers))
+    batch.refresh_from_db()
+    return importer, batch
+
+
+def counters(batch):
+    return {
+        "total": batch.total_rows,
+        "created": batch.created_results,
+        "updated": batch.updated_results,
+        "unchanged": batch.unchanged_results,
+        "errors": batch.error_rows,
+    }
+
+
+class StreamingReadTests(TestCase):
+    # BOM, CRLF, кириллица и перевод строки внутри кавычек
+    content = "\ufeff" + "\r\n".join((
+        CSV_HEADER,
+        "ИС-21;Иванов Иван;Математика;Петров П.П.;2024;осень;4;90",
+        'ИС-21;"Щукина\r\nЁлка";"Физика; лаб.";;2024;весна;5;100',
+        "ИС-21;Юдин;Химия;;2024;осень;3;",
+    )) + "\r\n"
+
+    def chunks(self, data, size):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def test_rows_match_whole_file_reader(self):
+        data = self.content.encode("utf-8")
+        expected = list(csv.DictReader(io.StringIO(self.content[1:], newline=""), delimiter=";"))
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(expected[1]["student"], "Щукина\r\nЁлка")
+        # размеры 1..7 режут и BOM, и двухбайтовые буквы на границе кусков
+        for size in range(1, 8):
+            rows = list(csv.DictReader(iter_lines(self.chunks(data, size)), delimiter=";"))
+            self.assertEqual(rows, expected, size)
+
+    def test_read_csv_rows_from_file(self):
+        rows = list(read_csv_rows(io.BytesIO(self.content.encode("utf-8"))))
+        self.assertEqual([row["student"] for row in rows], ["Иванов Иван", "Щукина\r\nЁлка", "Юдин"])
+        self.assertEqual(list(rows[0]), CSV_HEADER.split(";"))
+
+
+class ImporterTests(TestCase):
+    def grade(self, student, discipline):
+        return Result.objects.get(student__full_name=student, discipline__name=discipline).grade
+
+    def test_counters_and_duplicate_keys(self):
+        _, batch = run_import(csv_file(
+            "ИС-21;Иванов;Математика;Петров П.П.;2024;осень;4;90",
+            "ИС-21;Сидоров;Математика;;2024;осень;5;100",
+            "ИС-21;Иванов;Физика;Петров П.П.;2024;осень;3;80",
+            "ИС-21;Иванов;Физика;Петров П.П.;2024;осень;4;85",
+            "ИС-21;Кузнецов;Математика;Петров П.П.;2024;осень;пять;90",
+        ))
+        # повтор ключа в том же файле — обновление, как у update_or_create
+        self.assertEqual(counters(batch), {"total": 5, "created": 3, "updated": 1, "unchanged": 0, "errors": 1})
+        self.assertEqual(Result.objects.count(), 3)
+        self.assertEqual(self.grade("Иванов", "Физика"), 4)
+        self.assertIsNone(Result.objects.get(student__full_name="Сидоров").teacher_id)
+        self.assertFalse(Student.objects.filter(full_name="Кузнецов").exists())
+        self.assertEqual(list(batch.errors.values_list("row_number", flat=True)), [5])
+
+        _, batch = run_import(csv_file(
+            "ИС-21;Иванов;Математика;Петров П.П.;2024;осень;4;90",
+            "ИС-21;Сидоров;Математика;;2024;осень;5;100",
+            "ИС-21;Иванов;Физика;Петров П.П.;2024;осень;5;85",
+            "ИС-21;Новиков;Физика;Петров П.П.;2024;осень;3;70",
+        ))
+        self.assertEqual(counters(batch), {"total": 4, "created": 1, "updated": 1, "unchanged": 2, "errors": 0})
+        self.assertEqual(Result.objects.count(), 4)
+        self.assertEqual(Teacher.objects.count(), 1)
+        self.assertEqual(self.grade("Иванов", "Физика"), 5)
+        self.assertEqual(check_rollups(), [])
+        self.assertEqual(check_student_averages(), [])
+
+    def test_row_failing_on_write_does_not_sink_batch(self):
+        # 10**20 проходит разбор, но не помещается в INTEGER SQLite:
+        # пачка откатывается и пишется построчно
+        importer, batch = run_import(csv_file(
+            "ИС-22;Иванов;Математика;Петров П.П.;2024;осень;4;90",
+            f"ИС-22;Сидоров;Математика;Петров П.П.;{10 ** 20};осень;5;100",
+            "ИС-22;Новиков;Математика;Петров П.П.;2024;осень;3;70",
+        ))
+        self.assertEqual(counters(batch), {"total": 3, "created": 2, "updated": 0, "unchanged": 0, "errors": 1})
+        self.assertEqual(list(batch.errors.values_list("row_number", flat=True)), [2])
+        # группа и преподаватель из отменённой пачки созданы заново, а не взяты из кэша ключей
+        self.assertEqual(
+            sorted(Result.objects.values_list("student__full_name", "student__group__name", "teacher__full_name")),
+            [("Иванов", "ИС-22", "Петров П.П."), ("Новиков", "ИС-22", "Петров П.П.")],
+        )
+        self.assertEqual(Semester.objects.count(), 1)
+        self.assertEqual(check_rollups(), [])
+
+
+class ImportErrorsTests(TestCase):
+    @override_settings(ANALYTICS_IMPORT_MAX_STORED_ERRORS=3)
+    def test_stored_errors_capped_and_summary_complete(self):
+        # у каждой строки свой текст ошибки: сводка упирается в ERROR_SUMMARY_LIMIT
+        bad = ERROR_SUMMARY_LIMIT + 5
+        lines = [f"ИС-21;Студент {i};Математика;;2024;осень;x{i};90" for i in range(bad)]
+        lines.insert(1, "ИС-21;Иванов;Математика;;2024;осень;4;90")
+        _, batch = run_import(csv_file(*lines), batch_size=7)
+
+        self.assertEqual(counters(batch), {"total": bad + 1, "created": 1, "updated": 0, "unchanged": 0, "errors": bad})
+        self.assertEqual(list(batch.errors.values_list("row_number", flat=True)), [1, 3, 4])
+        self.assertIn("Студент 0", batch.errors.first().raw_row)
+        self.assertEqual(len(batch.error_summary), ERROR_SUMMARY_LIMIT + 1)
+        self.assertEqual(batch.error_summary[OTHER_ERRORS], 5)
+        self.assertEqual(sum(batch.error_summary.values()), bad)
+        self.assertEqual(batch.error_summary["could not convert string to float: 'x0'"], 1)
+
+
+class DuplicateUploadTests(TestCase):
+    content = csv_file("ИС-21;Иванов;Математика;;2024;осень;4;90").getvalue()
+
+    def upload(self, content=None, force=False):
+        return create_batch(None, ContentFile(content or self.content, name="results.csv"), force=force)
+
+    def test_identical_file_skipped_unless_forced(self):
+        first = self.upload()
+        self.assertEqual(first.status, ImportBatch.STATUS_PENDING)
+        self.assertEqual(len(first.content_hash), 64)
+        # пока первая партия не завершилась, повтор не пропускается
+        self.assertEqual(self.upload().status, ImportBatch.STATUS_PENDING)
+        run_batch(first, io.BytesIO(self.content))
+
+        repeat = self.upload()
+        self.assertEqual(repeat.status, ImportBatch.STATUS_SKIPPED)
+        self.assertEqual(repeat.duplicate_of, first)
+        self.assertIsNotNone(repeat.finished_at)
+
+        forced = self.upload(force=True)
+        self.assertEqual(forced.status, ImportBatch.STATUS_PENDING)
+        self.assertIsNone(forced.duplicate_of)
+        run_batch(forced, io.BytesIO(self.content))
+        forced.refresh_from_db()
+        self.assertEqual((forced.created_results, forced.unchanged_results), (0, 1))
+        # ссылка — на последний успешный импорт того же файла
+        self.assertEqual(self.upload().duplicate_of, forced)
+
+    def test_other_or_failed_files_not_skipped(self):
+        other = self.content.replace(b"4;90", b"5;90")
+        self.assertEqual(self.upload(other).status, ImportBatch.STATUS_PENDING)
+        failed = self.upload()
+        ImportBatch.objects.filter(id=failed.id).update(status=ImportBatch.STATUS_FAILED)
+        self.assertEqual(self.upload().status, ImportBatch.STATUS_PENDING)
+
+
+class PreviewTests(TestCase):
+    def table_sizes(self):
+        return {
+            model._meta.label: model._default_manager.count()
+            for model in apps.get_models()
+            if model._meta.managed
+        }
+
+    def test_preview_writes_nothing_and_matches_import(self):
+        run_import(csv_file(
+            "ИС-21;Иванов;Математика;Петров П.П.;2024;осень;4;90",
+            "ИС-21;Сидоров;Математика;;2024;осень;5;100",
+        ))
+        file = csv_file(
+            "ИС-21;Иванов;Математика;Петров П.П.;2024;осень;4;90",
+            "ИС-21;Сидоров;Математика;;2024;осень;3;100",
+            "ИС-22;Орлов;Физика;Смирнова А.А.;2024;весна;5;95",
+            "ИС-22;Орлов;Физика;Смирнова А.А.;2024;весна;4;95",
+            "ИС-22;Орлов;Химия;;2025;осень;4;80",
+            "ИС-22;Белов;Химия;;2025;осень;;80",
+        )
+        before = self.table_sizes()
+        with CaptureQueriesContext(connection) as ctx:
+            preview, sample = preview_file(file)
+        self.assertEqual(self.table_sizes(), before)
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].split()[0].upper() in ("INSERT", "UPDATE", "DELETE")]
+        self.assertEqual(writes, [])
+        self.assertEqual([row.student for row in sample], ["Иванов", "Сидоров", "Орлов", "Орлов", "Орлов"])
+        self.assertEqual(len(preview.error_samples), 1)
+
+        file.seek(0)
+        importer, batch = run_import(file)
+        self.assertEqual(
+            (preview.total, preview.created, preview.updated, preview.unchanged, preview.errors),
+            (importer.total, importer.created, importer.updated, importer.unchanged, importer.errors),
+        )
+        self.assertEqual(counters(batch), {"total": 6, "created": 2, "updated": 2, "unchanged": 1, "errors": 1})
+        after = self.table_sizes()
+        self.assertEqual(preview.new_objects, {
+            kind: after[label] - before[label]
+            for kind, label in (
+                ("groups", "analytics.Group"),
+                ("students", "analytics.Student"),
+                ("disciplines", "analytics.Discipline"),
+                ("teachers", "analytics.Teacher"),
+                ("semesters", "analytics.Semester"),
+            )
+        })
+        self.assertEqual(preview.new_objects["students"], 1)
+
+
+class ParallelParsingTests(TestCase):
+    # кавычки с переводом строки внутри поля, пустые строки и ошибки
+    # на границах блоков по два ряда
+    content = "\n".join((
+        CSV_HEADER,
+        'ИС-21;Иванов;"Математика\nи логика";Петров П.П.;2024;осень;4;90',
+        "ИС-21;Сидоров;Физика;;2024;осень;пять;100",
+        '"ИС-21";"Новиков ""мл.""";"Физика";"";2024;"осень\n\nвесна";3;',
+        "",
+        "ИС-21;Кузнецов;Физика;;две тысячи;осень;3;70",
+        'ИС-21;"Орлов\n";Химия;Петров П.П.;2024;осень;5;95',
+        "ИС-21;Иванов;Физика;Петров П.П.;2024;осень;4",
+    )).encode("utf-8")
+
+    def serial(self):
+        return [
+            (idx, str(row) if error else None, parsed, error)
+            for idx, row, parsed, error in parse_rows(read_csv_rows(io.BytesIO(self.content)), TEXT_LIMITS)
+        ]
+
+    def test_pool_matches_serial_parsing(self):
+        lines = iter_lines([self.content])
+        parallel = list(parse_parallel(lines, TEXT_LIMITS, workers=2, block_rows=2))
+        serial = self.serial()
+        self.assertEqual(parallel, serial)
+        self.assertEqual([idx for idx, _, _, error in serial if error], [2, 4])
+        self.assertEqual(serial[0][2].discipline, "Математика\nи логика")
+
+    def test_pool_gives_same_counters(self):
+        _, serial = run_import(io.BytesIO(self.content))
+        Result.objects.all().delete()
+        Student.objects.all().delete()
+        _, parallel = run_import(io.BytesIO(self.content), workers=2)
+        self.assertEqual(counters(parallel), counters(serial))
+        self.assertEqual(parallel.error_summary, serial.error_summary)
+        self.assertEqual(
+            list(parallel.errors.values_list("row_number", "error")),
+            list(serial.errors.values_list("row_number", "error")),
+        )
+        self.assertEqual(counters(serial), {"total": 6, "created": 4, "updated": 0, "unchanged": 0, "errors": 2})
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.import_dir = os.path.realpath(tmp.name)
+        settings = override_settings(ANALYTICS_IMPORT_DIR=self.import_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def enqueue(self, content):
+        file = ContentFile(content, name="results.csv")
+        return enqueue_import(create_batch(None, file), file)
+
+    def test_queued_file_is_private_and_removed_after_import(self):
+        batch = self.enqueue(csv_file("ИС-21;Иванов;Математика;;2024;осень;4;90").getvalue())
+        path = batch.source_file.path
+        self.assertTrue(path.startswith(self.import_dir + os.sep))
+        self.assertFalse(path.startswith(os.path.realpath(django_settings.MEDIA_ROOT)))
+        with self.assertRaises(ValueError):
+            batch.source_file.url
+
+        run_batch(claim_next_batch())
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, ImportBatch.STATUS_DONE)
+        self.assertEqual(batch.source_file.name, "")
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(ANALYTICS_IMPORT_STALE_AFTER=60, ANALYTICS_IMPORT_MAX_ATTEMPTS=2)
+    def test_batches_of_crashed_workers_are_requeued_then_failed(self):
+        batch = self.enqueue(csv_file("ИС-21;Иванов;Математика;;2024;осень;4;90").getvalue())
+        path = batch.source_file.path
+        self.assertEqual(claim_next_batch().id, batch.id)
+        self.assertEqual(release_stale_batches(), 0)
+
+        # воркер упал посреди импорта
+        ImportRowError.objects.create(batch=batch, row_number=1, error="Ошибка")
+        ImportBatch.objects.filter(id=batch.id).update(heartbeat_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(claim_next_batch().id, batch.id)
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.attempts), (ImportBatch.STATUS_RUNNING, 2))
+        self.assertFalse(batch.errors.exists())
+
+        ImportBatch.objects.filter(id=batch.id).update(heartbeat_at=timezone.now() - timedelta(minutes=2))
+        self.assertIsNone(claim_next_batch())
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, ImportBatch.STATUS_FAILED)
+        self.assertIsNotNone(batch.finished_at)
+        self.assertEqual(batch.source_file.name, "")
+        self.assertFalse(os.path.exists(path))
+
+    def test_file_of_failed_import_is_removed(self):
+        batch = self.enqueue(CSV_HEADER.encode("utf-8") + b"\n\xff\xfe")
+        path = batch.source_file.path
+        with self.assertRaises(UnicodeDecodeError):
+            run_batch(claim_next_batch())
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, ImportBatch.STATUS_FAILED)
+        self.assertEqual(batch.source_file.name, "")
+        self.assertFalse(os.path.exists(path))
+
+
+class ImportCommandTests(TestCase):
+    content = csv_file(
+        "ИС-21;Иванов;Математика;Петров П.П.;2024;осень;4;90",
+        "ИС-21;Сидоров;Математика;;2024;осень;пять;100",
+        "ИС-22;Орлов;Физика;;2024;весна;5;95",
+    ).getvalue()
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "results.csv")
+        with open(self.path, "wb") as f:
+            f.write(self.content)
+
+    def command(self, *args):
+        out = io.StringIO()
+        call_command("import_results", self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_matches_web_upload(self):
+        user = User.objects.create_user("manager")
+        output = self.command("--user", "manager")
+        batch = ImportBatch.objects.get()
+        self.assertIn(f"batch #{batch.id}", output)
+        self.assertEqual((batch.status, batch.user, batch.file_name), (ImportBatch.STATUS_DONE, user, "results.csv"))
+        self.assertEqual(counters(batch), {"total": 3, "created": 2, "updated": 0, "unchanged": 0, "errors": 1})
+        self.assertEqual(Result.objects.count(), 2)
+
+        Result.objects.all().delete()
+        Student.objects.all().delete()
+        web = create_batch(user, ContentFile(self.content, name="results.csv"), force=True)
+        run_batch(web, ContentFile(self.content))
+        web.refresh_from_db()
+        self.assertEqual(counters(web), counters(batch))
+        self.assertEqual(web.error_summary, batch.error_summary)
+        self.assertEqual(
+            list(web.errors.values_list("row_number", "error", "raw_row")),
+            list(batch.errors.values_list("row_number", "error", "raw_row")),
+        )
+
+    def test_dry_run_writes_nothing(self):
+        output = self.command("--dry-run")
+        self.assertIn("rows=3 create=2 update=0 unchanged=0 errors=1", output)
+        self.assertFalse(ImportBatch.objects.exists())
+        self.assertFalse(ImportRowError.objects.exists())
+        self.assertFalse(Result.objects.exists())
+        self.assertFalse(Student.objects.exists())
+
+    def test_imported_file_skipped_unless_forced(self):
+        self.command()
+        first = ImportBatch.objects.get()
+
+        self.assertIn("skipped", self.command())
+        skipped = ImportBatch.objects.latest("id")
+        self.assertEqual((skipped.status, skipped.duplicate_of), (ImportBatch.STATUS_SKIPPED, first))
+
+        self.command("--force")
+        forced = ImportBatch.objects.latest("id")
+        self.assertEqual(forced.status, ImportBatch.STATUS_DONE)
+        self.assertEqual(counters(forced), {"total": 3, "created": 0, "updated": 0, "unchanged": 2, "errors": 1})
+        self.assertEqual(Result.objects.count(), 2)
+
+    def test_missing_path(self):
+        with self.assertRaisesMessage(CommandError, "File not found"):
+            call_command("import_results", self.path + ".missing", stdout=io.StringIO())
+        self.assertFalse(ImportBatch.objects.exists())
+
+
+class MergeDuplicatesMigrationTests(TransactionTestCase):
+    migrate_from = [("analytics", "0005_importbatch_content_hash")]
+    migrate_to = [("analytics", "0006_merge_duplicate_natural_keys")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        call_command("migrate", verbosity=0)
+
+    def test_duplicates_merged_into_oldest_rows(self):
+        old = self.migrate(self.migrate_from)
+        model = old.get_model
+        teacher, teacher_dup, other_teacher = (
+            model("analytics", "Teacher").objects.create(full_name=name)
+            for name in ("Петров П.П.", "Петров П.П.", "Смирнова А.А.")
+        )
+        discipline, discipline_dup = (
+            model("analytics", "Discipline").objects.create(name="Математика") for _ in range(2)
+        )
+        semester, semester_dup = (
+            model("analytics", "Semester").objects.create(year=2024, term="осень") for _ in range(2)
+        )
+        group, group_dup = (model("analytics", "Group").objects.create(name="ИС-21") for _ in range(2))
+        Student = model("analytics", "Student")
+        ivanov = Student.objects.create(full_name="Иванов", group=group)
+        ivanov_dup = Student.objects.create(full_name="Иванов", group=group_dup)
+        sidorov = Student.objects.create(full_name="Сидоров", group=group_dup)
+        user = model("auth", "User").objects.create(username="petrov")
+        link = model("analytics", "TeacherUserLink").objects.create(user=user, teacher=teacher_dup)
+
+        Result = model("analytics", "Result")
+
+        def result(student, discipline, teacher, semester, grade):
+            return Result.objects.create(
+                student=student, discipline=discipline, teacher=teacher, semester=semester,
+                grade=grade, attendance_percent=90,
+            ).id
+
+        ids = {
+            # после слияния совпадают по ключу, остаётся более поздний
+            "old": result(ivanov, discipline, teacher, semester, 3),
+            "new": result(ivanov_dup, discipline_dup, teacher_dup, semester_dup, 5),
+            # без преподавателя: ограничение Result их не ловит
+            "null_old": result(sidorov, discipline, None, semester, 4),
+            "null_new": result(sidorov, discipline_dup, None, semester_dup, 2),
+            "plain_null_old": result(ivanov, discipline, None, semester, 3),
+            "plain_null_new": result(ivanov, discipline, None, semester, 4),
+            "other": result(sidorov, discipline, other_teacher, semester, 5),
+        }
+
+        new = self.migrate(self.migrate_to)
+        model = new.get_model
+        self.assertEqual(
+            sorted(model("analytics", "Teacher").objects.values_list("id", flat=True)),
+            [teacher.id, other_teacher.id],
+        )
+        self.assertEqual(list(model("analytics", "Discipline").objects.values_list("id", flat=True)), [discipline.id])
+        self.assertEqual(list(model("analytics", "Semester").objects.values_list("id", flat=True)), [semester.id])
+        self.assertEqual(list(model("analytics", "Group").objects.values_list("id", flat=True)), [group.id])
+        self.assertEqual(
+            sorted(model("analytics", "Student").objects.values_list("id", "group_id")),
+            [(ivanov.id, group.id), (sidorov.id, group.id)],
+        )
+        self.assertEqual(model("analytics", "TeacherUserLink").objects.get(id=link.id).teacher_id, teacher.id)
+        self.assertEqual(
+            sorted(model("analytics", "Result").objects.values_list(
+                "id", "student_id", "discipline_id", "teacher_id", "semester_id", "grade",
+            )),
+            sorted([
+                (ids["new"], ivanov.id, discipline.id, teacher.id, semester.id, 5),
+                (ids["null_new"], sidorov.id, discipline.id, None, semester.id, 2),
+                (ids["plain_null_new"], ivanov.id, discipline.id, None, semester.id, 4),
+                (ids["other"], sidorov.id, discipline.id, other_teacher.id, semester.id, 5),
+            ]),
+        )
+
+
+class BreakdownsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        groups = [Group.objects.create(name=f"ИС-{i}") for i in range(3)]
+        disciplines = [Discipline.objects.create(name=f"Дисциплина {i}") for i in range(4)]
+        teachers = [Teacher.objects.create(full_name=f"Преподаватель {i}") for i in range(2)]
+        semesters = [
+            Semester.objects.create(year=2023, term="1"),
+            Semester.objects.create(year=2023, term="2"),
+            Semester.objects.create(year=2024, term="1"),
+        ]
+        n = 0
+        for g, group in enumerate(groups):
+            for s in range(4):
+                student = Student.objects.create(full_name=f"Студент {g}-{s}", group=group)
+                for d, discipline in enumerate(disciplines):
+                    for semester in semesters:
+                        n += 1
+                        Result.objects.create(
+                            student=student,
+                            discipline=discipline,
+                            teacher=teachers[d % 2],
+                            semester=semester,
+                            grade=2 + n % 4,
+                            attendance_percent=50 + n % 50,
+                        )
+        cls.semester = semesters[0]
+        cls.user = User.objects.create_superuser("manager", "manager@example.com", "pass")
+
+    def assert_matches_results(self, stats, results_qs):
+        groups = (
+            results_qs.values("student__group__name")
+            .annotate(avg=Avg("grade"), count=Count("id"))
+            .order_by("student__group__name")
+        )
+        self.assertEqual(
+            [(g["name"], g["results_count"]) for g in stats["groups"]],
+            [(g["student__group__name"], g["count"]) for g in groups],
+        )
+        for got, expected in zip(stats["groups"], groups):
+            self.assertAlmostEqual(got["avg_grade"], expected["avg"])
+
+        disciplines = (
+            results_qs.values("discipline__name")
+            .annotate(avg=Avg("grade"), count=Count("id"))
+            .order_by("discipline__name")
+        )
+        self.assertEqual(
+            [(d["name"], d["results_count"]) for d in stats["disciplines"]],
+            [(d["discipline__name"], d["count"]) for d in disciplines],
+        )
+        for got, expected in zip(stats["disciplines"], disciplines):
+            self.assertAlmostEqual(got["avg_grade"], expected["avg"])
+
+        years = (
+            results_qs.values("semester__year")
+            .annotate(avg=Avg("grade"), count=Count("id"))
+            .order_by("semester__year")
+        )
+        self.assertEqual(
+            [(y["year"], y["count"]) for y in stats["years"]],
+            [(y["semester__year"], y["count"]) for y in years],
+        )
+        for got, expected in zip(stats["years"], years):
+            self.assertAlmostEqual(got["avg_grade"], expected["avg"])
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            compute_breakdowns(ResultRollup.objects.all())
+
+    def test_matches_results(self):
+        self.assert_matches_results(compute_breakdowns(ResultRollup.objects.all()), Result.objects.all())
+
+    def test_matches_filtered_results(self):
+        stats = compute_breakdowns(ResultRollup.objects.filter(semester=self.semester))
+        self.assert_matches_results(stats, Result.objects.filter(semester=self.semester))
+
+    def test_empty(self):
+        stats = compute_breakdowns(ResultRollup.objects.none())
+        self.assertEqual(stats, {"groups": [], "disciplines": [], "years": []})
+
+    def setUp(self):
+        # кэш агрегатов переживает откат транзакции между тестами
+        get_cache().clear()
+
+    def data_changed(self):
+        pass
+
+    def rollup_queries(self, url):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {"semester": self.semester.id})
+        self.assertEqual(response.status_code, 200)
+        return [q["sql"] for q in ctx.captured_queries if "analytics_resultrollup" in q["sql"]]
+
+    def test_dashboard_reads_stats_in_one_query(self):
+        # разбивки + проблемные группы + рейтинг преподавателей
+        self.assertEqual(len(self.rollup_queries(reverse("analytics:dashboard"))), 3)
+
+    def test_dashboard_query_budget_does_not_grow_with_data(self):
+        self.client.force_login(self.user)
+        url = reverse("analytics:dashboard")
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        get_cache().clear()
+        group = Group.objects.create(name="ИС-new")
+        for i in range(5):
+            student = Student.objects.create(full_name=f"Новый {i}", group=group)
+            Result.objects.create(
+                student=student, discipline=Discipline.objects.first(), semester=self.semester,
+                teacher=Teacher.objects.create(full_name=f"Новый преподаватель {i}"), grade=2,
+            )
+        self.data_changed()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+        self.assertIn("ИС-new", [row["group__name"] for row in response.context["bad_groups"]])
+
+    def test_dashboard_panels(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("analytics:dashboard"))
+
+        expected = Result.objects.values("grade").annotate(cnt=Count("id")).order_by("grade")
+        self.assertEqual(response.context["grade_dist"], list(expected))
+
+        ranking = response.context["teachers"]
+        self.assertEqual(sum(row["count"] for row in ranking), Result.objects.count())
+        self.assertEqual([row["avg_grade"] for row in ranking], sorted((row["avg_grade"] for row in ranking), reverse=True))
+        for row in ranking:
+            avg = Result.objects.filter(teacher_id=row["teacher_id"]).aggregate(a=Avg("grade"))["a"]
+            self.assertAlmostEqual(row["avg_grade"], avg)
+
+        with self.settings(ANALYTICS_AT_RISK_GRADE=10, ANALYTICS_AT_RISK_ATTENDANCE=0):
+            response = self.client.get(reverse("analytics:dashboard"))
+        self.assertEqual(len(response.context["bad_groups"]), Group.objects.count())
+        with self.settings(ANALYTICS_AT_RISK_GRADE=0, ANALYTICS_AT_RISK_ATTENDANCE=0):
+            response = self.client.get(reverse("analytics:dashboard"))
+        self.assertEqual(response.context["bad_groups"], [])
+
+    def test_export_pdf_reads_stats_in_one_query(self):
+        self.assertEqual(len(self.rollup_queries(reverse("analytics:export_pdf"))), 1)
+
+
+class ApiSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="ИС-1")
+        semester = Semester.objects.create(year=2024, term="1")
+        teacher = Teacher.objects.create(full_name="Преподаватель 1")
+        for i in range(3):
+            student = Student.objects.create(full_name=f"Студент {i}", group=group)
+            for d in range(2):
+                Result.objects.create(
+                    student=student,
+                    discipline=Discipline.objects.get_or_create(name=f"Дисциплина {d}")[0],
+                    teacher=teacher,
+                    semester=semester,
+                    grade=3 + d,
+                    attendance_percent=80,
+                )
+        cls.user = User.objects.create_superuser("manager", "manager@example.com", "pass")
+        cls.url = reverse("analytics:api_summary")
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_login(self.user)
+
+    def test_kpi_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response.json(),
+            {"kpi": {"avg_grade": 3.5, "avg_attendance": 80.0, "students": 3, "groups": 1, "disciplines": 2}},
+        )
+        data_queries = [q for q in ctx.captured_queries if "analytics_result" in q["sql"]]
+        self.assertEqual(len(data_queries), 1)
+
+    def test_not_modified_until_data_changes(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        result = Result.objects.first()
+        result.grade = 5
+        result.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_depends_on_filters(self):
+        etag = self.client.get(self.url)["ETag"]
+        other = self.client.get(self.url, {"discipline": Discipline.objects.first().id})["ETag"]
+        self.assertNotEqual(etag, other)
+
+        DataVersion.bump()
+        self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+
+    def summary_queries(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(self.url, params).status_code, 200)
+        return len([q for q in ctx.captured_queries if "analytics_result" in q["sql"]])
+
+    def test_summary_cached_per_generation_and_filters(self):
+        self.assertEqual(self.summary_queries(), 1)
+        self.assertEqual(self.summary_queries(), 0)
+        self.assertEqual(self.summary_queries(discipline=Discipline.objects.first().id), 1)
+
+        DataVersion.bump()
+        self.assertEqual(self.summary_queries(), 1)
+
+        stats = self.client.get(reverse("analytics:api_cache_stats")).json()
+        self.assertGreaterEqual(stats["by_kind"]["summary"]["hits"], 1)
+        self.assertGreaterEqual(stats["by_kind"]["summary"]["misses"], 3)
+
+
+@skipUnless(columnar.is_available(), "numpy is not installed")
+class ColumnarEngineTests(BreakdownsTests):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(ANALYTICS_ENGINE="columnar", ANALYTICS_COLUMNAR_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.generation = DataVersion.current().generation
+        columnar.build_snapshot(self.generation)
+        self.snapshot = columnar.load_snapshot(self.generation)
+
+    def data_changed(self):
+        # после импорта снимок пересобирает обработчик очереди
+        columnar.build_snapshot(DataVersion.current().generation)
+
+    def assert_same_rows(self, got, expected):
+        expected = list(expected)
+        self.assertEqual(len(got), len(expected))
+        for row, want in zip(got, expected):
+            self.assertEqual(row.keys(), want.keys())
+            for key, value in want.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(row[key], value, places=5)
+                else:
+                    self.assertEqual(row[key], value)
+
+    def test_matches_results(self):
+        scope = (None, None, None, None)
+        self.assert_matches_results(self.snapshot.breakdowns(scope), Result.objects.all())
+
+    def test_matches_filtered_results(self):
+        scope = (self.semester.id, None, None, None)
+        self.assert_matches_results(self.snapshot.breakdowns(scope), Result.objects.filter(semester=self.semester))
+
+    def test_teacher_scope(self):
+        teacher = Teacher.objects.first()
+        summary = self.snapshot.summary((None, None, None, teacher.id))
+        results = Result.objects.filter(teacher=teacher)
+        self.assertEqual(summary["students"], results.values("student_id").distinct().count())
+        self.assertEqual(summary["disciplines"], results.values("discipline_id").distinct().count())
+        self.assertAlmostEqual(summary["avg_grade"], results.aggregate(a=Avg("grade"))["a"], places=5)
+
+    def test_teacher_and_department_stats_match_orm(self):
+        Discipline.objects.filter(name__in=["Дисциплина 0", "Дисциплина 1"]).update(department="Кафедра 1")
+        Teacher.objects.filter(full_name="Преподаватель 0").update(department="Кафедра 1")
+        DataVersion.bump()
+        generation = DataVersion.current().generation
+        columnar.build_snapshot(generation)
+        snapshot = columnar.load_snapshot(generation)
+        teacher = Teacher.objects.first()
+        for scope, rollups in (
+            ((None, None, None, None), ResultRollup.objects.all()),
+            ((self.semester.id, None, None, None), ResultRollup.objects.filter(semester=self.semester)),
+            ((None, None, None, teacher.id), ResultRollup.objects.filter(teacher=teacher)),
+        ):
+            self.assert_same_rows(snapshot.teacher_stats(scope), teacher_stats(rollups))
+            self.assert_same_rows(snapshot.teacher_ranking(scope, limit=1), teacher_ranking(rollups, limit=1))
+            self.assert_same_rows(snapshot.department_stats(scope), department_stats(rollups))
+            selected = rollups.filter(discipline__department="Кафедра 1")
+            self.assert_same_rows(snapshot.discipline_stats(scope, "Кафедра 1"), discipline_stats(selected))
+            self.assert_same_rows(snapshot.teacher_stats(scope, "Кафедра 1"), teacher_stats(selected))
+
+    def test_department_and_teacher_pages_skip_rollups(self):
+        self.client.force_login(self.user)
+        for name, params in (
+            ("department_analytics", {}),
+            ("department_analytics", {"department": ""}),
+            ("teacher_analytics", {}),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse(f"analytics:{name}"), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([q for q in ctx.captured_queries if "analytics_resultrollup" in q["sql"]], name)
+        self.assertEqual(len(response.context["teachers"]), 2)
+
+    def test_worker_rebuilds_stale_snapshot(self):
+        # импорт сам снимок не пересобирает — это делает обработчик очереди
+        content = csv_file("ИС-0;Новый;Дисциплина 0;;2024;1;5;90").getvalue()
+        run_batch(create_batch(None, ContentFile(content, name="results.csv")), io.BytesIO(content))
+        generation = DataVersion.current().generation
+        self.assertNotEqual(generation, self.generation)
+        self.assertIsNone(columnar.load_snapshot(generation))
+
+        out = io.StringIO()
+        call_command("run_import_worker", "--once", stdout=out)
+        self.assertIn("Columnar snapshot rebuilt", out.getvalue())
+        self.assertEqual(columnar.load_snapshot(generation).rows, Result.objects.count())
+        self.assertFalse(columnar.refresh_snapshot())
+
+    def test_dashboard_reads_stats_in_one_query(self):
+        # сводки читают только проблемные группы
+        self.assertEqual(len(self.rollup_queries(reverse("analytics:dashboard"))), 1)
+
+    def test_export_pdf_reads_stats_in_one_query(self):
+        self.assertEqual(self.rollup_queries(reverse("analytics:export_pdf")), [])
+
+    def test_stale_snapshot_falls_back_to_orm(self):
+        DataVersion.bump()
+        self.assertIsNone(columnar.load_snapshot(DataVersion.current().generation))
+        self.assertEqual(len(self.rollup_queries(reverse("analytics:dashboard"))), 3)
+
+
+class TrendsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name="ИС-1")
+        cls.discipline = Discipline.objects.create(name="Математика")
+        teacher = Teacher.objects.create(full_name="Преподаватель 1")
+        # семестры создаются не по порядку: сортировка должна идти по (year, term)
+        semesters = [
+            Semester.objects.create(year=2024, term="1"),
+            Semester.objects.create(year=2023, term="2"),
+            Semester.objects.create(year=2023, term="1"),
+        ]
+        grades = {2024: [5, 4], 2023: [3, 3]}
+        cls.students = [Student.objects.create(full_name=f"Студент {i}", group=cls.group) for i in range(2)]
+        for semester in semesters:
+            for i, student in enumerate(cls.students):
+                grade = grades[semester.year][i] if semester.term == "1" else 4
+                Result.objects.create(
+                    student=student, discipline=cls.discipline, teacher=teacher, semester=semester,
+                    grade=grade, attendance_percent=60 + 10 * i,
+                )
+        cls.user = User.objects.create_superuser("manager", "manager@example.com", "pass")
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_login(self.user)
+
+    def test_group_series_in_one_query(self):
+        with self.assertNumQueries(1):
+            series = compute_trends("group", {"group_id": self.group.id})
+        points = series[self.group.id]
+        self.assertEqual([(p["year"], p["term"]) for p in points], [(2023, "1"), (2023, "2"), (2024, "1")])
+        self.assertEqual([p["avg_grade"] for p in points], [3.0, 4.0, 4.5])
+        self.assertEqual([p["grade_delta"] for p in points], [None, 1.0, 0.5])
+        self.assertEqual([p["attendance_delta"] for p in points], [None, 0.0, 0.0])
+
+    def test_student_series(self):
+        series = compute_trends("student", {"student__group_id": self.group.id})
+        self.assertEqual(set(series), {s.id for s in self.students})
+        self.assertEqual([p["grade_delta"] for p in series[self.students[0].id]], [None, 1.0, 1.0])
+        self.assertEqual([p["grade_delta"] for p in series[self.students[1].id]], [None, 1.0, 0.0])
+
+    def test_api_trends(self):
+        url = reverse("analytics:api_trends", args=["discipline", self.discipline.id])
+        data = self.client.get(url).json()
+        self.assertEqual(data["kind"], "discipline")
+        self.assertEqual([p["avg_grade"] for p in data["series"]], [3.0, 4.0, 4.5])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if "analytics_resultrollup" in q["sql"]])
+
+        self.assertEqual(self.client.get(reverse("analytics:api_trends", args=["teacher", 1])).status_code, 404)
+
+    def test_pages_show_trend(self):
+        response = self.client.get(reverse("analytics:group_profile", args=[self.group.id]))
+        self.assertEqual(len(response.context["trend"]), 3)
+        self.assertContains(response, "Динамика по семестрам")
+        response = self.client.get(reverse("analytics:discipline_detail", args=[self.discipline.id]))
+        self.assertEqual([p["grade_delta"] for p in response.context["trend"]], [None, 1.0, 0.5])
+
+    def test_pages_open_for_unlinked_teacher(self):
+        # динамика не ограничивается преподавателем, привязка не нужна
+        teacher_user = User.objects.create_user("teacher")
+        teacher_user.groups.create(name="Преподаватель")
+        self.client.force_login(teacher_user)
+        response = self.client.get(reverse("analytics:group_profile", args=[self.group.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["avg_grade"] for p in response.context["trend"]], [3.0, 4.0, 4.5])
+        response = self.client.get(reverse("analytics:discipline_detail", args=[self.discipline.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["trend"]), 3)
+        response = self.client.get(reverse("analytics:api_group_students", args=[self.group.id]))
+        self.assertEqual(response.status_code, 200)
+
+
+class StudentAveragesTests(TestCase):
+    KEYS = [("avg_grade", True), ("full_name", False), ("id", False)]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name="ИС-1")
+        cls.discipline = Discipline.objects.create(name="Математика")
+        cls.semester = Semester.objects.create(year=2024, term="1")
+        # одинаковые средние и студенты без оценок (NULL) — на границах страниц
+        cls.students = []
+        for i in range(30):
+            student = Student.objects.create(full_name=f"Студент {i:02d}", group=cls.group)
+            cls.students.append(student)
+            if i % 4 != 3:
+                Result.objects.create(
+                    student=student, discipline=cls.discipline, semester=cls.semester,
+                    grade=3 + i % 3, attendance_percent=70,
+                )
+        cls.user = User.objects.create_superuser("manager", "manager@example.com", "pass")
+
+    def expected_order(self, qs):
+        rows = list(qs)
+        graded = sorted((s for s in rows if s.avg_grade is not None), key=lambda s: (-s.avg_grade, s.full_name, s.id))
+        ungraded = sorted((s for s in rows if s.avg_grade is None), key=lambda s: (s.full_name, s.id))
+        return [s.id for s in graded + ungraded]
+
+    def test_maintained_by_signals(self):
+        student = self.students[0]
+        student.refresh_from_db()
+        self.assertEqual((student.results_count, student.avg_grade, student.avg_attendance), (1, 3.0, 70.0))
+
+        result = student.results.get()
+        result.grade = 5
+        result.save()
+        Result.objects.create(student=student, discipline=self.discipline, semester=self.semester, grade=4, attendance_percent=90)
+        student.refresh_from_db()
+        self.assertEqual((student.results_count, student.avg_grade, student.avg_attendance), (2, 4.5, 80.0))
+
+        for result in student.results.all():
+            result.delete()
+        student.refresh_from_db()
+        self.assertEqual((student.results_count, student.avg_grade), (0, None))
+        self.assertEqual(check_student_averages(), [])
+
+    def test_group_change_moves_rollups(self):
+        other = Group.objects.create(name="ИС-2")
+        student = self.students[0]
+        Result.objects.create(student=student, discipline=self.discipline, semester=self.semester, grade=5, attendance_percent=90)
+        generation = DataVersion.current().generation
+
+        student.refresh_from_db()
+        student.group = other
+        student.save()
+        self.assertEqual(check_rollups(), [])
+        self.assertEqual(check_student_averages(), [])
+        self.assertGreater(DataVersion.current().generation, generation)
+        rollup = ResultRollup.objects.get(group=other)
+        self.assertEqual((rollup.results_count, rollup.grade_sum), (2, 8.0))
+
+        generation = DataVersion.current().generation
+        student.full_name = "Студент 00 (перевод)"
+        student.save()
+        self.assertEqual(DataVersion.current().generation, generation)
+
+    def test_teacher_delete_merges_rollups(self):
+        teacher = Teacher.objects.create(full_name="Петров П.П.")
+        for student in self.students[:2]:
+            Result.objects.create(
+                student=student, discipline=self.discipline, teacher=teacher, semester=self.semester,
+                grade=5, attendance_percent=90,
+            )
+        teacher.delete()
+        self.assertEqual(check_rollups(), [])
+        rollup = ResultRollup.objects.get()
+        self.assertIsNone(rollup.teacher_id)
+
+        Result.objects.create(student=self.students[3], discipline=self.discipline, semester=self.semester, grade=4, attendance_percent=70)
+        self.assertEqual(ResultRollup.objects.count(), 1)
+        self.assertEqual(check_rollups(), [])
+
+    def test_renames_and_teacher_delete_bump_generation(self):
+        teacher = Teacher.objects.create(full_name="Петров П.П.")
+
+        def bumped(change):
+            generation = DataVersion.current().generation
+            change()
+            return DataVersion.current().generation > generation
+
+        self.assertFalse(bumped(Group.objects.get(pk=self.group.pk).save))
+        self.group.name = "ИС-1 (2024)"
+        self.assertTrue(bumped(self.group.save))
+        self.discipline.department = "Кафедра математики"
+        self.assertTrue(bumped(self.discipline.save))
+        teacher.full_name = "Петров П.И."
+        self.assertTrue(bumped(teacher.save))
+        self.assertTrue(bumped(teacher.delete))
+
+    def test_rebuild_bumps_generation(self):
+        # расхождение, которое чинит пересборка
+        ResultRollup.objects.update(results_count=1)
+        Student.objects.update(results_count=0)
+        generation = DataVersion.current().generation
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        self.assertEqual(check_rollups(), [])
+        self.assertGreater(DataVersion.current().generation, generation)
+
+    def test_pages_forward_and_back(self):
+        qs = self.group.students.all()
+        expected = self.expected_order(qs)
+
+        pages, after = [], None
+        while True:
+            page = keyset_page(qs, self.KEYS, after=after, per_page=5)
+            pages.append(page)
+            if not page.has_next:
+                break
+            after = page.next_cursor
+        self.assertEqual([s.id for page in pages for s in page], expected)
+        self.assertFalse(pages[0].has_previous)
+
+        back = keyset_page(qs, self.KEYS, before=pages[-1].prev_cursor, per_page=5)
+        self.assertEqual([s.id for s in back], [s.id for s in pages[-2]])
+        self.assertTrue(back.has_next)
+
+    def test_view_without_count(self):
+        self.client.force_login(self.user)
+        url = reverse("analytics:group_detail", args=[self.group.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {"q": "Студент 1"})
+        student_queries = [q["sql"] for q in ctx.captured_queries if "analytics_student" in q["sql"]]
+        self.assertEqual(len(student_queries), 1)
+        self.assertNotIn("COUNT(", student_queries[0].upper())
+        self.assertNotIn("OFFSET", student_queries[0].upper())
+        expected = self.expected_order(self.group.students.filter(full_name__icontains="Студент 1"))
+        self.assertEqual([s.id for s in response.context["page"]], expected)
+
+        response = self.client.get(url, {"after": "испорчен"})
+        self.assertEqual(len(response.context["page"]), 25)
+
+    def load_all(self, page_url, rows_url, context_name):
+        # первая страница в HTML, остальные — JSON-фрагментами по курсору
+        response = self.client.get(page_url)
+        ids = [s.id for s in response.context[context_name]]
+        html = response.content.decode()
+        cursor = response.context[context_name].next_cursor
+        while cursor:
+            data = self.client.get(rows_url, {"after": cursor}).json()
+            self.assertEqual(data["html"].count("<tr>"), data["count"])
+            html += data["html"]
+            cursor = data["next_cursor"]
+        return ids, html
+
+    def test_group_profile_loads_students_by_page(self):
+        self.client.force_login(self.user)
+        ids, html = self.load_all(
+            reverse("analytics:group_profile", args=[self.group.id]),
+            reverse("analytics:api_group_students", args=[self.group.id]),
+            "students",
+        )
+        self.assertEqual(len(ids), 25)
+        for student in self.students:
+            self.assertEqual(html.count(f">{student.full_name}<"), 1)
+
+    def test_discipline_detail_loads_students_by_page(self):
+        # студенты другой группы с теми же ФИО — тоже на страницах дисциплины
+        other = Group.objects.create(name="ИС-2")
+        for i in range(10):
+            student = Student.objects.create(full_name=f"Студент {i:02d}", group=other)
+            Result.objects.create(
+                student=student, discipline=self.discipline, semester=self.semester, grade=5, attendance_percent=90,
+            )
+        self.client.force_login(self.user)
+        page_url = reverse("analytics:discipline_detail", args=[self.discipline.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(page_url)
+        # средние по дисциплине считаются только для студентов страницы
+        averages = [q["sql"] for q in ctx.captured_queries if 'AVG("analytics_result"."grade")' in q["sql"]]
+        self.assertEqual(len(averages), 1)
+        self.assertIn(" IN (", averages[0])
+        self.assertEqual(response.context["students"].items[0].discipline_avg, 3.0)
+
+        ids, html = self.load_all(
+            page_url,
+            reverse("analytics:api_discipline_students", args=[self.discipline.id]),
+            "students",
+        )
+        self.assertEqual(len(ids), 25)
+        graded = Student.objects.filter(results__discipline=self.discipline).order_by("full_name", "id")
+        self.assertEqual(graded.count(), 33)
+        self.assertEqual(html.count('<td class="fw-semibold">Студент'), 33)
+
+
+class DepartmentAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="ИС-1")
+        cls.semester = Semester.objects.create(year=2024, term="1")
+        disciplines = [
+            Discipline.objects.create(name="Математика", department="Кафедра математики"),
+            Discipline.objects.create(name="Алгебра", department="Кафедра математики"),
+            Discipline.objects.create(name="Программирование", department="Кафедра ИТ"),
+            Discipline.objects.create(name="Физкультура"),
+        ]
+        cls.teachers = [
+            Teacher.objects.create(full_name="Иванов И. И.", department="Кафедра математики"),
+            Teacher.objects.create(full_name="Петров П. П.", department="Кафедра ИТ"),
+        ]
+        for i in range(6):
+            student = Student.objects.create(full_name=f"Студент {i}", group=group)
+            for d, discipline in enumerate(disciplines):
+                Result.objects.create(
+                    student=student, discipline=discipline, teacher=cls.teachers[d % 2], semester=cls.semester,
+                    grade=2 + (i + d) % 4, attendance_percent=60 + 5 * i,
+                )
+
+        cls.manager = User.objects.create_superuser("manager", "manager@example.com", "pass")
+        cls.head = User.objects.create_user("head", password="pass")
+        cls.head.user_permissions.add(Permission.objects.get(codename="can_view_department"))
+        cls.teacher_user = User.objects.create_user("teacher", password="pass")
+        cls.teacher_user.user_permissions.add(Permission.objects.get(codename="can_view_teacher"))
+        cls.teacher_user.groups.create(name="Преподаватель")
+        TeacherUserLink.objects.create(user=cls.teacher_user, teacher=cls.teachers[0])
+        cls.plain = User.objects.create_user("plain", password="pass")
+
+    def setUp(self):
+        get_cache().clear()
+
+    def get(self, user, name, *args, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse(f"analytics:{name}", args=args), params)
+
+    def test_permissions(self):
+        self.assertEqual(self.get(self.head, "department_analytics").status_code, 200)
+        self.assertEqual(self.get(self.head, "teacher_analytics").status_code, 403)
+        self.assertEqual(self.get(self.plain, "department_analytics").status_code, 403)
+        self.assertEqual(self.get(self.plain, "teacher_analytics").status_code, 403)
+        self.assertEqual(self.get(self.manager, "teacher_analytics").status_code, 200)
+
+        response = self.get(self.head, "home")
+        self.assertEqual((response.context["can_view_department"], response.context["can_view_teacher"]), (True, False))
+        self.assertContains(response, reverse("analytics:department_analytics"))
+        self.assertNotContains(response, reverse("analytics:teacher_analytics"))
+
+    def test_department_matches_results(self):
+        response = self.get(self.manager, "department_analytics", department="Кафедра математики")
+        expected = (
+            Result.objects.values("discipline__department")
+            .annotate(avg=Avg("grade"), count=Count("id"))
+            .order_by("discipline__department")
+        )
+        rows = response.context["departments"]
+        self.assertEqual(
+            [(r["discipline__department"], r["count"]) for r in rows],
+            [(e["discipline__department"], e["count"]) for e in expected],
+        )
+        for got, want in zip(rows, expected):
+            self.assertAlmostEqual(got["avg_grade"], want["avg"])
+        self.assertEqual([r["discipline__name"] for r in response.context["disciplines"]], ["Алгебра", "Математика"])
+        self.assertEqual(
+            [(r["teacher__full_name"], r["count"]) for r in response.context["teachers"]],
+            [("Иванов И. И.", 6), ("Петров П. П.", 6)],
+        )
+        self.assertContains(response, reverse("analytics:discipline_detail", args=[Discipline.objects.get(name="Алгебра").id]))
+
+        response = self.get(self.manager, "department_analytics", department="")
+        self.assertEqual([r["discipline__name"] for r in response.context["disciplines"]], ["Физкультура"])
+
+    def rollup_queries(self, user, name, *args, **params):
+        get_cache().clear()
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f"analytics:{name}", args=args), params)
+        self.assertEqual(response.status_code, 200)
+        return len([q for q in ctx.captured_queries if "analytics_resultrollup" in q["sql"]])
+
+    def test_fixed_query_count(self):
+        pages = [
+            (("department_analytics",), {}, 1),
+            (("department_analytics",), {"department": "Кафедра ИТ"}, 3),
+            (("teacher_analytics",), {}, 1),
+            (("teacher_analytics_detail", self.teachers[1].id), {"semester": self.semester.id}, 1),
+        ]
+        before = [self.rollup_queries(self.manager, *args, **params) for args, params, _ in pages]
+        self.assertEqual(before, [count for _, _, count in pages])
+
+        for i in range(10):
+            discipline = Discipline.objects.create(name=f"Новая {i}", department=f"Кафедра {i}")
+            Result.objects.create(
+                student=Student.objects.first(), discipline=discipline, semester=self.semester,
+                teacher=Teacher.objects.create(full_name=f"Новый {i}"), grade=4,
+            )
+        after = [self.rollup_queries(self.manager, *args, **params) for args, params, _ in pages]
+        self.assertEqual(after, before)
+
+    def test_teacher_sees_only_own_analytics(self):
+        response = self.get(self.teacher_user, "teacher_analytics")
+        self.assertEqual([r["teacher_id"] for r in response.context["teachers"]], [self.teachers[0].id])
+        response = self.get(self.teacher_user, "teacher_analytics_detail", self.teachers[0].id)
+        self.assertEqual(
+            [r["discipline__name"] for r in response.context["disciplines"]],
+            ["Математика", "Программирование"],
+        )
+        self.assertEqual(self.get(self.teacher_user, "teacher_analytics_detail", self.teachers[1].id).status_code, 403)
+
+
+class RoleQueriesTests(TestCase):
+    # роли, права и привязка к преподавателю: сколько запросов они стоят странице
+    ROLE_TABLES = (
+        "auth_group", "auth_permission", "auth_user_groups", "auth_user_user_permissions",
+        "analytics_teacheruserlink", "analytics_teacherlinkversion",
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="ИС-1")
+        discipline = Discipline.objects.create(name="Математика")
+        semester = Semester.objects.create(year=2024, term="1")
+        cls.teachers = [
+            Teacher.objects.create(full_name="Иванов И. И."),
+            Teacher.objects.create(full_name="Петров П. П."),
+        ]
+        for i in range(4):
+            Result.objects.create(
+                student=Student.objects.create(full_name=f"Студент {i}", group=group), discipline=discipline,
+                teacher=cls.teachers[i % 2], semester=semester, grade=3 + i % 3, attendance_percent=80,
+            )
+        cls.teacher_user = User.objects.create_user("teacher", password="pass")
+        cls.teacher_user.user_permissions.add(Permission.objects.get(codename="can_view_teacher"))
+        cls.teacher_user.groups.create(name="Преподаватель")
+        TeacherUserLink.objects.create(user=cls.teacher_user, teacher=cls.teachers[0])
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.force_login(self.teacher_user)
+
+    def role_queries(self, ctx):
+        return [q["sql"] for q in ctx.captured_queries if any(table in q["sql"] for table in self.ROLE_TABLES)]
+
+    def test_roles_resolved_once_per_request(self):
+        # первый запрос: группы с правами, версия и сама привязка
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("analytics:teacher_analytics"))
+        self.assertLessEqual(len(self.role_queries(ctx)), 3)
+
+        for name in ("dashboard", "teacher_analytics", "export_results", "home"):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse(f"analytics:{name}"))
+            self.assertEqual(response.status_code, 200)
+            # дальше — только группы и права (в том числе для меню в base.html) одним запросом
+            queries = self.role_queries(ctx)
+            self.assertEqual(len(queries), 1, name)
+            self.assertIn("auth_group", queries[0])
+            self.assertIn("auth_permission", queries[0])
+            if response.context is not None:
+                self.assertTrue(response.context["is_teacher"])
+                self.assertFalse(response.context["is_manager"])
+                self.assertTrue(response.context["can_view_teacher"])
+
+    def test_teacher_link_cached_between_requests(self):
+        url = reverse("analytics:teacher_analytics")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        # ни привязка, ни версия привязок из БД не читаются
+        self.assertFalse([q for q in self.role_queries(ctx) if "analytics_teacher" in q])
+        self.assertEqual([r["teacher_id"] for r in response.context["teachers"]], [self.teachers[0].id])
+
+        # смена привязки сбрасывает кэш сразу
+        link = TeacherUserLink.objects.get(user=self.teacher_user)
+        link.teacher = self.teachers[1]
+        link.save()
+        self.assertEqual(
+            [r["teacher_id"] for r in self.client.get(url).context["teachers"]], [self.teachers[1].id],
+        )
+
+    @override_settings(ANALYTICS_TEACHER_LINK_VERSION_TTL=60)
+    def test_link_change_in_other_process_seen_after_ttl(self):
+        url = reverse("analytics:teacher_analytics")
+        teachers = lambda: [r["teacher_id"] for r in self.client.get(url).context["teachers"]]
+        now = time.monotonic()
+        with mock.patch("analytics.roles.time.monotonic", return_value=now):
+            self.assertEqual(teachers(), [self.teachers[0].id])
+            # другой процесс: меняет привязку и версию в БД, сигналы здесь не срабатывают
+            TeacherUserLink.objects.filter(user=self.teacher_user).update(teacher=self.teachers[1])
+            TeacherLinkVersion.objects.filter(id=1).update(generation=F("generation") + 1)
+            self.assertEqual(teachers(), [self.teachers[0].id])
+        with mock.patch("analytics.roles.time.monotonic", return_value=now + 60):
+            self.assertEqual(teachers(), [self.teachers[1].id])
+
+    def test_export_limited_to_own_teacher(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("analytics:export_results"))
+        rows = response.content.decode().splitlines()[1:]
+        self.assertEqual(len(rows), Result.objects.filter(teacher=self.teachers[0]).count())
+        self.assertTrue(all(";Иванов И. И.;" in row for row in rows))
+        # фильтр — по id преподавателя, без чтения Teacher заранее
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith('SELECT "analytics_teacher"')])
+
+
+class UnreadNotificationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student", password="pass")
+        cls.other = User.objects.create_user("other", password="pass")
+
+    def setUp(self):
+        get_cache().clear()
+
+    def notify(self, user, **kwargs):
+        return Notification.objects.create(user=user, type=Notification.TYPE_GRADE, title="Оценка", **kwargs)
+
+    def counter(self, user):
+        return NotificationCounter.objects.filter(user=user).values_list("unread", flat=True).first() or 0
+
+    def assert_counters_exact(self):
+        for user in (self.user, self.other):
+            self.assertEqual(self.counter(user), user.notifications.filter(is_read=False).count())
+
+    def test_single_and_bulk_operations(self):
+        first = self.notify(self.user)
+        self.notify(self.user, is_read=True)
+        self.notify(self.other)
+        self.assertEqual((self.counter(self.user), self.counter(self.other)), (1, 1))
+
+        first.is_read = True
+        first.save()
+        self.assertEqual(self.counter(self.user), 0)
+
+        Notification.objects.bulk_create([
+            Notification(user=self.user, type=Notification.TYPE_REPORT, title=f"Отчёт {i}") for i in range(3)
+        ])
+        self.assertEqual(self.counter(self.user), 3)
+        Notification.objects.filter(user=self.user).update(user=self.other)
+        self.assert_counters_exact()
+        self.other.notifications.mark_read()
+        self.assert_counters_exact()
+        self.notify(self.user).delete()
+        self.assert_counters_exact()
+
+        NotificationCounter.objects.update(unread=42)
+        recount_unread()
+        self.assert_counters_exact()
+
+    def test_badge_is_cached_and_lazy(self):
+        self.notify(self.user)
+        self.notify(self.user)
+        self.client.force_login(self.user)
+        url = reverse("analytics:notifications")
+        self.assertEqual(str(self.client.get(url).context["unread_notifications"]), "2")
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        sql = [q["sql"] for q in ctx.captured_queries]
+        self.assertFalse([q for q in sql if "analytics_notificationcounter" in q])
+        self.assertFalse([q for q in sql if "COUNT(" in q.upper() and "analytics_notification" in q])
+
+        # отметка прочитанным сразу сбрасывает кэш
+        self.client.post(reverse("analytics:notifications_mark_all_read"))
+        self.assertEqual(str(self.client.get(url).context["unread_notifications"]), "0")
+
+        # пока шаблон не обратился к значению, счётчик не читается
+        get_cache().clear()
+        request = RequestFactory().get(url)
+        request.user = self.user
+        with self.assertNumQueries(0):
+            context = unread_notifications(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(str(context["unread_notifications"]), "0")
+
+
+class AuditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("manager", "manager@example.com", "pass")
+
+    def test_login_and_exports_are_audited(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("analytics:export_results"), {"semester": 7})
+        self.client.get(reverse("analytics:export_pdf"))
+        self.client.logout()
+        self.assertEqual(
+            list(AuditLog.objects.order_by("id").values_list("action", "details")),
+            [
+                ("login", "Вход в систему"),
+                ("export_csv", "Фильтры: semester=7"),
+                ("export_pdf", "Фильтры: нет"),
+                ("logout", "Выход из системы"),
+            ],
+        )
+
+
+class AuditSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_superuser("manager", "manager@example.com", "pass")
+        cls.ivan = User.objects.create_user("ivanov", password="pass")
+        AuditLog.objects.bulk_create(
+            [AuditLog(user=cls.ivan, action="export_csv", details=f"Фильтры: semester={i}") for i in range(30)]
+            + [AuditLog(user=None, action="upload", details="Импорт #1: Оценки.csv")]
+        )
+
+    def test_fts_matches_substring_ignoring_case(self):
+        qs = AuditLog.objects.select_related("user")
+        for q in ("оценки", "IVANOV", "semester=1", "нет такого"):
+            # LIKE в SQLite не сравнивает кириллицу без учёта регистра, trigram — сравнивает
+            expected = {
+                row.id for row in qs
+                if q.lower() in row.details.lower() or (row.user and q.lower() in row.user.username.lower())
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                found = set(search_audit(qs, q).values_list("id", flat=True))
+            self.assertEqual(found, expected, q)
+            self.assertIn("MATCH", ctx.captured_queries[-1]["sql"])
+        # короче триграммы — обычный LIKE
+        self.assertEqual(search_audit(qs, "#1").count(), 1)
+
+    def test_index_follows_changes(self):
+        self.ivan.username = "petrov"
+        self.ivan.save()
+        self.assertEqual(search_audit(AuditLog.objects.all(), "petrov").count(), 30)
+        self.assertEqual(search_audit(AuditLog.objects.all(), "ivanov").count(), 0)
+        AuditLog.objects.filter(action="upload").update(details="Импорт #2")
+        self.assertEqual(search_audit(AuditLog.objects.all(), "оценки").count(), 0)
+        AuditLog.objects.filter(user=self.ivan).delete()
+        self.assertEqual(search_audit(AuditLog.objects.all(), "semester").count(), 0)
+
+    def test_audit_log_pages_by_cursor(self):
+        self.client.force_login(self.manager)
+        url = reverse("analytics:audit_log")
+        expected = list(
+            AuditLog.objects.filter(user=self.ivan).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        seen, params = [], {"q": "ivanov"}
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                page = self.client.get(url, params).context["page"]
+            audit_sql = [q["sql"].upper() for q in ctx.captured_queries if "ANALYTICS_AUDITLOG" in q["sql"].upper()]
+            self.assertFalse([q for q in audit_sql if "COUNT(" in q or "OFFSET" in q])
+            seen += [row.id for row in page]
+            if not page.has_next:
+                break
+            params = {"q": "ivanov", "after": page.next_cursor}
+        self.assertEqual(seen, expected)
+
+        back = self.client.get(url, {"q": "ivanov", "before": page.prev_cursor}).context["page"]
+        self.assertEqual([row.id for row in back], expected[:25])
+        self.assertEqual(len(self.client.get(url, {"after": "bad"}).context["page"]), 25)
+
+
+class AuditSearchMigrationTests(TransactionTestCase):
+    def test_index_survives_migrating_audit_log_back_and_forth(self):
+        # 0012 и 0013 пересоздают analytics_auditlog, а auth — auth_user
+        call_command("migrate", "analytics", "0011", verbosity=0)
+        call_command("migrate", "auth", "0002", verbosity=0)
+        call_command("migrate", verbosity=0)
+        User.objects.create_user("renamed").save()
+        User.objects.filter(username="renamed").update(username="ivanov")
+        AuditLog.objects.create(action="upload", details="Импорт Оценок")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(search_audit(AuditLog.objects.all(), "оценок").count(), 1)
+        self.assertIn("MATCH", ctx.captured_queries[-1]["sql"])
+
+
+@override_settings(ANALYTICS_AUDIT_SYNC=False, ANALYTICS_AUDIT_BATCH_SIZE=3, ANALYTICS_AUDIT_FLUSH_INTERVAL=60)
+class AuditWriterTests(TransactionTestCase):
+    def entry(self, i):
+        return AuditLog(action="login", details=f"Вход {i}")
+
+    def test_flushes_by_size_in_background(self):
+        writer = AuditWriter()
+        writer.record(self.entry(0))
+        writer.record(self.entry(1))
+        self.assertEqual(AuditLog.objects.count(), 0)
+        self.assertEqual(writer.pending(), 2)
+
+        writer.record(self.entry(2))
+        deadline = time.monotonic() + 5
+        # пока поток пишет, БД не трогаем: общая in-memory база SQLite
+        # блокирует таблицы, и bulk_create мог бы отложиться на интервал
+        while writer.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        while AuditLog.objects.count() < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(sorted(AuditLog.objects.values_list("details", flat=True)), ["Вход 0", "Вход 1", "Вход 2"])
+
+    @override_settings(ANALYTICS_AUDIT_BATCH_SIZE=10)
+    def test_bad_entries_do_not_block_the_buffer(self):
+        writer = AuditWriter()
+        gone = User.objects.create_user("gone")
+        removed = User.objects.create_user("removed")
+        writer.record(AuditLog(user=gone, action="login", details="Вход gone"))
+        writer.record(AuditLog(user=removed, action="login", details="Вход removed"))
+        writer.record(self.entry(0))
+        # пользователь удалён, пока записи ждали в буфере
+        User.objects.filter(pk=gone.pk).delete()
+        removed.delete()
+
+        with self.assertLogs("analytics.audit", "WARNING"):
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list("details", "user")),
+            [("Вход 0", None), ("Вход gone", None), ("Вход removed", None)],
+        )
+
+    def test_thread_survives_flush_errors(self):
+        writer = AuditWriter()
+        flush = writer.flush
+        calls = []
+
+        def failing_flush():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("сбой")
+            return flush()
+
+        writer.flush = failing_flush
+        deadline = time.monotonic() + 5
+        with self.assertLogs("analytics.audit", "ERROR"):
+            for i in range(3):
+                writer.record(self.entry(i))
+            while not calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+        for i in range(3, 6):
+            writer.record(self.entry(i))
+        while writer.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        while AuditLog.objects.count() < 6 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(AuditLog.objects.count(), 6)
+
+    def test_explicit_flush_keeps_event_time(self):
+        writer = AuditWriter()
+        entry = self.entry(0)
+        writer.record(entry)
+        recorded_at = entry.created_at
+        time.sleep(0.01)
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(AuditLog.objects.get().created_at, recorded_at)
+        self.assertEqual(writer.flush(), 0)
 
-# Create your tests here.
@@ -0,0 +1,77 @@
+# Динамика по учебным периодам: средний балл и посещаемость группы,
+# дисциплины или студента в каждом семестре и изменение относительно
+# предыдущего семестра. Один сгруппированный запрос, упорядоченный по
+# (объект, год, семестр), и один проход с «окном» в один предыдущий период.
+from django.db.models import Count, Sum
+
+from .models import Result, ResultRollup
+
+# вид -> (откуда считать, поле объекта); студентов в сводках нет
+KINDS = {
+    "group": (ResultRollup, "group_id"),
+    "discipline": (ResultRollup, "discipline_id"),
+    "student": (Result, "student_id"),
+}
+
+
+def _totals(model):
+    if model is ResultRollup:
+        return {
+            "count": Sum("results_count"),
+            "grade_total": Sum("grade_sum"),
+            "attendance_total": Sum("attendance_sum"),
+        }
+    return {
+        "count": Count("id"),
+        "grade_total": Sum("grade"),
+        "attendance_total": Sum("attendance_percent"),
+    }
+
+
+def _delta(current, previous):
+    if current is None or previous is None:
+        return None
+    return current - previous
+
+
+def compute_trends(kind, filters=None):
+    """
+    kind — "group", "discipline" или "student"; filters — условия для
+    Result/ResultRollup (например {"group_id": 5}). Возвращает {id объекта:
+    [точки]}, точки по (year, term): year, term, count, avg_grade,
+    avg_attendance, grade_delta, attendance_delta (для первого периода
+    дельты — None).
+    """
+    model, key = KINDS[kind]
+    qs = model.objects.all()
+    if filters:
+        qs = qs.filter(**filters)
+
+    rows = (
+        qs
+        .values(key, "semester__year", "semester__term")
+        .annotate(**_totals(model))
+        .order_by(key, "semester__year", "semester__term")
+    )
+
+    series = {}
+    previous = None
+    for row in rows:
+        entity = row[key]
+        points = series.setdefault(entity, [])
+        if not points:
+            previous = None
+        count = row["count"] or 0
+        avg_grade = row["grade_total"] / count if count else None
+        avg_attendance = row["attendance_total"] / count if count else None
+        points.append({
+            "year": row["semester__year"],
+            "term": row["semester__term"],
+            "count": count,
+            "avg_grade": avg_grade,
+            "avg_attendance": avg_attendance,
+            "grade_delta": _delta(avg_grade, previous["avg_grade"] if previous else None),
+            "attendance_delta": _delta(avg_attendance, previous["avg_attendance"] if previous else None),
+        })
+        previous = points[-1]
+    return series
@@ -10,8 +10,10 @@ urlpatterns = [
 path("feedback/", views.feedback, name="feedback"),
 path("admin/imports/", views.import_batches, name="import_batches"),
 path("admin/imports/<int:batch_id>/", views.import_batch_detail, name="import_batch_detail"),
+path("admin/imports/<int:batch_id>/progress/", views.import_batch_progress, name="import_batch_progress"),
 path("notifications/", views.notifications, name="notifications"),
 path("notifications/<int:notif_id>/read/", views.notification_mark_read, name="notification_mark_read"),
+path("notifications/read-all/", views.notifications_mark_all_read, name="notifications_mark_all_read"),
 path("admin/imports/", views.import_batches, name="import_batches"),
 path("admin/imports/<int:batch_id>/", views.import_batch_detail, name="import_batch_detail"),
     # Регистрация
@@ -31,10 +33,26 @@ path("cabinet/", views.cabinet, name="cabinet"),
     # Дисциплины
     path("disciplines/<int:discipline_id>/", views.discipline_detail, name="discipline_detail"),
 
+    # Кафедры и преподаватели
+    path("departments/", views.department_analytics, name="department_analytics"),
+    path("teachers/", views.teacher_analytics, name="teacher_analytics"),
+    path("teachers/<int:teacher_id>/", views.teacher_analytics_detail, name="teacher_analytics_detail"),
+
     # Экспорт
     path("export/pdf/", views.export_pdf, name="export_pdf"),
     path("export/csv/", views.export_results, name="export_results"),
 
+    # API
+    path("api/summary/", views.api_summary, name="api_summary"),
+    path("api/cache-stats/", views.api_cache_stats, name="api_cache_stats"),
+    path("api/trends/<str:kind>/<int:entity_id>/", views.api_trends, name="api_trends"),
+    path("api/groups/<int:group_id>/students/", views.api_group_students, name="api_group_students"),
+    path(
+        "api/disciplines/<int:discipline_id>/students/",
+        views.api_discipline_students,
+        name="api_discipline_students",
+    ),
+
     # Импорт
     path("upload/", views.upload_results, name="upload_results"),
 
@@ -1,5 +1,5 @@
 import csv
-import io
+import hashlib
 import os
 
 from django.conf import settings
@@ -7,29 +7,47 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.exceptions import PermissionDenied
 from django.core.paginator import Paginator
-from django.db.models import Avg, Count, Q
+from django.db.models import Avg, Count, Exists, OuterRef, Q, Sum
 from django.http import HttpResponse, JsonResponse, Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.views.decorators.http import condition
 
 from .models import Notification
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
-from .models import ImportBatch, ImportRowError
+from .models import ImportBatch
 from .forms import ResultsUploadForm, TeacherUserLinkForm, NewsForm, FeedbackForm
+from . import audit, audit_search, columnar
+from .caching import cache_stats, cached, data_version
+from .importer import preview_file
+from .jobs import create_batch, enqueue_import, run_batch
 from .models import (
     AuditLog,
     Discipline,
     Group,
     News,
     Result,
+    ResultRollup,
     Semester,
     Student,
     Teacher,
     TeacherUserLink,
 )
-from .roles import is_manager, is_teacher
+from .pagination import keyset_page
+from .roles import get_linked_teacher_id, has_perm, is_manager, is_teacher
+from .stats import (
+    at_risk_groups,
+    compute_breakdowns,
+    department_stats,
+    discipline_stats,
+    grade_distribution,
+    teacher_ranking,
+    teacher_stats,
+)
+from .trends import KINDS as TREND_KINDS, compute_trends
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.contrib.auth.models import Group as AuthGroup
@@ -196,10 +214,10 @@ def home(request):
     total_students = Student.objects.count()
     total_groups = Group.objects.count()
 
-    kpi = Result.objects.aggregate(
-        avg_grade=Avg("grade"),
-        avg_attendance=Avg("attendance_percent"),
-        results_count=Count("id"),
+    kpi = ResultRollup.objects.aggregate(
+        avg_grade=rollup_avg("grade_sum"),
+        avg_attendance=rollup_avg("attendance_sum"),
+        results_count=Sum("results_count"),
     )
 
     context = {
@@ -220,85 +238,156 @@ def coming_soon(request):
     return render(request, "analytics/coming_soon.html")
 
 
-def get_linked_teacher(user):
-    if not user.is_authenticated:
-        return None
+def role_permission_required(perm):
+    # как permission_required(perm, raise_exception=True), но права берутся
+    # из UserRoles — тем же запросом, что и группы пользователя
+    def check(user):
+        if not has_perm(user, perm):
+            raise PermissionDenied
+        return True
+    return user_passes_test(check)
 
-    link = TeacherUserLink.objects.select_related("teacher").filter(user=user).first()
-    if link:
-        return link.teacher
 
-    full_name = (user.get_full_name() or "").strip()
-    if not full_name:
+def own_teacher_id(request):
+    # id преподавателя, которым ограничен пользователь без роли руководителя
+    # (None — без ограничения); берётся из кэша привязок, Teacher не читается
+    if not is_teacher(request.user) or is_manager(request.user):
         return None
-    return Teacher.objects.filter(full_name=full_name).first()
+    teacher_id = get_linked_teacher_id(request.user)
+    if not teacher_id:
+        raise PermissionDenied("Профиль преподавателя не привязан к учетной записи.")
+    return teacher_id
 
 
-def enforce_teacher_scope(request, qs):
-    if is_teacher(request.user) and not is_manager(request.user):
-        t = get_linked_teacher(request.user)
-        if not t:
-            raise PermissionDenied("Профиль преподавателя не привязан к учетной записи.")
-        return qs.filter(teacher=t)
-    return qs
+def rollup_avg(field, prefix=""):
+    # среднее по сводкам ResultRollup: сумма / число оценок
+    return Sum(f"{prefix}{field}") / Sum(f"{prefix}results_count")
 
 
-@login_required
-def dashboard(request):
+def request_scope(request):
+    # всё, от чего зависят агрегаты: фильтры semester/discipline/teacher из GET
+    # и преподаватель, которым ограничен пользователь без роли руководителя
     semester_id = request.GET.get("semester")
     discipline_id = request.GET.get("discipline")
     teacher_id = request.GET.get("teacher")
+    manager = is_manager(request.user)
 
-    results_qs = enforce_teacher_scope(
-        request,
-        Result.objects.select_related("student", "student__group", "discipline", "teacher", "semester")
+    return (
+        int(semester_id) if semester_id else None,
+        int(discipline_id) if discipline_id else None,
+        int(teacher_id) if teacher_id and manager else None,
+        own_teacher_id(request),
     )
 
+
+def filter_scope(qs, scope):
+    # подходит и для Result, и для ResultRollup
+    semester_id, discipline_id, teacher_id, own_teacher_id = scope
+    if own_teacher_id:
+        qs = qs.filter(teacher_id=own_teacher_id)
     if semester_id:
-        results_qs = results_qs.filter(semester_id=int(semester_id))
+        qs = qs.filter(semester_id=semester_id)
     if discipline_id:
-        results_qs = results_qs.filter(discipline_id=int(discipline_id))
-    if teacher_id and is_manager(request.user):
-        results_qs = results_qs.filter(teacher_id=int(teacher_id))
+        qs = qs.filter(discipline_id=discipline_id)
+    if teacher_id:
+        qs = qs.filter(teacher_id=teacher_id)
+    return qs
 
-    # ИСПРАВЛЕНО: students__results вместо student__results
-    groups_stats = (
-        Group.objects
-        .filter(students__results__in=results_qs)
-        .annotate(
-            avg_grade=Avg("students__results__grade"),
-            results_count=Count("students__results"),
-        )
-        .order_by("name")
-        .distinct()
-    )
 
-    disciplines_stats = (
-        Discipline.objects
-        .filter(results__in=results_qs)
-        .annotate(
-            avg_grade=Avg("results__grade"),
-            results_count=Count("results"),
+def columnar_snapshot(request):
+    # снимок NumPy, если включён ANALYTICS_ENGINE = "columnar" и он актуален
+    if not columnar.is_enabled():
+        return None
+    return columnar.load_snapshot(data_version(request).generation)
+
+
+def scoped_breakdowns(request):
+    scope = request_scope(request)
+
+    def compute():
+        snapshot = columnar_snapshot(request)
+        if snapshot is not None:
+            return snapshot.breakdowns(scope)
+        return compute_breakdowns(filter_scope(ResultRollup.objects.all(), scope))
+
+    return cached("breakdowns", request, scope, compute)
+
+
+def scoped_trends(request, kind, **filters):
+    # динамика считается по всем семестрам и, как остальные данные страниц
+    # группы и дисциплины, без фильтров и ограничения преподавателя
+    scope = (kind, tuple(sorted(filters.items())))
+    return cached("trends", request, scope, lambda: compute_trends(kind, filters))
+
+
+def scoped_summary(request):
+    # все показатели — одним агрегирующим запросом; уникальных студентов
+    # в сводках нет, поэтому считаем по Result
+    scope = request_scope(request)
+
+    def compute():
+        snapshot = columnar_snapshot(request)
+        if snapshot is not None:
+            return snapshot.summary(scope)
+        return filter_scope(Result.objects.all(), scope).aggregate(
+            avg_grade=Avg("grade"),
+            avg_attendance=Avg("attendance_percent"),
+            results_count=Count("id"),
+            students=Count("student_id", distinct=True),
+            groups=Count("student__group_id", distinct=True),
+            disciplines=Count("discipline_id", distinct=True),
         )
-        .order_by("name")
-        .distinct()
-    )
 
-    year_stats = (
-        results_qs
-        .values("semester__year")
-        .annotate(avg_grade=Avg("grade"), count=Count("id"))
-        .order_by("semester__year")
-    )
+    return cached("summary", request, scope, compute)
+
+
+def scoped_panels(request):
+    # гистограмма оценок, проблемные группы и рейтинг преподавателей для дашборда
+    scope = request_scope(request)
+    grade_below = getattr(settings, "ANALYTICS_AT_RISK_GRADE", 3.5)
+    attendance_below = getattr(settings, "ANALYTICS_AT_RISK_ATTENDANCE", 70)
+
+    def compute():
+        rollups_qs = filter_scope(ResultRollup.objects.all(), scope)
+        ranking_limit = getattr(settings, "ANALYTICS_TEACHER_RANKING_LIMIT", 20)
+        snapshot = columnar_snapshot(request)
+        return {
+            "grade_dist": grade_distribution(filter_scope(Result.objects.all(), scope)),
+            "bad_groups": at_risk_groups(
+                rollups_qs, grade_below, attendance_below,
+                limit=getattr(settings, "ANALYTICS_AT_RISK_LIMIT", 10),
+            ),
+            "teachers": (
+                snapshot.teacher_ranking(scope, limit=ranking_limit) if snapshot is not None
+                else teacher_ranking(rollups_qs, limit=ranking_limit)
+            ),
+            "at_risk_grade": grade_below,
+            "at_risk_attendance": attendance_below,
+        }
+
+    # пороги входят в ключ: после их изменения старые панели не читаются
+    return cached("panels", request, scope + (grade_below, attendance_below), compute)
+
+
+@login_required
+def dashboard(request):
+    semester_id = request.GET.get("semester")
+    discipline_id = request.GET.get("discipline")
+    teacher_id = request.GET.get("teacher")
+
+    stats = scoped_breakdowns(request)
+    panels = scoped_panels(request)
 
     semesters = Semester.objects.all().order_by("-year", "term")
     disciplines_all = Discipline.objects.all().order_by("name")
     teachers_all = Teacher.objects.all().order_by("full_name")
 
     context = {
-        "groups_stats": groups_stats,
-        "disciplines_stats": disciplines_stats,
-        "year_stats": year_stats,
+        "groups_stats": stats["groups"],
+        "disciplines_stats": stats["disciplines"],
+        "year_stats": stats["years"],
+        "kpi": scoped_summary(request),
+        **panels,
         "semesters": semesters,
         "disciplines_all": disciplines_all,
         "teachers_all": teachers_all,
@@ -311,114 +400,259 @@ def dashboard(request):
     return render(request, "analytics/dashboard.html", context)
 
 
+def scoped_departments(request, department=None):
+    # кафедры и, если выбрана кафедра, её дисциплины и преподаватели —
+    # по одному сгруппированному запросу к сводкам на таблицу
+    scope = request_scope(request)
+
+    def compute():
+        snapshot = columnar_snapshot(request)
+        if snapshot is not None:
+            data = {"departments": snapshot.department_stats(scope)}
+            if department is not None:
+                data["disciplines"] = snapshot.discipline_stats(scope, department)
+                data["teachers"] = snapshot.teacher_stats(scope, department)
+            return data
+
+        rollups_qs = filter_scope(ResultRollup.objects.all(), scope)
+        data = {"departments": department_stats(rollups_qs)}
+        if department is not None:
+            selected = rollups_qs.filter(discipline__department=department)
+            data["disciplines"] = discipline_stats(selected)
+            data["teachers"] = teacher_stats(selected)
+        return data
+
+    return cached("departments", request, scope + (department,), compute)
+
+
+def scoped_teachers(request):
+    scope = request_scope(request)
+
+    def compute():
+        snapshot = columnar_snapshot(request)
+        if snapshot is not None:
+            return snapshot.teacher_stats(scope)
+        return teacher_stats(filter_scope(ResultRollup.objects.all(), scope))
+
+    return cached("teachers", request, scope, compute)
+
+
 @login_required
-def group_detail(request, group_id):
-    group = get_object_or_404(Group, id=group_id)
+@role_permission_required("analytics.can_view_department")
+def department_analytics(request):
+    # ?department= — детализация; пустое значение — дисциплины без кафедры
+    department = request.GET.get("department")
+    semester_id = request.GET.get("semester")
+    return render(request, "analytics/department_analytics.html", {
+        **scoped_departments(request, department),
+        "department": department,
+        "semesters": Semester.objects.all().order_by("-year", "term"),
+        "selected_semester_id": int(semester_id) if semester_id else None,
+    })
 
-    students_stats = (
-        group.students
-        .annotate(avg_grade=Avg("results__grade"))
-        .order_by("-avg_grade", "full_name")
+
+@login_required
+@role_permission_required("analytics.can_view_teacher")
+def teacher_analytics(request):
+    # преподаватель без роли руководителя видит только себя (request_scope)
+    semester_id = request.GET.get("semester")
+    return render(request, "analytics/teacher_analytics.html", {
+        "teachers": scoped_teachers(request),
+        "semesters": Semester.objects.all().order_by("-year", "term"),
+        "selected_semester_id": int(semester_id) if semester_id else None,
+    })
+
+
+@login_required
+@role_permission_required("analytics.can_view_teacher")
+def teacher_analytics_detail(request, teacher_id):
+    teacher = get_object_or_404(Teacher, id=teacher_id)
+    scope = request_scope(request)
+    if scope[3] and scope[3] != teacher.id:
+        raise PermissionDenied("Нет доступа к аналитике другого преподавателя.")
+    semester_id = request.GET.get("semester")
+    disciplines = cached(
+        "teacher_disciplines", request, scope + (teacher.id,),
+        lambda: discipline_stats(filter_scope(ResultRollup.objects.filter(teacher=teacher), scope)),
     )
+    return render(request, "analytics/teacher_analytics_detail.html", {
+        "teacher": teacher,
+        "disciplines": disciplines,
+        "semesters": Semester.objects.all().order_by("-year", "term"),
+        "selected_semester_id": int(semester_id) if semester_id else None,
+    })
+
+
+# сортировка студентов группы по сохранённому среднему (индекс student_group_avg_idx)
+GROUP_STUDENT_KEYS = [("avg_grade", True), ("full_name", False), ("id", False)]
+DISCIPLINE_STUDENT_KEYS = [("full_name", False), ("id", False)]
+
 
+@login_required
+def group_detail(request, group_id):
+    group = get_object_or_404(Group, id=group_id)
+
+    # средние хранятся в Student и поддерживаются импортом и сигналами,
+    # страницы — по курсору на индексе (group, avg_grade, full_name, id)
+    students = group.students.all()
     q = (request.GET.get("q") or "").strip()
     if q:
-        students_stats = students_stats.filter(full_name__icontains=q)
+        students = students.filter(full_name__icontains=q)
 
-    paginator = Paginator(students_stats, 25)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    page = keyset_page(
+        students,
+        GROUP_STUDENT_KEYS,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
 
     return render(request, "analytics/group_detail.html", {
         "group": group,
-        "page_obj": page_obj,
+        "page": page,
         "q": q,
     })
 
 
+def group_students_page(request, group):
+    page = keyset_page(group.students.all(), GROUP_STUDENT_KEYS, after=request.GET.get("after"))
+    # последняя точка динамики — одним запросом на страницу, а не на всю группу
+    student_trends = scoped_trends(request, "student", student_id__in=tuple(s.id for s in page))
+    for s in page:
+        points = student_trends.get(s.id)
+        s.last_trend = points[-1] if points else None
+    return page
+
+
+def discipline_students_page(request, discipline):
+    # страница студентов по имени, затем средние только для неё:
+    # группировка по всем оценкам дисциплины не нужна
+    students = Student.objects.filter(
+        Exists(Result.objects.filter(student=OuterRef("pk"), discipline=discipline))
+    )
+    page = keyset_page(students, DISCIPLINE_STUDENT_KEYS, after=request.GET.get("after"))
+    averages = dict(
+        Result.objects
+        .filter(discipline=discipline, student_id__in=[s.id for s in page])
+        .values("student_id")
+        .annotate(avg=Avg("grade"))
+        .values_list("student_id", "avg")
+        .order_by()
+    )
+    for s in page:
+        s.discipline_avg = averages.get(s.id)
+    return page
+
+
+def rows_response(request, template, page):
+    # фрагмент строк таблицы для подгрузки «Показать ещё»
+    return JsonResponse({
+        "html": render_to_string(template, {"students": page}, request=request),
+        "count": len(page),
+        "next_cursor": page.next_cursor,
+    }, json_dumps_params={"ensure_ascii": False})
+
+
 @login_required
 def group_profile(request, group_id):
     group = get_object_or_404(Group, id=group_id)
 
     discipline_stats = (
-        Discipline.objects
-        .filter(results__student__group=group)
-        .annotate(
-            avg_grade=Avg("results__grade"),
-            results_count=Count("results"),
-        )
-        .order_by("name")
-        .distinct()
-    )
-
-    students_stats = (
-        group.students
-        .annotate(avg_grade=Avg("results__grade"))
-        .order_by("-avg_grade", "full_name")
+        ResultRollup.objects
+        .filter(group=group)
+        .values("discipline_id", "discipline__name")
+        .annotate(avg_grade=Sum("grade_sum") / Sum("results_count"))
+        .order_by("discipline__name")
     )
 
     return render(request, "analytics/group_profile.html", {
         "group": group,
         "discipline_stats": discipline_stats,
-        "students_stats": students_stats,
+        "students": group_students_page(request, group),
+        "trend": scoped_trends(request, "group", group_id=group.id).get(group.id, []),
     })
 
 
+@login_required
+def api_group_students(request, group_id):
+    group = get_object_or_404(Group, id=group_id)
+    return rows_response(request, "analytics/group_student_rows.html", group_students_page(request, group))
+
+
 @login_required
 def discipline_detail(request, discipline_id):
     discipline = get_object_or_404(Discipline, id=discipline_id)
 
     groups_stats = (
-        Group.objects
-        .filter(students__results__discipline=discipline)
-        .annotate(
-            avg_grade=Avg("students__results__grade"),
-            results_count=Count("students__results"),
-        )
-        .order_by("name")
-        .distinct()
-    )
-
-    students_stats = (
-        Student.objects
-        .filter(results__discipline=discipline)
-        .annotate(avg_grade=Avg("results__grade"))
-        .order_by("-avg_grade", "full_name")
+        ResultRollup.objects
+        .filter(discipline=discipline)
+        .values("group_id", "group__name")
+        .annotate(count=Sum("results_count"), avg_grade=Sum("grade_sum") / Sum("results_count"))
+        .order_by("group__name")
     )
 
     return render(request, "analytics/discipline_detail.html", {
         "discipline": discipline,
         "groups_stats": groups_stats,
-        "students_stats": students_stats,
+        "students": discipline_students_page(request, discipline),
+        "trend": scoped_trends(request, "discipline", discipline_id=discipline.id).get(discipline.id, []),
     })
 
 
 @login_required
-def api_summary(request):
-    semester_id = request.GET.get("semester")
-    discipline_id = request.GET.get("discipline")
-    teacher_id = request.GET.get("teacher")
+def api_discipline_students(request, discipline_id):
+    discipline = get_object_or_404(Discipline, id=discipline_id)
+    return rows_response(
+        request, "analytics/discipline_student_rows.html", discipline_students_page(request, discipline),
+    )
 
-    qs = enforce_teacher_scope(request, Result.objects.all())
 
-    if semester_id:
-        qs = qs.filter(semester_id=int(semester_id))
-    if discipline_id:
-        qs = qs.filter(discipline_id=int(discipline_id))
-    if teacher_id and is_manager(request.user):
-        qs = qs.filter(teacher_id=int(teacher_id))
+@login_required
+def api_trends(request, kind, entity_id):
+    # ряды динамики для графиков: kind — group, discipline или student
+    if kind not in TREND_KINDS:
+        raise Http404("Неизвестный вид динамики")
+    field = TREND_KINDS[kind][1]
+    series = scoped_trends(request, kind, **{field: entity_id}).get(entity_id, [])
+    return JsonResponse(
+        {"kind": kind, "id": entity_id, "series": series},
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+def api_summary_etag(request):
+    # ответ зависит от поколения данных, фильтров и области видимости преподавателя
+    scope = hashlib.md5(repr(request_scope(request)).encode("utf-8")).hexdigest()[:12]
+    return f"{data_version(request).generation}-{scope}"
+
+
+def api_summary_last_modified(request):
+    return data_version(request).updated_at
+
+
+@login_required
+@condition(etag_func=api_summary_etag, last_modified_func=api_summary_last_modified)
+def api_summary(request):
+    kpi = scoped_summary(request)
 
     data = {
         "kpi": {
-            "avg_grade": qs.aggregate(a=Avg("grade"))["a"] or 0,
-            "avg_attendance": qs.aggregate(a=Avg("attendance_percent"))["a"] or 0,
-            "students": Student.objects.filter(results__in=qs).distinct().count(),
-            "groups": Group.objects.filter(students__results__in=qs).distinct().count(),
-            "disciplines": Discipline.objects.filter(results__in=qs).distinct().count(),
+            "avg_grade": kpi["avg_grade"] or 0,
+            "avg_attendance": kpi["avg_attendance"] or 0,
+            "students": kpi["students"],
+            "groups": kpi["groups"],
+            "disciplines": kpi["disciplines"],
         }
     }
     return JsonResponse(data, json_dumps_params={"ensure_ascii": False})
 
 
+@login_required
+@user_passes_test(is_manager)
+def api_cache_stats(request):
+    # попадания и промахи кэша агрегатов в текущем процессе
+    return JsonResponse(cache_stats())
+
+
 @login_required
 @user_passes_test(is_manager)
 def upload_results(request):
@@ -427,63 +661,30 @@ def upload_results(request):
         if form.is_valid():
             file = form.cleaned_data["file"]
             try:
-                decoded_file = file.read().decode("utf-8")
-                io_string = io.StringIO(decoded_file)
-                reader = csv.DictReader(io_string, delimiter=";")
-                batch = ImportBatch.objects.create(
-                    user=request.user if request.user.is_authenticated else None,
-                    file_name=getattr(file, "name", "upload.csv"),
-                )
-                total = created = updated = errors = 0
-
-                for idx, row in enumerate(reader, start=1):
-                    total += 1
-                    try:
-                        group_name = row["group"]
-                        student_name = row["student"]
-                        discipline_name = row["discipline"]
-                        teacher_name = row.get("teacher", "")
-                        semester_year = int(row["year"])
-                        semester_term = row["term"]
-                        grade = float(row["grade"])
-                        attendance = float(row.get("attendance", 0) or 0)
-
-                        group, _ = Group.objects.get_or_create(name=group_name)
-                        student, _ = Student.objects.get_or_create(full_name=student_name, group=group)
-                        discipline, _ = Discipline.objects.get_or_create(name=discipline_name)
-
-                        teacher = None
-                        if teacher_name:
-                            teacher, _ = Teacher.objects.get_or_create(full_name=teacher_name)
-
-                        semester, _ = Semester.objects.get_or_create(year=semester_year, term=semester_term)
-
-                        # вместо Result.objects.create — делаем update_or_create, чтобы не плодить дубли
-                        obj, was_created = Result.objects.update_or_create(
-                            student=student,
-                            discipline=discipline,
-                            teacher=teacher,
-                            semester=semester,
-                            defaults={"grade": grade, "attendance_percent": attendance},
-                        )
-                        if was_created:
-                            created += 1
-                        else:
-                            updated += 1
-
-                    except Exception as e:
-                        errors += 1
-                        ImportRowError.objects.create(
-                            batch=batch,
-                            row_number=idx,
-                            raw_row=str(row),
-                            error=str(e),
-                        )
-                batch.total_rows = total
-                batch.created_results = created
-                batch.updated_results = updated
-                batch.error_rows = errors
-                batch.save(update_fields=["total_rows", "created_results", "updated_results", "error_rows"])
+                if form.cleaned_data.get("preview"):
+                    report, preview_rows = preview_file(file)
+                    return render(request, "analytics/upload_results.html", {
+                        "form": form,
+                        "report": report,
+                        "preview_rows": preview_rows,
+                        "errors": [f"Строка {n}: {e}" for n, e in report.error_samples],
+                    })
+
+                batch = create_batch(request.user, file, force=form.cleaned_data.get("force"))
+                audit.record(request.user, "upload", f"Импорт #{batch.id}: {batch.file_name}")
+                if batch.status == ImportBatch.STATUS_SKIPPED:
+                    messages.info(
+                        request,
+                        f"Этот файл уже был загружен (импорт #{batch.duplicate_of_id}), повторный импорт пропущен.",
+                    )
+                    return redirect("analytics:import_batch_detail", batch_id=batch.id)
+
+                if form.cleaned_data.get("background"):
+                    enqueue_import(batch, file)
+                    messages.info(request, "Файл поставлен в очередь на импорт.")
+                    return redirect("analytics:import_batch_detail", batch_id=batch.id)
+
+                run_batch(batch, file)
                 messages.success(request, "Данные успешно загружены.")
                 return redirect("analytics:dashboard")
 
@@ -504,7 +705,41 @@ def import_batches(request):
 @user_passes_test(is_manager)
 def import_batch_detail(request, batch_id):
     batch = get_object_or_404(ImportBatch, id=batch_id)
-    return render(request, "analytics/admin/import_batch_detail.html", {"batch": batch})
+
+    error_summary = sorted(batch.error_summary.items(), key=lambda item: -item[1])
+    paginator = Paginator(batch.errors.all(), 50)
+    errors_page = paginator.get_page(request.GET.get("page"))
+
+    return render(request, "analytics/admin/import_batch_detail.html", {
+        "batch": batch,
+        "error_summary": error_summary,
+        "errors_page": errors_page,
+    })
+
+
+@login_required
+@user_passes_test(is_manager)
+def import_batch_progress(request, batch_id):
+    batch = get_object_or_404(
+        ImportBatch.objects.only(
+            "id", "status", "processed_rows", "total_rows", "created_results",
+            "updated_results", "unchanged_results", "error_rows", "failure",
+        ),
+        id=batch_id,
+    )
+    return JsonResponse({
+        "id": batch.id,
+        "status": batch.status,
+        "status_display": batch.get_status_display(),
+        "finished": batch.is_finished,
+        "processed_rows": batch.processed_rows,
+        "total_rows": batch.total_rows,
+        "created_results": batch.created_results,
+        "updated_results": batch.updated_results,
+        "unchanged_results": batch.unchanged_results,
+        "error_rows": batch.error_rows,
+        "failure": batch.failure,
+    }, json_dumps_params={"ensure_ascii": False})
 @login_required
 def notifications(request):
     qs = request.user.notifications.all()
@@ -517,23 +752,34 @@ def notification_mark_read(request, notif_id):
     n.save(update_fields=["is_read"])
     return redirect("analytics:notifications")
 
+@login_required
+def notifications_mark_all_read(request):
+    if request.method == "POST":
+        request.user.notifications.mark_read()
+    return redirect("analytics:notifications")
+
 @login_required
 @user_passes_test(is_manager)
 def audit_log(request):
     q = (request.GET.get("q") or "").strip()
     action = (request.GET.get("action") or "").strip()
 
-    qs = AuditLog.objects.select_related("user").order_by("-created_at", "-id")
+    qs = AuditLog.objects.select_related("user")
     if action:
         qs = qs.filter(action=action)
     if q:
-        qs = qs.filter(details__icontains=q) | qs.filter(user__username__icontains=q)
-
-    paginator = Paginator(qs, 25)
-    page_obj = paginator.get_page(request.GET.get("page"))
+        qs = audit_search.search(qs, q)
+
+    # без COUNT и OFFSET: курсор по (created_at, id), индексы auditlog_*_idx
+    page = keyset_page(
+        qs,
+        [("created_at", True), ("id", True)],
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
 
     return render(request, "analytics/audit_log.html", {
-        "page_obj": page_obj,
+        "page": page,
         "actions": AuditLog.ACTION_CHOICES,
         "selected_action": action,
         "q": q,
@@ -567,23 +813,23 @@ def teacher_link_delete(request, link_id):
     return render(request, "analytics/teacher_link_delete.html", {"link": link})
 
 
+def export_details(scope):
+    semester_id, discipline_id, teacher_id, own_teacher_id = scope
+    filters = {
+        "semester": semester_id, "discipline": discipline_id, "teacher": teacher_id or own_teacher_id,
+    }
+    return "Фильтры: " + (", ".join(f"{k}={v}" for k, v in filters.items() if v) or "нет")
+
+
 @login_required
 def export_results(request):
-    semester_id = request.GET.get("semester")
-    discipline_id = request.GET.get("discipline")
-    teacher_id = request.GET.get("teacher")
-
-    qs = enforce_teacher_scope(
-        request,
-        Result.objects.select_related("student", "student__group", "discipline", "teacher", "semester")
+    # ограничение преподавателя и фильтры — условия на id (индекс result_teacher_sem_idx)
+    scope = request_scope(request)
+    qs = filter_scope(
+        Result.objects.select_related("student", "student__group", "discipline", "teacher", "semester"),
+        scope,
     )
-
-    if semester_id:
-        qs = qs.filter(semester_id=int(semester_id))
-    if discipline_id:
-        qs = qs.filter(discipline_id=int(discipline_id))
-    if teacher_id and is_manager(request.user):
-        qs = qs.filter(teacher_id=int(teacher_id))
+    audit.record(request.user, "export_csv", export_details(scope))
 
     response = HttpResponse(content_type="text/csv")
     response["Content-Disposition"] = 'attachment; filename="results_export.csv"'
@@ -608,40 +854,8 @@ def export_results(request):
 
 @login_required
 def export_pdf(request):
-    semester_id = request.GET.get("semester")
-    discipline_id = request.GET.get("discipline")
-    teacher_id = request.GET.get("teacher")
-
-    results_qs = enforce_teacher_scope(request, Result.objects.all())
-
-    if semester_id:
-        results_qs = results_qs.filter(semester_id=int(semester_id))
-    if discipline_id:
-        results_qs = results_qs.filter(discipline_id=int(discipline_id))
-    if teacher_id and is_manager(request.user):
-        results_qs = results_qs.filter(teacher_id=int(teacher_id))
-
-    groups_stats = (
-        Group.objects
-        .filter(students__results__in=results_qs)
-        .annotate(avg_grade=Avg("students__results__grade"), results_count=Count("students__results"))
-        .order_by("name")
-        .distinct()
-    )
-
-    disciplines_stats = (
-        Discipline.objects
-        .filter(results__in=results_qs)
-        .annotate(avg_grade=Avg("results__grade"), results_count=Count("results"))
-        .order_by("name")
-        .distinct()
-    )
-
-    year_stats = (
-        results_qs.values("semester__year")
-        .annotate(avg_grade=Avg("grade"), count=Count("id"))
-        .order_by("semester__year")
-    )
+    stats = scoped_breakdowns(request)
+    audit.record(request.user, "export_pdf", export_details(request_scope(request)))
 
     font_path = os.path.join(settings.BASE_DIR, "analytics", "fonts", "DejaVuSans.ttf")
     base_font = "Helvetica"
@@ -667,8 +881,8 @@ def export_pdf(request):
 
     p.drawString(50, y, "Динамика среднего балла по годам:")
     y -= 15
-    for row in year_stats:
-        p.drawString(60, y, f"Год {row['semester__year']}: средний балл {row['avg_grade']:.2f} (записей: {row['count']})")
+    for row in stats["years"]:
+        p.drawString(60, y, f"Год {row['year']}: средний балл {row['avg_grade']:.2f} (записей: {row['count']})")
         y -= 12
         if y < 80:
             p.showPage()
@@ -678,8 +892,8 @@ def export_pdf(request):
     y -= 10
     p.drawString(50, y, "Средний балл по группам:")
     y -= 15
-    for g in groups_stats:
-        p.drawString(60, y, f"Группа {g.name}: {(g.avg_grade or 0):.2f} (оценок: {g.results_count})")
+    for g in stats["groups"]:
+        p.drawString(60, y, f"Группа {g['name']}: {(g['avg_grade'] or 0):.2f} (оценок: {g['results_count']})")
         y -= 12
         if y < 80:
             p.showPage()
@@ -689,8 +903,8 @@ def export_pdf(request):
     y -= 10
     p.drawString(50, y, "Средний балл по дисциплинам:")
     y -= 15
-    for d in disciplines_stats:
-        p.drawString(60, y, f"{d.name}: {(d.avg_grade or 0):.2f} (оценок: {d.results_count})")
+    for d in stats["disciplines"]:
+        p.drawString(60, y, f"{d['name']}: {(d['avg_grade'] or 0):.2f} (оценок: {d['results_count']})")
         y -= 12
         if y < 80:
             p.showPage()
@@ -74,11 +74,67 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "analytics.context_processors.role_flags",
-                "analytics.context_processors.role_context",
             ],
         },
     },
 ]
+# Импорт CSV: сколько строк записывается в БД одной пачкой
+ANALYTICS_IMPORT_BATCH_SIZE = 2000
+# Импорт CSV: число процессов для разбора и проверки строк (1 — без пула)
+ANALYTICS_IMPORT_WORKERS = 1
+# Импорт CSV: сколько ошибочных строк сохранять целиком на одну партию
+ANALYTICS_IMPORT_MAX_STORED_ERRORS = 1000
+# Импорт CSV: каталог файлов, ждущих фонового импорта (не внутри MEDIA_ROOT)
+ANALYTICS_IMPORT_DIR = BASE_DIR / "var" / "imports"
+# Фоновый импорт: партия без прогресса дольше стольких секунд считается
+# брошенной упавшим воркером и возвращается в очередь (до MAX_ATTEMPTS раз)
+ANALYTICS_IMPORT_STALE_AFTER = 600
+ANALYTICS_IMPORT_MAX_ATTEMPTS = 3
+
+# Кэш посчитанных агрегатов аналитики: ключи привязаны к поколению данных,
+# устаревшие записи вытесняются по MAX_ENTRIES. Для нескольких процессов
+# можно взять FileBasedCache или общий бэкенд (Redis, Memcached).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "analytics": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "analytics",
+        "TIMEOUT": 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+ANALYTICS_CACHE_ALIAS = "analytics"
+# Сколько секунд кэшируется счётчик непрочитанных уведомлений; изменения
+# сбрасывают его сразу, срок нужен для других процессов при LocMemCache
+ANALYTICS_UNREAD_CACHE_TIMEOUT = 300
+# Сколько секунд кэшируется привязка пользователя к преподавателю
+ANALYTICS_TEACHER_LINK_CACHE_TIMEOUT = 300
+# Как часто (сек) процесс перечитывает из БД версию привязок: столько
+# другие процессы могут показывать прежнюю привязку после её смены
+ANALYTICS_TEACHER_LINK_VERSION_TTL = 10
+
+# Журнал действий пишется пачками из фонового потока: при накоплении
+# ANALYTICS_AUDIT_BATCH_SIZE записей или раз в ANALYTICS_AUDIT_FLUSH_INTERVAL
+# секунд. ANALYTICS_AUDIT_SYNC = True — синхронно, в текущей транзакции
+# (тесты analytics включают его сами).
+ANALYTICS_AUDIT_SYNC = False
+ANALYTICS_AUDIT_BATCH_SIZE = 500
+ANALYTICS_AUDIT_FLUSH_INTERVAL = 2.0
+
+# Движок агрегатов dashboard/api_summary/export_pdf: "orm" или "columnar"
+# (NumPy-снимок Result в ANALYTICS_COLUMNAR_DIR, нужен установленный numpy)
+ANALYTICS_ENGINE = "orm"
+ANALYTICS_COLUMNAR_DIR = BASE_DIR / "var" / "columnar"
+
+# Дашборд: пороги «проблемных» групп (средний балл / посещаемость, %)
+# и сколько групп и преподавателей показывать
+ANALYTICS_AT_RISK_GRADE = 3.5
+ANALYTICS_AT_RISK_ATTENDANCE = 70
+ANALYTICS_AT_RISK_LIMIT = 10
+ANALYTICS_TEACHER_RANKING_LIMIT = 20
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
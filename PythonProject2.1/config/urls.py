@@ -4,9 +4,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
+    # analytics идёт первым: его страницы admin/imports/ и admin/news/
+    # иначе перехватывает стандартная админка
+    path("", include(("analytics.urls", "analytics"), namespace="analytics")),
     path("admin/", admin.site.urls),
     path("accounts/", include("django.contrib.auth.urls")),  # ✅ добавь это
-    path("", include(("analytics.urls", "analytics"), namespace="analytics")),
 ]
 
 if settings.DEBUG: